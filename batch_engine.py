@@ -0,0 +1,371 @@
+import io
+import os
+import time
+import shutil
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from corpus_index import CorpusIndex
+from font_manager import FontManager
+from instrumentation import INSTRUMENTATION_OPTION_KEYS, profiled
+from io_pipeline import Prefetcher, WriteBehind, check_depth
+from page_sharding import ShardGroup, count_pages, plan_shards
+from progress import BatchCancelled, RunControl, install
+from result_cache import ResultCache
+from rule_set import RuleSet
+from template_cache import LayoutCache
+
+
+# 每个工作进程内的常驻状态，由 _init_worker 在进程启动时填充一次
+_worker_state: Dict = {}
+
+
+def _init_worker(process_func: Callable, replacements: List[Dict], fonts_dir: Optional[str],
+                 options: Optional[Dict] = None, control: Optional[RunControl] = None):
+    """工作进程初始化：配置和字体只加载一次，之后所有文件复用（模板布局缓存同样跨文件共用）"""
+    _worker_state["process_func"] = process_func
+    _worker_state["replacements"] = replacements
+    _worker_state["matcher"] = RuleSet.from_replacements(replacements)
+    _worker_state["fonts_dir"] = fonts_dir
+    _worker_state["font_manager"] = FontManager(fonts_dir) if fonts_dir else None
+    _worker_state["layout_cache"] = LayoutCache()
+    _worker_state["options"] = dict(options or {})
+    install(control)
+
+
+def _run_job(input_pdf: str, output_pdf: str, pages: Optional[range] = None,
+             extra: Optional[Dict] = None, source: Optional[bytes] = None,
+             buffered: bool = False) -> Dict:
+    """在工作进程中处理单个文件（或其中一个页码分片），异常转换为结果返回，不会中断整个批次
+
+    extra 为该文件独有的关键字参数（如语料索引给出的 candidate_pages）。
+    options 中的 profile_dir 不传给 process_func，而是用 cProfile 剖析这次调用。
+    source 为主进程预读的输入内容（此时以 label 参数传入原路径），buffered 为真时输出写到内存，
+    放在结果的 output_data 中交给主进程后台写出（见 io_pipeline.py）。
+    """
+    start = time.perf_counter()
+    result = {"input": input_pdf, "output": output_pdf, "ok": True, "error": None, "pid": os.getpid()}
+    kwargs = dict(_worker_state["options"])
+    kwargs.update(matcher=_worker_state["matcher"], fonts_dir=_worker_state["fonts_dir"])
+    if _worker_state["font_manager"] is not None:
+        kwargs["font_manager"] = _worker_state["font_manager"]
+    kwargs["layout_cache"] = _worker_state["layout_cache"]
+    if pages is not None:
+        kwargs["pages"] = pages
+    if extra:
+        kwargs.update(extra)
+    if source is not None:
+        kwargs["label"] = input_pdf
+    profile_dir = kwargs.pop("profile_dir", None)
+    destination = output_pdf
+    if buffered:
+        destination = io.BytesIO()
+        # 日志中显示最终的输出路径
+        destination.name = output_pdf
+    try:
+        with profiled(profile_dir, input_pdf):
+            stats = _worker_state["process_func"](input_pdf if source is None else source, destination,
+                                                  _worker_state["replacements"], **kwargs)
+        if isinstance(stats, dict):
+            result["stats"] = stats
+        if buffered:
+            result["output_data"] = destination.getvalue()
+    except BatchCancelled as e:
+        result.update(ok=False, error=str(e), cancelled=True)
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def _finish_group(group: ShardGroup) -> Dict:
+    """在工作进程中合并一个文档的全部分片（含最终保存），主进程继续分发其他任务"""
+    return dict(group.finish(), pid=os.getpid())
+
+
+def _cancelled_result(input_pdf: str, output_pdf: str) -> Dict:
+    return {"input": input_pdf, "output": output_pdf, "ok": False, "error": "已取消",
+            "cancelled": True, "elapsed": 0.0}
+
+
+def default_worker_count() -> int:
+    return os.cpu_count() or 1
+
+
+class BatchEngine:
+    """多进程批量处理引擎：把 (输入, 输出) 任务分发给 workers 个进程，结果按完成顺序流式返回
+
+    shard_pages、cache、index、control、prefetch / write_behind 分别启用分片、结果缓存、语料索引、
+    暂停/取消和 I/O 流水线；options 原样传给 process_func，后者需支持 pages 和 label 参数。
+    """
+
+    def __init__(self, process_func: Callable, replacements: List[Dict],
+                 fonts_dir: Optional[str] = None, workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, shard_pages: Optional[int] = None,
+                 options: Optional[Dict] = None, cache: Optional[ResultCache] = None,
+                 index: Optional[CorpusIndex] = None, control: Optional[RunControl] = None,
+                 prefetch: Optional[int] = None, write_behind: Optional[int] = None):
+        self.process_func = process_func
+        self.replacements = replacements
+        self.fonts_dir = fonts_dir
+        self.workers = max(1, workers or default_worker_count())
+        self.max_in_flight = max(self.workers, max_in_flight or self.workers * 2)
+        self.shard_pages = shard_pages
+        self.options = options or {}
+        self.cache = cache
+        self.index = index
+        self.control = control
+        self.prefetch = check_depth("prefetch", prefetch)
+        self.write_behind = check_depth("write_behind", write_behind)
+        # 语料索引给出的每个文件实际命中的规则下标，用于计算缓存键
+        self._job_rules: Dict[Tuple[str, str], Tuple[int, ...]] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def _init_args(self) -> Tuple:
+        return (self.process_func, self.replacements, self.fonts_dir, self.options, self.control)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.control is not None and self.control.cancelled
+
+    def run(self, jobs: Iterable[Tuple[str, str]]) -> Iterator[Dict]:
+        """处理 (input_pdf, output_pdf) 任务序列，逐个产出每个文件的结果"""
+        # 不需要交给工作进程的文件（复制或缓存命中）的结果，穿插在处理结果之间产出
+        ready: List[Dict] = []
+        tasks: Iterable[Tuple[str, str, Dict]] = ((job[0], job[1], {}) for job in jobs)
+        if self.index is not None:
+            tasks = self._index_filter(list(tasks), ready)
+        keys: Dict[Tuple[str, str], str] = {}
+        if self.cache is not None:
+            tasks = self._cache_filter(tasks, ready, keys)
+
+        for result in self._dispatch(tasks):
+            while ready:
+                yield ready.pop(0)
+            key = keys.pop((result["input"], result["output"]), None)
+            if result["ok"] and key is not None:
+                try:
+                    stats = {k: v for k, v in (result.get("stats") or {}).items() if k != "trace_events"}
+                    self.cache.store(key, result["output"], stats)
+                except Exception as e:
+                    self.logger.warning(f"写入缓存失败: {result['input']} - {e}")
+            if self.cache is not None:
+                result.setdefault("cached", False)
+            yield result
+        while ready:
+            yield ready.pop(0)
+
+    def _dispatch(self, tasks: Iterable[Tuple[str, str, Dict]]) -> Iterator[Dict]:
+        if self.workers == 1:
+            yield from self._run_inline(tasks)
+        else:
+            yield from self._run_pool(tasks)
+
+    def _index_filter(self, tasks: List[Tuple[str, str, Dict]], ready: List[Dict]) -> Iterator[Tuple]:
+        """按语料索引筛选：无命中的文件直接复制，有命中的文件只处理命中页"""
+        report = self.index.update([task[0] for task in tasks], workers=self.workers)
+        self.logger.info(f"语料索引更新: 新建 {report['indexed']} 个，未变化 {report['unchanged']} 个")
+        digests = {task[0]: self.index.digest_of(task[0]) for task in tasks}
+        matches = self.index.match(RuleSet.from_replacements(self.replacements),
+                                   [d for d in digests.values() if d])
+
+        for input_pdf, output_pdf, extra in tasks:
+            sha = digests.get(input_pdf)
+            if sha is None or self.cancelled:
+                # 无法建立索引的文件照常处理，由工作进程报告错误
+                yield input_pdf, output_pdf, extra
+                continue
+            pages = matches.get(sha)
+            if not pages:
+                ready.append(self._copy_unmatched(input_pdf, output_pdf, sha))
+                continue
+            self._job_rules[(input_pdf, output_pdf)] = tuple(sorted({i for c in pages.values() for i in c}))
+            yield input_pdf, output_pdf, dict(extra, candidate_pages=sorted(pages))
+
+    def _copy_unmatched(self, input_pdf: str, output_pdf: str, sha: str) -> Dict:
+        start = time.perf_counter()
+        result = {"input": input_pdf, "output": output_pdf, "ok": True, "error": None, "unchanged": True}
+        try:
+            if os.path.abspath(input_pdf) != os.path.abspath(output_pdf):
+                shutil.copyfile(input_pdf, output_pdf)
+            page_count = self.index.page_count(sha)
+            result["stats"] = {"pages": page_count, "skipped_pages": page_count, "replacements": 0}
+        except Exception as e:
+            result["ok"] = False
+            result["error"] = str(e)
+        result["elapsed"] = time.perf_counter() - start
+        return result
+
+    def _cache_context(self, rules: Optional[Tuple[int, ...]] = None) -> str:
+        # 计时、trace 和剖析参数不影响输出
+        options = {k: v for k, v in self.options.items() if k not in INSTRUMENTATION_OPTION_KEYS}
+        options["shard_pages"] = self.shard_pages
+        replacements = self.replacements if rules is None else [self.replacements[i] for i in rules]
+        return self.cache.context_digest(replacements, self.fonts_dir, options)
+
+    def _cache_filter(self, tasks: Iterable[Tuple[str, str, Dict]], ready: List[Dict],
+                      keys: Dict[Tuple[str, str], str]) -> Iterator[Tuple]:
+        """先查缓存，只把未命中的文件交给工作进程；未命中文件的缓存键记录在 keys 中"""
+        contexts: Dict = {}
+        for input_pdf, output_pdf, extra in tasks:
+            if self.cancelled:
+                yield input_pdf, output_pdf, extra
+                continue
+            start = time.perf_counter()
+            rules = self._job_rules.pop((input_pdf, output_pdf), None)
+            if rules not in contexts:
+                contexts[rules] = self._cache_context(rules)
+            try:
+                key = self.cache.make_key(input_pdf, contexts[rules])
+                stats = self.cache.restore(key, output_pdf)
+            except Exception as e:
+                # 缓存不可用时照常处理，由工作进程报告文件本身的错误
+                self.logger.warning(f"缓存查询失败: {input_pdf} - {e}")
+                key, stats = None, None
+            if stats is not None:
+                ready.append({"input": input_pdf, "output": output_pdf, "ok": True, "error": None,
+                              "cached": True, "stats": stats,
+                              "elapsed": time.perf_counter() - start})
+                continue
+            if key is not None:
+                keys[(input_pdf, output_pdf)] = key
+            yield input_pdf, output_pdf, extra
+
+    def _prefetched(self, tasks: Iterable[Tuple], path_of: Callable = lambda task: task[0]):
+        """按 prefetch 设置预读输入，产出 (任务, 预读的字节或 None)"""
+        if self.prefetch:
+            return Prefetcher(tasks, self.prefetch, path_of)
+        return ((task, None) for task in tasks)
+
+    def _written(self, writer: Optional[WriteBehind], result: Dict) -> List[Dict]:
+        """结果带有内存中的输出时交给后台写出，返回已经写完、可以产出的结果"""
+        data = result.pop("output_data", None)
+        if data is None:
+            return (writer.ready() if writer is not None else []) + [result]
+        return writer.put(result, result["output"], data)
+
+    def _run_inline(self, tasks: Iterable[Tuple[str, str, Dict]]) -> Iterator[Dict]:
+        _init_worker(*self._init_args())
+        writer = WriteBehind(self.write_behind) if self.write_behind else None
+        try:
+            for (input_pdf, output_pdf, extra), data in self._prefetched(tasks):
+                if self.cancelled:
+                    yield _cancelled_result(input_pdf, output_pdf)
+                    continue
+                result = _run_job(input_pdf, output_pdf, None, extra, data, writer is not None)
+                yield from self._written(writer, result)
+            if writer is not None:
+                yield from writer.drain()
+        finally:
+            install(None)
+            if writer is not None:
+                # 调用方提前停止迭代时，已经处理完的文件也照常写出
+                writer.close()
+
+    def _tasks(self, tasks: Iterable[Tuple[str, str, Dict]]) -> Iterator[Tuple]:
+        """把文件任务展开为进程池任务：(input_pdf, output_pdf, pages, extra, group)"""
+        for input_pdf, output_pdf, extra in tasks:
+            shards = self._plan_shards(input_pdf)
+            if len(shards) <= 1:
+                yield (input_pdf, output_pdf, None, extra, None)
+                continue
+
+            self.logger.info(f"拆分处理: {input_pdf} -> {len(shards)} 个分片")
+            group = ShardGroup(input_pdf, output_pdf, shards, self.options.get("save_profile"))
+            for path, pages in zip(group.paths, shards):
+                yield (input_pdf, path, pages, extra, group)
+
+    def _plan_shards(self, input_pdf: str) -> List[range]:
+        if not self.shard_pages:
+            return []
+        try:
+            return plan_shards(count_pages(input_pdf), self.shard_pages)
+        except Exception:
+            # 无法打开的文件交给工作进程处理，由其报告错误
+            return []
+
+    def _run_pool(self, tasks: Iterable[Tuple[str, str, Dict]]) -> Iterator[Dict]:
+        self.logger.info(f"启动进程池: {self.workers} 个工作进程")
+        # 分片任务（带 group）各自只处理部分页面，直接按路径打开，不预读
+        prefetched = self._prefetched(self._tasks(tasks), lambda task: task[0] if task[4] is None else None)
+        task_iter = iter(prefetched)
+        writer = WriteBehind(self.write_behind) if self.write_behind else None
+
+        def remaining() -> List[Tuple]:
+            if isinstance(prefetched, Prefetcher):
+                return prefetched.remaining()
+            return [task for task, _data in task_iter]
+
+        try:
+            yield from self._pool_loop(task_iter, writer, remaining)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _pool_loop(self, task_iter: Iterator[Tuple], writer: Optional[WriteBehind],
+                   remaining: Callable[[], List[Tuple]]) -> Iterator[Dict]:
+        pending = {}
+        merging = set()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=self._init_args()) as pool:
+            def submit_more():
+                while len(pending) < self.max_in_flight and not self.cancelled:
+                    try:
+                        task, data = next(task_iter)
+                    except StopIteration:
+                        return
+                    buffered = writer is not None and task[4] is None
+                    pending[pool.submit(_run_job, *task[:4], data, buffered)] = task
+
+            submit_more()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    input_pdf, output_pdf, _, _, group = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # 工作进程异常退出（如内存不足被杀），剩余任务全部记为失败
+                        self.logger.error(f"进程池异常终止: {e}")
+                        if writer is not None:
+                            yield from writer.drain()
+                        yield from self._abort(f"工作进程异常退出: {e}", [(input_pdf, output_pdf, None, None, group)]
+                                               + list(pending.values()) + remaining())
+                        pending.clear()
+                        return
+
+                    if future in merging:
+                        merging.discard(future)
+                        yield result
+                    elif group is None:
+                        yield from self._written(writer, result)
+                    elif group.add_result(result):
+                        # 合并和保存可能很慢，交给工作进程，不阻塞后续任务的提交
+                        merge = pool.submit(_finish_group, group)
+                        merging.add(merge)
+                        pending[merge] = (group.input_pdf, group.output_pdf, None, None, group)
+                submit_more()
+
+            if writer is not None:
+                yield from writer.drain()
+            if self.cancelled:
+                yield from self._abort("已取消", remaining(), cancelled=True)
+
+    def _abort(self, error: str, tasks: List[Tuple], cancelled: bool = False) -> Iterator[Dict]:
+        """进程池失效或批处理被取消时，为每个未完成的文件产出一条失败结果"""
+        seen_groups = set()
+        for input_pdf, output_pdf, _, _, group in tasks:
+            if group is not None:
+                if id(group) in seen_groups:
+                    continue
+                seen_groups.add(id(group))
+                group.discard()
+                output_pdf = group.output_pdf
+            result = {"input": input_pdf, "output": output_pdf, "ok": False,
+                      "error": error, "elapsed": 0.0}
+            if cancelled:
+                result["cancelled"] = True
+            yield result
@@ -0,0 +1,4 @@
+"""性能基准：合成 PDF 语料生成（corpus.py）和基准运行/对比（run.py）
+
+在仓库根目录运行：python -m benchmarks.run --preset quick
+"""
@@ -0,0 +1,150 @@
+import os
+import random
+import logging
+import fitz
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# 语料参数：
+#   pages         - 页数
+#   lines         - 每页文字行数（文字密度）
+#   fonts         - 使用的 Base-14 字体种数，各行轮流使用
+#   images        - 每页嵌入的图片数
+#   match_density - 含有规则文本的行所占比例
+#   rules         - 规则数，每条规则对应一个只在语料中出现的词
+#   seed          - 随机种子；同一组参数总是生成相同内容
+CORPUS_DEFAULTS: Dict = {
+    "pages": 10,
+    "lines": 40,
+    "fonts": 1,
+    "images": 0,
+    "match_density": 0.05,
+    "rules": 10,
+    "seed": 0,
+}
+
+_BASE14_FONTS = ["helv", "tiro", "cour", "hebo", "tibo", "cobo",
+                 "heit", "tiit", "coit", "hebi", "tibi", "cobi"]
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "fu", "be", "gi"]
+
+_PAGE_WIDTH, _PAGE_HEIGHT = 595, 842
+_MARGIN = 50
+
+
+def corpus_spec(**overrides) -> Dict:
+    """默认参数加上覆盖项，未知参数报错"""
+    unknown = set(overrides) - set(CORPUS_DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的语料参数: {', '.join(sorted(unknown))}")
+    spec = dict(CORPUS_DEFAULTS)
+    spec.update({key: value for key, value in overrides.items() if value is not None})
+    if spec["fonts"] < 1 or spec["fonts"] > len(_BASE14_FONTS):
+        raise ValueError(f"fonts 应在 1 到 {len(_BASE14_FONTS)} 之间")
+    if not 0 <= spec["match_density"] <= 1:
+        raise ValueError("match_density 应在 0 到 1 之间")
+    return spec
+
+
+def _word(rng: random.Random, syllables: int) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(syllables))
+
+
+def generate_rules(count: int, seed: int = 0) -> List[Dict]:
+    """生成 count 条普通文本规则
+
+    规则文本为“随机词 + 四位序号”，正文填充词不含数字，
+    因此规则之间、规则与填充词之间都不会互相包含，命中数可以预知。
+    """
+    rng = random.Random(f"rules:{seed}")
+    replacements = []
+    for idx in range(count):
+        word = _word(rng, 3)
+        replacements.append({"old_text": f"{word}{idx:04d}",
+                             "new_text": f"{_word(rng, rng.randint(2, 4))}{idx:04d}"})
+    return replacements
+
+
+def corpus_filename(spec: Dict) -> str:
+    return ("corpus_p{pages}_l{lines}_f{fonts}_i{images}_m{match_density}_r{rules}_s{seed}.pdf"
+            .format(**spec))
+
+
+def _page_lines(spec: Dict, terms: List[str], page_num: int) -> List[List[str]]:
+    # 每页单独播种：页数不同而其他参数相同的语料，前面的页面内容一致
+    rng = random.Random(f"page:{spec['seed']}:{spec['rules']}:{page_num}")
+    lines = []
+    for _ in range(spec["lines"]):
+        words = [_word(rng, rng.randint(1, 3)) for _ in range(rng.randint(6, 10))]
+        if terms and rng.random() < spec["match_density"]:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(terms))
+        lines.append(words)
+    return lines
+
+
+def _image(seed: int, index: int) -> fitz.Pixmap:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    pix.clear_with((seed * 31 + index * 17) % 256)
+    return pix
+
+
+def generate_pdf(spec: Dict, path: str) -> Dict:
+    """按参数生成 PDF，返回其中规则文本出现的总次数"""
+    terms = [r["old_text"] for r in generate_rules(spec["rules"], spec["seed"])]
+    term_set = set(terms)
+    fonts = _BASE14_FONTS[:spec["fonts"]]
+    spacing = min(14.0, (_PAGE_HEIGHT - 2 * _MARGIN) / max(spec["lines"], 1))
+    fontsize = spacing * 0.75
+    images = [_image(spec["seed"], i) for i in range(spec["images"])]
+    expected = 0
+
+    doc = fitz.open()
+    try:
+        for page_num in range(spec["pages"]):
+            page = doc.new_page(width=_PAGE_WIDTH, height=_PAGE_HEIGHT)
+            for line_num, words in enumerate(_page_lines(spec, terms, page_num)):
+                expected += sum(1 for word in words if word in term_set)
+                page.insert_text((_MARGIN, _MARGIN + (line_num + 1) * spacing), " ".join(words),
+                                 fontname=fonts[line_num % len(fonts)], fontsize=fontsize)
+            for i, pix in enumerate(images):
+                top = _MARGIN + i * 70
+                page.insert_image(fitz.Rect(_PAGE_WIDTH - 120, top, _PAGE_WIDTH - 56, top + 64),
+                                  pixmap=pix)
+            # 每次 insert_text 都会追加一个内容流，合并为一个，与常见的 PDF 一致
+            page.clean_contents()
+        doc.set_metadata({"producer": "benchmarks.corpus", "creationDate": "", "modDate": ""})
+        doc.save(path, garbage=1, deflate=True, no_new_id=True)
+    finally:
+        doc.close()
+    return {"path": path, "expected_matches": expected}
+
+
+def ensure_corpus(spec: Dict, corpus_dir: str) -> str:
+    """返回参数对应的语料文件，不存在时生成"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, corpus_filename(spec))
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        info = generate_pdf(spec, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"生成语料: {path}（规则文本 {info['expected_matches']} 处）")
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="生成确定性的合成 PDF 语料")
+    parser.add_argument("output", help="输出 PDF 路径")
+    for key, default in CORPUS_DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=type(default), default=default)
+    args = parser.parse_args(argv)
+    spec = corpus_spec(**{key: getattr(args, key) for key in CORPUS_DEFAULTS})
+    info = generate_pdf(spec, args.output)
+    print(f"{info['path']}: {spec['pages']} 页，规则文本 {info['expected_matches']} 处")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.corpus import CORPUS_DEFAULTS, corpus_spec, ensure_corpus, generate_rules
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT_DIR, "benchmarks")
+
+# 被测对象：main.py 的两种替换引擎，以及 PDFProcessor
+ENGINES = ("redact", "stream", "processor")
+
+# 规则数 × 页数 的测试网格
+PRESETS: Dict[str, Dict[str, List[int]]] = {
+    "quick": {"rules": [1, 10], "pages": [1, 20]},
+    "standard": {"rules": [1, 10, 100, 1000], "pages": [1, 100, 1000]},
+    "full": {"rules": [1, 10, 100, 1000], "pages": [1, 10, 100, 1000, 5000]},
+}
+
+# 对比时检查的指标及其方向（True 表示越大越好）
+COMPARED_METRICS = {"pages_per_s": True, "matches_per_s": True,
+                    "peak_rss_bytes": False, "output_bytes": False}
+
+RESULT_VERSION = 1
+
+
+def peak_rss() -> Optional[int]:
+    """当前进程的常驻内存峰值（字节），无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 以 KB 为单位，macOS 以字节为单位
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss)
+
+
+def _run_case(case: Dict) -> Dict:
+    """在独立的子进程中运行一个用例，内存峰值只反映这一个用例"""
+    os.environ.setdefault("PYMUPDF_MESSAGE", "fd:2")
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    import main
+    from font_manager import FontManager
+    from pdf_processor import PDFProcessor
+    from rule_set import RuleSet
+
+    fonts_dir = os.path.join(ROOT_DIR, "fonts")
+    font_manager = FontManager(fonts_dir)
+    replacements = generate_rules(case["rules"], case["seed"])
+    baseline_rss = peak_rss()
+
+    start = time.perf_counter()
+    matcher = RuleSet.from_replacements(replacements)
+    compile_seconds = time.perf_counter() - start
+
+    timings = []
+    matches = 0
+    for _ in range(case["repeat"]):
+        start = time.perf_counter()
+        if case["engine"] == "processor":
+            processor = PDFProcessor(fonts_dir)
+            doc = processor.load_pdf(case["input"])
+            matches = processor.process_replacements(doc, replacements, matcher)
+            processor.save_pdf(doc, case["output"], case["save_profile"])
+        else:
+            stats = main.replace_text_in_pdf(case["input"], case["output"], replacements,
+                                             matcher=matcher, font_manager=font_manager,
+                                             engine=case["engine"], save_profile=case["save_profile"])
+            matches = stats["replacements"]
+        timings.append(time.perf_counter() - start)
+
+    elapsed = statistics.median(timings)
+    peak = peak_rss()
+    return {
+        "engine": case["engine"],
+        "rules": case["rules"],
+        "pages": case["pages"],
+        "elapsed": elapsed,
+        "elapsed_min": min(timings),
+        "compile_seconds": compile_seconds,
+        "matches": matches,
+        "pages_per_s": case["pages"] / elapsed if elapsed else 0.0,
+        "matches_per_s": matches / elapsed if elapsed else 0.0,
+        "peak_rss_bytes": peak,
+        "rss_delta_bytes": peak - baseline_rss if peak is not None and baseline_rss is not None else None,
+        "input_bytes": os.path.getsize(case["input"]),
+        "output_bytes": os.path.getsize(case["output"]),
+    }
+
+
+def run_case_isolated(case: Dict) -> Dict:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(_run_case, case).result()
+
+
+def environment() -> Dict:
+    import fitz
+    return {
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_suite(engines: List[str], rules_list: List[int], pages_list: List[int], corpus: Dict,
+              corpus_dir: str, repeat: int = 1, save_profile: Optional[str] = None) -> Dict:
+    """按网格运行所有用例，返回可写入 JSON 的结果"""
+    results = []
+    out_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+    try:
+        for rules in rules_list:
+            for pages in pages_list:
+                spec = corpus_spec(**dict(corpus, rules=rules, pages=pages))
+                path = ensure_corpus(spec, corpus_dir)
+                for engine in engines:
+                    case = {"engine": engine, "rules": rules, "pages": pages, "seed": spec["seed"],
+                            "repeat": repeat, "save_profile": save_profile, "input": path,
+                            "output": os.path.join(out_dir, f"{engine}_r{rules}_p{pages}.pdf")}
+                    result = run_case_isolated(case)
+                    results.append(result)
+                    print(_format_result(result), file=sys.stderr)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {
+        "version": RESULT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "corpus": {key: value for key, value in corpus.items() if key not in ("rules", "pages")},
+        "repeat": repeat,
+        "save_profile": save_profile,
+        "results": results,
+    }
+
+
+def _format_result(r: Dict) -> str:
+    rss = f"{r['peak_rss_bytes'] / 1024 ** 2:.0f}MB" if r["peak_rss_bytes"] is not None else "-"
+    return (f"{r['engine']:<9} rules={r['rules']:<5} pages={r['pages']:<5} "
+            f"{r['elapsed']:8.3f}s {r['pages_per_s']:9.1f} 页/s {r['matches_per_s']:10.1f} 处/s "
+            f"峰值 {rss:>7} 输出 {r['output_bytes']} 字节")
+
+
+def _key(result: Dict) -> Tuple:
+    return (result["engine"], result["rules"], result["pages"])
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.1) -> Tuple[List[Dict], List[Dict]]:
+    """逐用例对比两次结果，返回 (全部变化, 超过阈值的退化)"""
+    base = {_key(r): r for r in baseline.get("results", [])}
+    rows, regressions = [], []
+    for result in current.get("results", []):
+        old = base.get(_key(result))
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = new_value / old_value - 1
+            row = {"engine": result["engine"], "rules": result["rules"], "pages": result["pages"],
+                   "metric": metric, "baseline": old_value, "current": new_value, "change": change}
+            rows.append(row)
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_comparison(current: Dict, baseline: Dict, threshold: float) -> int:
+    """打印对比结果，有退化时返回 1"""
+    for key in ("corpus", "repeat", "save_profile"):
+        if current.get(key) != baseline.get(key):
+            print(f"注意: 两次运行的 {key} 不同: {baseline.get(key)} -> {current.get(key)}")
+    if current.get("environment") != baseline.get("environment"):
+        print("注意: 两次运行的环境不同，结果仅供参考")
+
+    rows, regressions = compare(current, baseline, threshold)
+    regressed = {id(row) for row in regressions}
+    for row in rows:
+        flag = "  退化" if id(row) in regressed else ""
+        print(f"{row['engine']:<9} rules={row['rules']:<5} pages={row['pages']:<5} {row['metric']:<15} "
+              f"{row['baseline']:>14.1f} -> {row['current']:>14.1f} ({row['change']:+.1%}){flag}")
+    print(f"共对比 {len(rows)} 项，退化 {len(regressions)} 项（阈值 {threshold:.0%}）")
+    return 1 if regressions else 0
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="PDF 文字替换性能基准：生成合成语料，按规则数和页数测量各引擎的吞吐量、内存峰值和输出大小",
+        epilog="示例：python -m benchmarks.run --preset quick -o new.json --baseline old.json")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="测试网格（默认 quick）")
+    parser.add_argument("--engines", default=",".join(ENGINES), help=f"逗号分隔，可选 {','.join(ENGINES)}")
+    parser.add_argument("--rules", type=_int_list, help="规则数列表，如 1,10,100（覆盖预设）")
+    parser.add_argument("--pages", type=_int_list, help="页数列表，如 1,100,5000（覆盖预设）")
+    for key in ("lines", "fonts", "images", "match_density", "seed"):
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=type(CORPUS_DEFAULTS[key]),
+                            help=f"语料参数（默认 {CORPUS_DEFAULTS[key]}）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个用例重复次数，取中位数")
+    parser.add_argument("--save-profile", help="保存方案：fast/balanced/compact")
+    parser.add_argument("--corpus-dir", default=os.path.join(BENCH_DIR, "corpus"), help="合成语料缓存目录")
+    parser.add_argument("-o", "--output", default=os.path.join(BENCH_DIR, "results", "latest.json"),
+                        help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="与之对比的基准结果 JSON")
+    parser.add_argument("--compare", metavar="RESULT", help="不运行基准，只把已有结果与 --baseline 对比")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值（默认 0.1）")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.compare:
+        if baseline is None:
+            print("--compare 需要同时指定 --baseline", file=sys.stderr)
+            return 2
+        with open(args.compare, "r", encoding="utf-8") as f:
+            return print_comparison(json.load(f), baseline, args.threshold)
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"未知的引擎: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    grid = PRESETS[args.preset]
+    corpus = corpus_spec(**{key: getattr(args, key) for key in ("lines", "fonts", "images", "match_density", "seed")})
+
+    current = run_suite(engines, args.rules or grid["rules"], args.pages or grid["pages"], corpus,
+                        args.corpus_dir, repeat=args.repeat, save_profile=args.save_profile)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.output}")
+
+    if baseline is not None:
+        return print_comparison(current, baseline, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
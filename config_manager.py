@@ -3,6 +3,8 @@ import os
 import logging
 from typing import List, Dict, Any
 
+from rule_set import RULE_OPTIONS, RuleSet
+
 class ConfigManager:
     def __init__(self, config_dir: str = "configs"):
         self.config_dir = config_dir
@@ -60,10 +62,34 @@ class ConfigManager:
             if not isinstance(replacement["old_text"], str) or not isinstance(replacement["new_text"], str):
                 self.logger.error(f"第 {i} 个替换项的 old_text 和 new_text 应该是字符串")
                 return False
+            
+            for option in RULE_OPTIONS:
+                if option in replacement and not isinstance(replacement[option], bool):
+                    self.logger.error(f"第 {i} 个替换项的 {option} 应该是 true 或 false")
+                    return False
+        
+        # 编译规则：正则表达式或捕获组引用无效时报错，重复、冲突和包含关系记录到日志
+        try:
+            rules = RuleSet(config["replacements"])
+        except ValueError as e:
+            self.logger.error(str(e))
+            return False
+        if rules.conflicts:
+            self.logger.warning(f"存在 {len(rules.conflicts)} 组冲突的替换项，只有靠前的一条生效")
         
         self.logger.info("配置文件验证通过")
         return True
     
+    @staticmethod
+    def normalize_replacements(replacements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """规范化替换规则（键排序、去掉空值和值为 false 的规则开关），用于比较两份配置的规则是否相同
+
+        规则顺序决定重叠命中的优先级，因此保留原有顺序。
+        """
+        return [{key: r[key] for key in sorted(r)
+                 if r[key] is not None and not (key in RULE_OPTIONS and r[key] is False)}
+                for r in replacements]
+
     def get_replacements(self, config_name: str) -> List[Dict[str, str]]:
         """获取替换配置"""
         config = self.load_config(config_name)
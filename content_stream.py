@@ -0,0 +1,476 @@
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from rule_set import RuleSet
+from text_matcher import collapse_whitespace
+
+
+ENGINES = ("redact", "stream")
+
+
+def check_engine(engine: str) -> str:
+    if engine not in ENGINES:
+        raise ValueError(f"未知的替换引擎: {engine}，可选: {', '.join(ENGINES)}")
+    return engine
+
+
+# 按页面命中规则组合缓存的表达式个数
+_PATTERN_CACHE_SIZE = 256
+
+_WS = b"\x00\t\n\x0c\r "
+_TOKEN_RE = re.compile(rb"""
+    (?P<ws>[\x00\t\n\x0c\r ]+)
+  | (?P<comment>%[^\r\n]*)
+  | (?P<dictopen><<)
+  | (?P<dictclose>>>)
+  | (?P<hex><[0-9A-Fa-f\x00\t\n\x0c\r ]*>)
+  | (?P<aopen>\[)
+  | (?P<aclose>\])
+  | (?P<lit>\()
+  | (?P<name>/[^\x00\t\n\x0c\r ()<>\[\]{}/%]*)
+  | (?P<word>[^\x00\t\n\x0c\r ()<>\[\]{}/%]+)
+  | (?P<other>[{}])
+""", re.X)
+_NUMBER_RE = re.compile(rb"[+-]?(\d+\.?\d*|\.\d+)")
+_EI_RE = re.compile(rb"[\x00\t\n\x0c\r ]EI(?=[\x00\t\n\x0c\r ]|$)")
+_ESCAPES = {ord("n"): 10, ord("r"): 13, ord("t"): 9, ord("b"): 8, ord("f"): 12}
+
+# 单字节编码名 -> Python 编解码器
+_CODECS = {
+    "WinAnsiEncoding": "cp1252",
+    "MacRomanEncoding": "mac_roman",
+}
+# StandardEncoding 与 ASCII 仅在这两个位置不同（quoteright / quoteleft）
+_STANDARD_EXCLUDED = {0x27, 0x60}
+_SIMPLE_FONT_TYPES = ("Type1", "TrueType", "MMType1")
+_SYMBOLIC_BASE14 = ("Symbol", "ZapfDingbats")
+
+
+class _Token:
+    __slots__ = ("kind", "start", "end", "value")
+
+    def __init__(self, kind: str, start: int, end: int, value=None):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.value = value
+
+
+def _scan_literal(data: bytes, pos: int) -> Tuple[int, bytes]:
+    """解析 '(' 之后的字面字符串，返回 (结束位置, 解码后的字节)"""
+    out = bytearray()
+    depth = 1
+    n = len(data)
+    while pos < n:
+        c = data[pos]
+        if c == 0x5C:  # 反斜杠
+            pos += 1
+            if pos >= n:
+                break
+            c = data[pos]
+            if c in _ESCAPES:
+                out.append(_ESCAPES[c])
+            elif 0x30 <= c <= 0x37:
+                digits = data[pos:pos + 3]
+                count = 1
+                while count < len(digits) and 0x30 <= digits[count] <= 0x37:
+                    count += 1
+                out.append(int(digits[:count], 8) & 0xFF)
+                pos += count - 1
+            elif c == 0x0D:
+                if pos + 1 < n and data[pos + 1] == 0x0A:
+                    pos += 1
+            elif c != 0x0A:
+                out.append(c)
+        elif c == 0x28:
+            depth += 1
+            out.append(c)
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return pos + 1, bytes(out)
+            out.append(c)
+        else:
+            out.append(c)
+        pos += 1
+    raise ValueError("内容流中的字符串未闭合")
+
+
+def _decode_hex(raw: bytes) -> bytes:
+    digits = bytes(b for b in raw[1:-1] if b not in _WS)
+    if len(digits) % 2:
+        digits += b"0"
+    return bytes.fromhex(digits.decode("ascii"))
+
+
+def _decode_name(raw: bytes) -> str:
+    name = raw[1:]
+    if b"#" in name:
+        name = re.sub(rb"#([0-9A-Fa-f]{2})", lambda m: bytes([int(m.group(1), 16)]), name)
+    return name.decode("latin-1")
+
+
+def encode_literal(data: bytes) -> bytes:
+    """把字节编码为 PDF 字面字符串"""
+    out = bytearray(b"(")
+    for b in data:
+        if b in (0x28, 0x29, 0x5C):
+            out += b"\\" + bytes([b])
+        elif 32 <= b < 127:
+            out.append(b)
+        else:
+            out += b"\\%03o" % b
+    out += b")"
+    return bytes(out)
+
+
+def tokenize(data: bytes):
+    """把内容流切分为 token；内联图片（BI ... ID ... EI）整体跳过"""
+    pos = 0
+    n = len(data)
+    while pos < n:
+        m = _TOKEN_RE.match(data, pos)
+        if m is None:
+            # 无法识别的字节，跳过
+            pos += 1
+            continue
+        kind = m.lastgroup
+        start = pos
+        pos = m.end()
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "lit":
+            pos, value = _scan_literal(data, pos)
+            yield _Token("string", start, pos, value)
+        elif kind == "hex":
+            yield _Token("string", start, pos, _decode_hex(m.group()))
+        elif kind == "name":
+            yield _Token("name", start, pos, _decode_name(m.group()))
+        elif kind == "word":
+            word = m.group()
+            if _NUMBER_RE.fullmatch(word):
+                yield _Token("number", start, pos, word)
+            elif word in (b"true", b"false", b"null"):
+                yield _Token("value", start, pos, word)
+            elif word == b"ID":
+                # 内联图片数据：跳到 EI
+                ei = _EI_RE.search(data, pos + 1)
+                pos = ei.end() if ei else n
+                yield _Token("op", start, pos, b"EI")
+            else:
+                yield _Token("op", start, pos, word)
+        else:
+            yield _Token(kind, start, pos, m.group())
+
+
+class _FontCodec:
+    """简单字体（单字节编码）的编解码与字形覆盖检查"""
+
+    def __init__(self, codec: Optional[str], widths: Optional[List[float]], first_char: int,
+                 subset: bool):
+        self.codec = codec
+        self.widths = widths
+        self.first_char = first_char
+        self.subset = subset
+
+    def decode(self, data: bytes) -> Optional[str]:
+        if self.codec is None:
+            if any(b < 0x20 or b > 0x7E or b in _STANDARD_EXCLUDED for b in data):
+                return None
+            return data.decode("ascii")
+        try:
+            return data.decode(self.codec)
+        except UnicodeDecodeError:
+            return None
+
+    def encode(self, text: str, seen_chars: set) -> Optional[bytes]:
+        """编码新文本；字体编码或字形无法覆盖时返回 None"""
+        try:
+            data = text.encode(self.codec or "ascii")
+        except UnicodeEncodeError:
+            return None
+        if self.codec is None and any(b in _STANDARD_EXCLUDED for b in data):
+            return None
+
+        for ch, code in zip(text, data):
+            if self.subset and ch not in seen_chars:
+                # 子集字体只包含用到过的字形，没有出现过的字符无法保证可以显示
+                return None
+            if self.widths is not None and ch != " ":
+                idx = code - self.first_char
+                if idx < 0 or idx >= len(self.widths) or self.widths[idx] <= 0:
+                    return None
+        return data
+
+
+class _Show:
+    """一次文字显示操作（Tj / ' / \" / TJ）"""
+
+    __slots__ = ("xref", "token", "font", "items", "text")
+
+    def __init__(self, xref: int, token: _Token, font: Optional[str], items: List[_Token]):
+        self.xref = xref
+        self.token = token
+        self.font = font
+        self.items = items
+        self.text: Optional[str] = None
+
+
+class ContentStreamRewriter:
+    """直接改写页面内容流中的文字显示操作符（Tj/TJ），不做 redaction
+
+    只处理页面资源中的简单字体（Type1/TrueType，WinAnsi/MacRoman/Standard 编码，
+    无 Differences），且新文本的每个字符都能用原字体编码、有字形宽度。
+    子集字体要求新字符在本页已用该字体显示过。
+
+    一页内的改写要么全部生效、要么完全不做：只有当每条规则在内容流中的替换次数
+    与页面文本匹配到的次数一致、且写回后的页面文本与按页面文本命中替换的结果一致时
+    才保留，否则恢复原内容流，由调用方回退到 redaction 流程。
+    每个文档创建一个实例，字体编码信息在文档内缓存。
+    """
+
+    def __init__(self, doc, rules: RuleSet):
+        self.doc = doc
+        self.rules = rules
+        self.logger = logging.getLogger(__name__)
+        self._codecs: Dict[int, Optional[_FontCodec]] = {}
+        # 每页只合并本页命中的规则，分组名 _r<下标> 对应配置中的规则；按规则组合缓存
+        self._patterns: Dict[frozenset, Optional["re.Pattern"]] = {}
+
+    def _font_codec(self, xref: int, font_type: str, basefont: str) -> Optional[_FontCodec]:
+        if xref in self._codecs:
+            return self._codecs[xref]
+
+        codec = None
+        try:
+            codec = self._load_codec(xref, font_type, basefont)
+        except Exception as e:
+            self.logger.debug(f"字体 {xref} 编码信息读取失败: {e}")
+        self._codecs[xref] = codec
+        return codec
+
+    def _load_codec(self, xref: int, font_type: str, basefont: str) -> Optional[_FontCodec]:
+        if font_type not in _SIMPLE_FONT_TYPES:
+            return None
+        base = basefont.split("+", 1)[-1]
+        if base in _SYMBOLIC_BASE14:
+            return None
+
+        kind, value = self.doc.xref_get_key(xref, "Encoding")
+        if kind == "name":
+            encoding = value.lstrip("/")
+            if encoding not in _CODECS and encoding != "StandardEncoding":
+                return None
+            codec_name = _CODECS.get(encoding)
+        elif kind == "null":
+            codec_name = None
+        else:
+            # 带 Differences 的编码字典，字节与字符的对应关系无法可靠推断
+            return None
+
+        widths = None
+        kind, value = self.doc.xref_get_key(xref, "Widths")
+        if kind == "xref":
+            value = self.doc.xref_object(int(value.split()[0]), compressed=True)
+            kind = "array"
+        if kind == "array":
+            widths = [float(w) for w in value.strip("[] \n").split()]
+        kind, value = self.doc.xref_get_key(xref, "FirstChar")
+        first_char = int(value) if kind == "int" else 0
+
+        subset = len(basefont) > 7 and basefont[6] == "+"
+        return _FontCodec(codec_name, widths, first_char, subset)
+
+    def _collect_shows(self, xref: int, data: bytes, state: Dict) -> List[_Show]:
+        shows = []
+        operands: List = []
+        arrays: List[List] = []
+        for token in tokenize(data):
+            kind = token.kind
+            if kind == "aopen":
+                arrays.append([token])
+                continue
+            if kind == "aclose":
+                if not arrays:
+                    continue
+                items = arrays.pop()
+                opener = items[0]
+                array = _Token("array", opener.start, token.end, items[1:])
+                (arrays[-1] if arrays else operands).append(array)
+                continue
+            if kind != "op":
+                (arrays[-1] if arrays else operands).append(token)
+                continue
+
+            op = token.value
+            if op == b"q":
+                state["stack"].append(state["font"])
+            elif op == b"Q":
+                if state["stack"]:
+                    state["font"] = state["stack"].pop()
+            elif op == b"Tf":
+                if len(operands) >= 2 and operands[-2].kind == "name":
+                    state["font"] = operands[-2].value
+            elif op in (b"Tj", b"'", b'"'):
+                if operands and operands[-1].kind == "string":
+                    shows.append(_Show(xref, operands[-1], state["font"], [operands[-1]]))
+            elif op == b"TJ":
+                if operands and operands[-1].kind == "array":
+                    array = operands[-1]
+                    items = [t for t in array.value if t.kind in ("string", "number")]
+                    shows.append(_Show(xref, array, state["font"], items))
+            operands = []
+            arrays = []
+        return shows
+
+    def _pattern_for(self, expected: Dict[int, int]) -> Optional["re.Pattern"]:
+        key = frozenset(idx for idx, count in expected.items() if count)
+        if not key:
+            return None
+        if key not in self._patterns:
+            if len(self._patterns) >= _PATTERN_CACHE_SIZE:
+                self._patterns.pop(next(iter(self._patterns)))
+            self._patterns[key] = self.rules.stream_pattern(key)
+        return self._patterns[key]
+
+    def _replaced_text(self, texts: Tuple[str, str]) -> str:
+        """页面纯文本按规则命中替换后应有的文本"""
+        folded, original = texts
+        pieces = []
+        pos = 0
+        for start, end, idx in self.rules.find_all(folded, original):
+            pieces.append(original[pos:start])
+            pieces.append(self.rules.new_text_for(idx, original, start))
+            pos = end
+        pieces.append(original[pos:])
+        return collapse_whitespace("".join(pieces))
+
+    def rewrite_page(self, page, expected: Dict[int, int],
+                     texts: Optional[Tuple[str, str]] = None) -> Optional[int]:
+        """改写页面内容流；expected 为 {规则下标: 页面文本中的命中次数}
+
+        texts 为改写前的页面纯文本（RuleSet.page_texts），不传时重新提取。
+        全部命中都能在内容流中原样替换时写回并返回替换次数，否则返回 None。
+        """
+        pattern = self._pattern_for(expected)
+        if pattern is None:
+            return None
+
+        fonts = {}
+        for xref, _ext, font_type, basefont, refname, _enc in page.get_fonts():
+            fonts[refname] = (xref, font_type, basefont)
+
+        streams = {}
+        shows: List[_Show] = []
+        state = {"font": None, "stack": []}
+        try:
+            for xref in page.get_contents():
+                data = self.doc.xref_stream(xref)
+                streams[xref] = data
+                shows.extend(self._collect_shows(xref, data, state))
+        except Exception as e:
+            self.logger.debug(f"页面 {page.number} 内容流解析失败: {e}")
+            return None
+
+        # 解码所有文字，记录每个字体在本页显示过的字符
+        seen: Dict[str, set] = {}
+        for show in shows:
+            info = fonts.get(show.font)
+            codec = self._font_codec(*info) if info else None
+            if codec is None:
+                continue
+            parts = []
+            for item in show.items:
+                if item.kind != "string":
+                    continue
+                text = codec.decode(item.value)
+                if text is None:
+                    parts = None
+                    break
+                parts.append(text)
+            if parts is None:
+                continue
+            show.text = "".join(parts)
+            seen.setdefault(show.font, set()).update(show.text)
+
+        counts: Dict[int, int] = {}
+        edits: Dict[int, List[Tuple[int, int, bytes]]] = {}
+        for show in shows:
+            if not show.text:
+                continue
+            matches = [m for m in pattern.finditer(show.text) if m.end() > m.start()]
+            if not matches:
+                continue
+            codec = self._font_codec(*fonts[show.font])
+            replacement = self._rewrite_show(show, matches, codec, seen[show.font],
+                                             streams[show.xref])
+            if replacement is None:
+                return None
+            edits.setdefault(show.xref, []).append((show.token.start, show.token.end, replacement))
+            for m in matches:
+                rule = int(m.lastgroup[2:])
+                counts[rule] = counts.get(rule, 0) + 1
+
+        if counts != {k: v for k, v in expected.items() if v}:
+            return None
+
+        if texts is None:
+            texts = self.rules.page_texts(page)
+        for xref, stream_edits in edits.items():
+            data = streams[xref]
+            for start, end, replacement in sorted(stream_edits, reverse=True):
+                data = data[:start] + replacement + data[end:]
+            self.doc.update_stream(xref, data)
+        # 单个 Tj/TJ 内的匹配看不到相邻操作符中的文字（整词边界、跨操作符的命中），
+        # 次数一致也可能改写了错误的位置：写回后的文本与预期不符时整页恢复
+        if self.rules.page_texts(page)[1] != self._replaced_text(texts):
+            for xref in edits:
+                self.doc.update_stream(xref, streams[xref])
+            self.logger.debug(f"页面 {page.number} 内容流改写结果与页面文本命中不一致，回退")
+            return None
+        return sum(counts.values())
+
+    def _rewrite_show(self, show: _Show, matches, codec: _FontCodec, seen_chars: set,
+                      source: bytes) -> Optional[bytes]:
+        """生成替换后的操作数字节串；新文本无法用原字体编码时返回 None"""
+        starts = {}
+        covered = set()
+        for m in matches:
+            new_text = self.rules.new_text_for(int(m.lastgroup[2:]), show.text, m.start())
+            if codec.encode(new_text, seen_chars) is None:
+                return None
+            starts[m.start()] = new_text
+            covered.update(range(m.start(), m.end()))
+
+        pieces = []
+        pos = 0
+        for item in show.items:
+            if item.kind == "number":
+                # 被替换区间内部的字距调整随原文一起删除
+                if pos not in covered or pos in starts:
+                    pieces.append(source[item.start:item.end])
+                continue
+
+            text = codec.decode(item.value)
+            end = pos + len(text)
+            if not any(i in covered for i in range(pos, end)):
+                pieces.append(source[item.start:item.end])
+                pos = end
+                continue
+
+            out = []
+            for i, ch in enumerate(text, start=pos):
+                if i in starts:
+                    out.append(starts[i])
+                if i not in covered:
+                    out.append(ch)
+            new_text = "".join(out)
+            if new_text:
+                pieces.append(encode_literal(codec.encode(new_text, seen_chars | set(new_text))))
+            pos = end
+
+        if show.token.kind == "array":
+            return b"[" + b" ".join(pieces) + b"]"
+        return pieces[0] if pieces else b"()"
+
@@ -0,0 +1,239 @@
+import os
+import time
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import fitz
+
+from result_cache import sha256_file
+from rule_set import RuleSet
+from text_matcher import TEXTPAGE_FLAGS, collapse_whitespace, normalize_text
+
+
+# 索引格式版本，与库中的 user_version 不一致时重建索引
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    sha256 TEXT PRIMARY KEY,
+    pages INTEGER NOT NULL,
+    indexed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_doc ON pages (sha256, page);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content='pages', content_rowid='id', tokenize='trigram'
+);
+"""
+
+# trigram 分词只能检索长度不小于 3 的子串，更短的规则改用 instr 扫描
+_TRIGRAM_MIN = 3
+
+
+def extract_page_texts(pdf_path: str) -> Tuple[str, List[str]]:
+    """提取每页合并空白后的纯文本（与替换流程的页面预筛选使用相同的提取参数）"""
+    sha = sha256_file(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        texts = [collapse_whitespace(page.get_text("text", flags=TEXTPAGE_FLAGS)) for page in doc]
+    return sha, texts
+
+
+class CorpusIndex:
+    """PDF 语料的页面文本索引（SQLite）
+
+    每个文档按内容 sha256 存一份逐页的纯文本（保留大小写），路径通过 size/mtime
+    快速检查映射到文档，文件未变化时不会重新提取。SQLite 支持 FTS5 trigram 时
+    对规范化文本建立全文索引查找候选页，否则逐页 instr 扫描；正则规则逐页匹配。
+    候选页再用 RuleSet 精确计数，统计口径与实际替换一致。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.db.create_function("fold", 1, normalize_text, deterministic=True)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            self.db.executescript("DROP TABLE IF EXISTS pages_fts; DROP TABLE IF EXISTS pages; "
+                                  "DROP TABLE IF EXISTS docs; DROP TABLE IF EXISTS files;")
+            self.db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self.db.executescript(_SCHEMA)
+        self.fts = self._init_fts()
+
+    def _init_fts(self) -> bool:
+        try:
+            self.db.executescript(_FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError as e:
+            self.logger.info(f"SQLite 不支持 FTS5 trigram，使用逐页扫描: {e}")
+            return False
+
+    def close(self):
+        self.db.close()
+
+    def _lookup(self, path: str) -> Optional[str]:
+        """文件未变化且已建立索引时返回其摘要"""
+        abs_path = os.path.abspath(path)
+        st = os.stat(abs_path)
+        row = self.db.execute(
+            "SELECT f.sha256 FROM files f JOIN docs d ON d.sha256 = f.sha256 "
+            "WHERE f.path = ? AND f.size = ? AND f.mtime_ns = ?",
+            (abs_path, st.st_size, st.st_mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def digest_of(self, path: str) -> Optional[str]:
+        try:
+            return self._lookup(path)
+        except OSError:
+            return None
+
+    def update(self, paths: Iterable[str], workers: int = 1) -> Dict:
+        """为新增或变化的文件建立索引，返回本次更新的统计"""
+        report = {"indexed": 0, "unchanged": 0, "failed": []}
+        stale = []
+        for path in paths:
+            try:
+                if self._lookup(path) is not None:
+                    report["unchanged"] += 1
+                    continue
+            except OSError as e:
+                report["failed"].append({"input": path, "error": str(e)})
+                continue
+            stale.append(path)
+
+        if not stale:
+            return report
+
+        if workers > 1 and len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [(path, pool.submit(extract_page_texts, path)) for path in stale]
+                for path, future in futures:
+                    self._store(path, future, report)
+        else:
+            for path in stale:
+                self._store(path, None, report)
+        return report
+
+    def _store(self, path: str, future, report: Dict):
+        abs_path = os.path.abspath(path)
+        try:
+            st = os.stat(abs_path)
+            sha, texts = future.result() if future is not None else extract_page_texts(abs_path)
+        except Exception as e:
+            report["failed"].append({"input": path, "error": str(e)})
+            return
+
+        with self.db:
+            known = self.db.execute("SELECT 1 FROM docs WHERE sha256 = ?", (sha,)).fetchone()
+            if not known:
+                for page_num, text in enumerate(texts):
+                    cur = self.db.execute("INSERT INTO pages (sha256, page, text) VALUES (?, ?, ?)",
+                                          (sha, page_num, text))
+                    if self.fts:
+                        self.db.execute("INSERT INTO pages_fts (rowid, text) VALUES (?, ?)",
+                                        (cur.lastrowid, normalize_text(text)))
+                self.db.execute("INSERT INTO docs (sha256, pages, indexed) VALUES (?, ?, ?)",
+                                (sha, len(texts), time.time()))
+            self.db.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                            (abs_path, st.st_size, st.st_mtime_ns, sha))
+        report["indexed"] += 1
+
+    def page_count(self, sha: str) -> int:
+        row = self.db.execute("SELECT pages FROM docs WHERE sha256 = ?", (sha,)).fetchone()
+        return row[0] if row else 0
+
+    def prune(self) -> int:
+        """删除已不存在的文件记录以及不再被任何文件引用的文档，返回删除的文档数"""
+        with self.db:
+            for (path,) in self.db.execute("SELECT path FROM files").fetchall():
+                if not os.path.exists(path):
+                    self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+            orphans = [row[0] for row in self.db.execute(
+                "SELECT sha256 FROM docs WHERE sha256 NOT IN (SELECT sha256 FROM files)")]
+            for sha in orphans:
+                if self.fts:
+                    for row_id, text in self.db.execute("SELECT id, text FROM pages WHERE sha256 = ?",
+                                                          (sha,)).fetchall():
+                        self.db.execute("INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', ?, ?)",
+                                        (row_id, normalize_text(text)))
+                self.db.execute("DELETE FROM pages WHERE sha256 = ?", (sha,))
+                self.db.execute("DELETE FROM docs WHERE sha256 = ?", (sha,))
+        return len(orphans)
+
+    def _candidate_rows(self, term: str) -> List[int]:
+        """包含规范化文本 term 的页面（大小写和整词限制留给精确计数）"""
+        if self.fts and len(term) >= _TRIGRAM_MIN:
+            phrase = '"' + term.replace('"', '""') + '"'
+            rows = self.db.execute("SELECT rowid FROM pages_fts WHERE pages_fts MATCH ?", (phrase,))
+        else:
+            rows = self.db.execute("SELECT id FROM pages WHERE instr(fold(text), ?) > 0", (term,))
+        return [row[0] for row in rows]
+
+    def _regex_rows(self, rule) -> List[int]:
+        self.db.create_function("rule_search", 1, lambda text: rule.compiled.search(text) is not None)
+        return [row[0] for row in self.db.execute("SELECT id FROM pages WHERE rule_search(text)")]
+
+    def match(self, matcher: RuleSet, digests: Optional[Iterable[str]] = None) -> Dict[str, Dict[int, Dict[int, int]]]:
+        """统计命中：{文档摘要: {页码: {规则下标: 次数}}}，只包含有命中的页面"""
+        wanted = set(digests) if digests is not None else None
+        candidates = set()
+        for term in matcher.literal_terms():
+            candidates.update(self._candidate_rows(term))
+        for rule in matcher.regex_rules():
+            candidates.update(self._regex_rows(rule))
+
+        result: Dict[str, Dict[int, Dict[int, int]]] = {}
+        ids = sorted(candidates)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT sha256, page, text FROM pages WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            for sha, page_num, text in rows:
+                if wanted is not None and sha not in wanted:
+                    continue
+                counts = matcher.count(normalize_text(text), text)
+                if counts:
+                    result.setdefault(sha, {})[page_num] = counts
+        return result
+
+    def scan(self, paths: List[str], replacements: List[Dict], matcher: Optional[RuleSet] = None) -> Dict:
+        """预演：不修改任何文件，按规则、文件和页面统计命中次数（paths 需已建立索引）"""
+        if matcher is None:
+            matcher = RuleSet.from_replacements(replacements)
+        digests = {path: self.digest_of(path) for path in paths}
+        matches = self.match(matcher, [d for d in digests.values() if d])
+
+        rules = [{"rule": idx, "old_text": r["old_text"], "count": 0, "files": 0}
+                 for idx, r in enumerate(replacements)]
+        files = []
+        for path, sha in digests.items():
+            if sha is None:
+                files.append({"input": path, "indexed": False})
+                continue
+            pages = matches.get(sha, {})
+            per_rule: Dict[int, int] = {}
+            for counts in pages.values():
+                for idx, count in counts.items():
+                    per_rule[idx] = per_rule.get(idx, 0) + count
+            for idx, count in per_rule.items():
+                rules[idx]["count"] += count
+                rules[idx]["files"] += 1
+            files.append({"input": path, "indexed": True, "matches": sum(per_rule.values()),
+                          "pages": {page: counts for page, counts in sorted(pages.items())}})
+        return {"rules": rules, "files": files,
+                "matching_files": sum(1 for f in files if f.get("matches"))}
@@ -1,46 +1,199 @@
 import os
 import logging
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+import fitz
+
 
 class FontManager:
-    def __init__(self, fonts_dir: str = "fonts"):
+    def __init__(self, fonts_dir: str = "fonts", max_cached_fonts: int = 32):
         self.fonts_dir = fonts_dir
         self.logger = logging.getLogger(__name__)
         self.loaded_fonts: Dict[str, str] = {}
-    
+        self.max_cached_fonts = max_cached_fonts
+        # 启动时扫描一次字体目录，之后按名称查表，不再逐次访问文件系统
+        self.font_index: Dict[str, str] = self._scan_fonts_dir()
+        # 已解析的字体（LRU）：名称 -> (fitz.Font, 字体文件内容)
+        self._font_cache: "OrderedDict[str, Tuple[fitz.Font, bytes]]" = OrderedDict()
+        # 字符宽度表：字体名 -> {字符: 字号为 1 时的前进宽度}，按需填充，所有文档共用
+        self._advances: Dict[str, Dict[str, float]] = {}
+        # 只用于测量的 Base-14 字体（不在字体目录中的字体名，如回退用的 helv）
+        self._builtin_fonts: Dict[str, fitz.Font] = {}
+
+    def _scan_fonts_dir(self) -> Dict[str, str]:
+        """扫描字体目录，建立 字体名 -> 文件路径 索引"""
+        index = {}
+        if not os.path.isdir(self.fonts_dir):
+            self.logger.warning(f"字体目录不存在: {self.fonts_dir}")
+            return index
+
+        for fname in os.listdir(self.fonts_dir):
+            name, ext = os.path.splitext(fname)
+            if ext.lower() == ".ttf":
+                index[name] = os.path.join(self.fonts_dir, fname)
+        self.logger.info(f"发现字体文件: {sorted(index)}")
+        return index
+
     def get_font_path(self, fontname: str) -> Optional[str]:
         """获取字体文件路径"""
-        font_file = os.path.join(self.fonts_dir, f"{fontname}.ttf")
-        
-        if os.path.exists(font_file):
-            return font_file
-        
-        self.logger.warning(f"字体文件不存在: {font_file}")
-        return None
-    
+        return self.font_index.get(fontname)
+
     def load_font(self, fontname: str) -> Optional[str]:
         """加载字体"""
         if fontname in self.loaded_fonts:
             return self.loaded_fonts[fontname]
-        
+
         font_path = self.get_font_path(fontname)
         if font_path:
             self.loaded_fonts[fontname] = font_path
             self.logger.info(f"成功加载字体: {fontname}")
             return font_path
-        
+
         self.logger.warning(f"无法加载字体: {fontname}, 使用默认字体")
         return None
-    
+
+    def get_font(self, fontname: str) -> Optional[Tuple[fitz.Font, bytes]]:
+        """获取已解析的字体及其文件内容，最近最少使用的字体会被淘汰"""
+        cached = self._font_cache.get(fontname)
+        if cached is not None:
+            self._font_cache.move_to_end(fontname)
+            return cached
+
+        font_path = self.get_font_path(fontname)
+        if font_path is None:
+            return None
+
+        try:
+            with open(font_path, "rb") as f:
+                buffer = f.read()
+            font = fitz.Font(fontbuffer=buffer)
+        except Exception as e:
+            self.logger.warning(f"字体文件解析失败: {font_path} - {e}")
+            self.font_index.pop(fontname, None)
+            return None
+
+        self._font_cache[fontname] = (font, buffer)
+        if len(self._font_cache) > self.max_cached_fonts:
+            self._font_cache.popitem(last=False)
+        return font, buffer
+
+    def glyph_advances(self, fontname: str) -> Dict[str, float]:
+        """字体的字符宽度表（字号为 1），由 DocumentFonts.text_width 填充"""
+        advances = self._advances.get(fontname)
+        if advances is None:
+            advances = self._advances[fontname] = {}
+        return advances
+
+    def measure_glyph(self, fontname: str, ch: str) -> float:
+        """从字体中读取一个字符的前进宽度（字号为 1）；字体目录中没有的字体按 Base-14 字体测量
+
+        Base-14 字体名（helv、Helvetica 等）插入页面时 PyMuPDF 总是使用内置字体、忽略字体文件，
+        因此即使字体目录中有同名文件也按内置字体测量，与实际写入的字形一致。
+        """
+        cached = None if fontname.lower() in fitz.Base14_fontdict else self.get_font(fontname)
+        if cached is not None:
+            return cached[0].glyph_advance(ord(ch))
+        font = self._builtin_fonts.get(fontname)
+        if font is None:
+            try:
+                font = fitz.Font(fontname)
+            except Exception:
+                font = fitz.Font("helv")
+            self._builtin_fonts[fontname] = font
+        return font.glyph_advance(ord(ch))
+
+    def for_document(self, doc) -> "DocumentFonts":
+        """为一个文档创建字体嵌入记录"""
+        return DocumentFonts(self, doc)
+
     def get_default_font(self) -> str:
         """获取默认字体"""
         return "Helvetica"
-    
+
     def get_font_for_replacement(self, fontname: str) -> str:
         """获取替换用的字体"""
         font_path = self.load_font(fontname)
-        
+
         if font_path:
             return fontname
-        
-        return self.get_default_font()
\ No newline at end of file
+
+        return self.get_default_font()
+
+
+class DocumentFonts:
+    """单个文档的字体嵌入记录
+
+    每种字体在一个文档中只嵌入一次，其他页面复用同一个字体对象；
+    同一页面上的多处命中不会重复调用 insert_font。font_reuses 为使用已嵌入字体的次数。
+    text_width 按 FontManager 中缓存的字符宽度测量文本，只有第一次遇到的
+    (字体, 字符) 才读取字体，命中和未命中次数记录在 glyph_cache_hits / glyph_cache_misses 中。
+    """
+
+    def __init__(self, manager: FontManager, doc):
+        self.manager = manager
+        self.doc = doc
+        self.xrefs: Dict[str, int] = {}
+        self._page_fonts: Set[Tuple[int, str]] = set()
+        self.embeds = 0
+        self.reuses = 0
+        self.glyph_hits = 0
+        self.glyph_misses = 0
+
+    def ensure(self, page, fontname: str, fallback: str = "helv") -> str:
+        """确保页面可以使用该字体，返回实际使用的字体名"""
+        key = (page.number, fontname)
+        if key in self._page_fonts:
+            self.reuses += 1
+            return fontname
+
+        cached = self.manager.get_font(fontname)
+        if cached is None:
+            return fallback
+
+        try:
+            # MuPDF 按字体内容去重：同一文档中再次插入只会在页面资源中引用已有对象
+            xref = page.insert_font(fontname, fontbuffer=cached[1])
+        except Exception as e:
+            self.manager.logger.warning(f"嵌入字体失败: {fontname} - {e}")
+            return fallback
+
+        self._page_fonts.add(key)
+        if fontname in self.xrefs:
+            self.reuses += 1
+        else:
+            self.xrefs[fontname] = xref
+            self.embeds += 1
+        return fontname
+
+    def text_width(self, fontname: str, text: str, fontsize: float) -> float:
+        """文本按该字体和字号书写时的宽度（不含字距调整）"""
+        advances = self.manager.glyph_advances(fontname)
+        width = 0.0
+        for ch in text:
+            advance = advances.get(ch)
+            if advance is None:
+                advance = advances[ch] = self.manager.measure_glyph(fontname, ch)
+                self.glyph_misses += 1
+            else:
+                self.glyph_hits += 1
+            width += advance
+        return width * fontsize
+
+    def subset(self):
+        """将文档中的字体裁剪为实际用到的字形"""
+        if not self.xrefs:
+            return
+        try:
+            self.doc.subset_fonts()
+        except Exception as e:
+            self.manager.logger.warning(f"字体子集化失败: {e}")
+
+    def report(self) -> Dict[str, int]:
+        report = {
+            "font_embeds": self.embeds,
+            "font_reuses": self.reuses,
+        }
+        if self.glyph_hits or self.glyph_misses:
+            report.update(glyph_cache_hits=self.glyph_hits, glyph_cache_misses=self.glyph_misses)
+        return report
@@ -0,0 +1,226 @@
+import os
+import sys
+import sqlite3
+import threading
+
+from PyQt5.QtWidgets import (
+    QApplication, QWidget, QLabel, QComboBox, QPushButton, QPlainTextEdit, QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox, QLineEdit,
+    QSpinBox, QProgressBar
+)
+from PyQt5.QtCore import Qt, pyqtSignal, QObject, QTimer
+
+from batch_engine import BatchEngine, default_worker_count
+from main import (
+    format_stats, list_config_files, load_config, open_corpus_index, open_result_cache, processing_options,
+    replace_text_in_pdf, resource_path
+)
+from progress import LogBuffer, ProgressTracker, RunControl
+from rule_set import RuleSet
+
+
+# 日志和进度的刷新间隔（毫秒）：后台线程只写缓冲，界面线程定时批量显示
+REFRESH_INTERVAL_MS = 200
+
+# 日志区最多保留的行数
+MAX_LOG_LINES = 10000
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal()
+
+def run_qt_gui():
+    app = QApplication(sys.argv)
+    window = QWidget()
+    window.setWindowTitle('PDF批量文字替换工具 (Qt)')
+    window.setGeometry(200, 200, 600, 350)
+
+    # 配置文件下拉
+    configs = list_config_files()
+    config_label = QLabel('选择配置文件:')
+    config_combo = QComboBox()
+    config_combo.addItems(configs)
+
+    # PDF目录选择
+    pdf_dir_label = QLabel('选择PDF目录:')
+    pdf_dir_edit = QLineEdit()
+    pdf_dir_edit.setReadOnly(True)
+    pdf_dir_btn = QPushButton('浏览')
+    def choose_pdf_dir():
+        d = QFileDialog.getExistingDirectory(window, '选择PDF目录')
+        if d:
+            pdf_dir_edit.setText(d)
+    pdf_dir_btn.clicked.connect(choose_pdf_dir)
+    pdf_dir_layout = QHBoxLayout()
+    pdf_dir_layout.addWidget(pdf_dir_edit)
+    pdf_dir_layout.addWidget(pdf_dir_btn)
+
+    # 并行进程数
+    workers_label = QLabel('并行进程数:')
+    workers_spin = QSpinBox()
+    workers_spin.setRange(1, max(64, default_worker_count()))
+    workers_spin.setValue(default_worker_count())
+    workers_layout = QHBoxLayout()
+    workers_layout.addWidget(workers_label)
+    workers_layout.addWidget(workers_spin)
+
+    # 日志区：后台线程写入缓冲，定时器每次把积累的日志一次性追加并滚动一次
+    log_edit = QPlainTextEdit()
+    log_edit.setReadOnly(True)
+    log_edit.setMaximumBlockCount(MAX_LOG_LINES)
+    log_buffer = LogBuffer()
+    def log(msg):
+        log_buffer.append(msg)
+
+    # 进度
+    progress_bar = QProgressBar()
+    progress_bar.setRange(0, 1)
+    progress_bar.setValue(0)
+    status_label = QLabel('')
+    state = {"tracker": None, "control": None}
+
+    def refresh():
+        lines = log_buffer.drain()
+        if lines:
+            log_edit.appendPlainText('\n'.join(lines))
+            sb = log_edit.verticalScrollBar()
+            if sb:
+                sb.setValue(sb.maximum())
+        tracker = state["tracker"]
+        if tracker is not None:
+            snap = tracker.snapshot()
+            progress_bar.setValue(snap["files_done"])
+            status = tracker.summary_line()
+            control = state["control"]
+            if control is not None and control.cancelled:
+                status += '（正在取消…）'
+            elif control is not None and control.paused:
+                status += '（已暂停）'
+            status_label.setText(status)
+    timer = QTimer(window)
+    timer.setInterval(REFRESH_INTERVAL_MS)
+    timer.timeout.connect(refresh)
+    
+    # 处理、暂停和取消按钮
+    start_btn = QPushButton('开始处理')
+    pause_btn = QPushButton('暂停')
+    pause_btn.setEnabled(False)
+    cancel_btn = QPushButton('取消')
+    cancel_btn.setEnabled(False)
+    def toggle_pause():
+        control = state["control"]
+        if control is None:
+            return
+        if control.paused:
+            control.resume()
+            pause_btn.setText('暂停')
+            log('继续处理')
+        else:
+            control.pause()
+            pause_btn.setText('继续')
+            log('已暂停：正在处理的文件会在下一页之前等待')
+    pause_btn.clicked.connect(toggle_pause)
+    def cancel():
+        control = state["control"]
+        if control is None or control.cancelled:
+            return
+        control.cancel()
+        pause_btn.setEnabled(False)
+        cancel_btn.setEnabled(False)
+        log('正在取消：未完成的文件不会写出输出')
+    cancel_btn.clicked.connect(cancel)
+    
+    signals = WorkerSignals()
+    def on_finished():
+        control = state["control"]
+        log('已取消。' if control is not None and control.cancelled else '全部处理完成!')
+        refresh()
+        timer.stop()
+        state["control"] = None
+        start_btn.setEnabled(True)
+        pause_btn.setEnabled(False)
+        pause_btn.setText('暂停')
+        cancel_btn.setEnabled(False)
+    signals.finished.connect(on_finished)
+    
+    def start_process():
+        config_file = config_combo.currentText()
+        pdf_dir = pdf_dir_edit.text()
+        if not config_file or not pdf_dir:
+            QMessageBox.critical(window, '错误', '请先选择配置文件和PDF目录')
+            return
+        config_path = os.path.join('configs', config_file)
+        output_dir = os.path.join(pdf_dir, 'output')
+        # 配置或参数有误时在槽函数中提示并返回，按钮状态保持不变
+        try:
+            config = load_config(config_path)
+            replacements = config.get('replacements')
+            if not isinstance(replacements, list):
+                raise ValueError('配置文件缺少 replacements 列表')
+            # 规则有误（如正则表达式无效）时在处理任何文件之前报错
+            RuleSet.from_replacements(replacements)
+            pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
+            if not pdf_files:
+                QMessageBox.information(window, '提示', '所选目录下没有PDF文件')
+                return
+            os.makedirs(output_dir, exist_ok=True)
+            jobs = [(os.path.join(pdf_dir, fname), os.path.join(output_dir, fname)) for fname in pdf_files]
+            control = RunControl()
+            engine = BatchEngine(replace_text_in_pdf, replacements,
+                                 fonts_dir=resource_path('fonts'), workers=workers_spin.value(),
+                                 shard_pages=config.get('shard_pages'), options=processing_options(config),
+                                 cache=open_result_cache(config), index=open_corpus_index(config),
+                                 control=control, prefetch=config.get('prefetch'),
+                                 write_behind=config.get('write_behind'))
+        except (ValueError, OSError, sqlite3.Error) as e:
+            # 缓存目录或索引数据库无法打开、已损坏时同样提示
+            QMessageBox.critical(window, '错误', f'无法开始处理: {e}')
+            return
+        tracker = ProgressTracker(len(jobs), control)
+        state.update(tracker=tracker, control=control)
+        progress_bar.setRange(0, len(jobs))
+        progress_bar.setValue(0)
+        start_btn.setEnabled(False)
+        pause_btn.setEnabled(True)
+        cancel_btn.setEnabled(True)
+        timer.start()
+        def worker():
+            log(f'开始处理 {len(jobs)} 个文件，并行进程数: {engine.workers}')
+            try:
+                for result in engine.run(jobs):
+                    tracker.add_result(result)
+                    fname = os.path.basename(result['input'])
+                    if result.get('cancelled'):
+                        log(f'已取消: {fname}')
+                    elif result.get('cached'):
+                        log(f'使用缓存: {fname}')
+                    elif result.get('unchanged'):
+                        log(f'无命中，原样复制: {fname}')
+                    elif result['ok']:
+                        log(f'完成: {fname} ({result["elapsed"]:.2f}s) {format_stats(result.get("stats"))}')
+                    else:
+                        log(f'失败: {fname} 错误: {result["error"]}')
+            except Exception as e:
+                log(f'批处理异常: {e}')
+            log(tracker.summary_line())
+            signals.finished.emit()
+        threading.Thread(target=worker, daemon=True).start()
+    start_btn.clicked.connect(start_process)
+
+    # 布局
+    layout = QVBoxLayout()
+    layout.addWidget(config_label)
+    layout.addWidget(config_combo)
+    layout.addWidget(pdf_dir_label)
+    layout.addLayout(pdf_dir_layout)
+    layout.addLayout(workers_layout)
+    layout.addWidget(log_edit)
+    layout.addWidget(progress_bar)
+    layout.addWidget(status_label)
+    buttons_layout = QHBoxLayout()
+    buttons_layout.addWidget(start_btn)
+    buttons_layout.addWidget(pause_btn)
+    buttons_layout.addWidget(cancel_btn)
+    layout.addLayout(buttons_layout)
+    window.setLayout(layout)
+    window.show()
+    sys.exit(app.exec_())
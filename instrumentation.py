@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+
+# 处理流程的阶段；rewrite 为内容流改写引擎（见 content_stream.py）
+STAGES = ("open", "extract", "search", "style", "font", "redact", "insert", "rewrite", "verify", "save")
+
+# 只影响观测、不影响输出的处理参数，不参与结果缓存键
+INSTRUMENTATION_OPTION_KEYS = ("trace", "profile_dir")
+
+# perf_counter 与墙上时钟的差值，用于把各进程的计时换算到同一时间轴
+_WALL_OFFSET = time.time() - time.perf_counter()
+
+_profile_seq = 0
+
+
+def stage_key(name: str) -> str:
+    return f"stage_{name}_seconds"
+
+
+class Instrumentation:
+    """单个文件处理过程的分阶段计时和计数器
+
+    stage() 累计各阶段耗时，count() 累加计数器，stats() 把结果展开为
+    stage_<阶段>_seconds 等扁平字段，可直接合并到处理统计中（分片和流式窗口
+    的统计按数值相加即可汇总）。trace 为真时同时记录 Chrome trace 事件，
+    事件带进程号和绝对时间，多个工作进程的事件可以直接合并到一个文件。
+    """
+
+    def __init__(self, label: str = "", trace: bool = False):
+        self.label = label
+        self.trace = trace
+        self.seconds: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.events: List[Dict] = []
+
+    @contextmanager
+    def stage(self, name: str, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, start, **args)
+
+    def add(self, name: str, seconds: float, start: Optional[float] = None, **args):
+        """记录一段在别处测得的耗时；start 为其 perf_counter 起点（用于 trace）"""
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if self.trace:
+            if start is None:
+                start = time.perf_counter() - seconds
+            if self.label:
+                args["file"] = self.label
+            self.events.append({"name": name, "cat": "stage", "ph": "X",
+                                "ts": (start + _WALL_OFFSET) * 1e6, "dur": seconds * 1e6,
+                                "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def stats(self) -> Dict:
+        stats: Dict = {stage_key(name): seconds for name, seconds in self.seconds.items()}
+        stats.update(self.counters)
+        if self.trace:
+            stats["trace_events"] = list(self.events)
+        return stats
+
+
+def stage_seconds(stats: Dict) -> Dict[str, float]:
+    """从处理统计中取出各阶段耗时 {阶段: 秒}"""
+    return {name: stats[stage_key(name)] for name in STAGES if stage_key(name) in stats}
+
+
+def format_stage_seconds(stats: Dict, limit: int = 3) -> str:
+    """耗时最多的几个阶段，如 "redact 1.20s / save 0.30s"，没有计时时返回空串"""
+    seconds = sorted(stage_seconds(stats).items(), key=lambda item: -item[1])[:limit]
+    return " / ".join(f"{name} {value:.2f}s" for name, value in seconds if value > 0)
+
+
+def metrics_record(result: Dict) -> Dict:
+    """单个文件结果对应的一行指标"""
+    stats = result.get("stats") or {}
+    record = {
+        "input": result.get("input"),
+        "output": result.get("output"),
+        "ok": result.get("ok"),
+        "elapsed": result.get("elapsed"),
+        "cached": bool(result.get("cached")),
+        "unchanged": bool(result.get("unchanged")),
+        "pages": stats.get("pages", 0),
+        "skipped_pages": stats.get("skipped_pages", 0),
+        "hits": stats.get("hits", 0),
+        "replacements": stats.get("replacements", 0),
+    }
+    for key in ("glyph_cache_hits", "glyph_cache_misses", "fitted_insertions", "fit_overflows"):
+        if key in stats:
+            record[key] = stats[key]
+    record.update({f"{name}_seconds": value for name, value in stage_seconds(stats).items()})
+    return record
+
+
+class MetricsWriter:
+    """把每个文件的指标按 JSON lines 写入文件，并汇总各阶段总耗时"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8") if path else None
+        self.totals: Dict[str, float] = {}
+        self.events: List[Dict] = []
+
+    def add(self, result: Dict):
+        """记录一个文件结果；结果中的 trace 事件取出单独保存，不再留在统计里"""
+        stats = result.get("stats") or {}
+        self.events.extend(stats.pop("trace_events", None) or [])
+        for name, value in stage_seconds(stats).items():
+            self.totals[name] = self.totals.get(name, 0.0) + value
+        if self._file is not None:
+            self._file.write(json.dumps(metrics_record(result), ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def write_chrome_trace(events: Iterable[Dict], path: str):
+    """写出 Chrome trace 格式（chrome://tracing 或 Perfetto 可打开）"""
+    events = list(events)
+    pids = sorted({event["pid"] for event in events})
+    metadata = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"pid {pid}"}}
+                for pid in pids]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+@contextmanager
+def profiled(profile_dir: Optional[str], label: str = "run"):
+    """profile_dir 不为空时用 cProfile 剖析代码块，结果写到 <profile_dir>/<label>-<pid>-<序号>.prof"""
+    if not profile_dir:
+        yield
+        return
+    global _profile_seq
+    _profile_seq += 1
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(label))[0] or "run"
+        profiler.dump_stats(os.path.join(profile_dir, f"{name}-{os.getpid()}-{_profile_seq}.prof"))
@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# 默认的预读深度（提前读入内存的文件数）和后台写出队列深度
+DEFAULT_PREFETCH_DEPTH = 2
+DEFAULT_WRITE_DEPTH = 2
+
+
+def check_depth(name: str, value: Optional[int]) -> int:
+    """队列深度：None 或 0 表示不启用该阶段"""
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{name} 应该是非负整数: {value}")
+    return value
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def atomic_write(path: str, data: bytes):
+    """先写到同目录下的临时文件，再用 os.replace 替换，目标文件不会出现写了一半的状态"""
+    parent = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Prefetcher:
+    """预读：在后台线程中提前把即将处理的输入文件读入内存
+
+    任务序列本身在调用方线程中推进（上游的缓存、索引筛选不会跨线程使用），
+    只有文件读取在后台进行；最多提前 depth 个任务。path_of(item) 返回要读取的路径，
+    返回 None 的任务（例如页码分片）不预读。读取失败时数据为 None，
+    由处理流程照常按路径打开并报告错误。
+    """
+
+    def __init__(self, items: Iterable, depth: int = DEFAULT_PREFETCH_DEPTH,
+                 path_of: Callable = lambda item: item[0]):
+        self.depth = max(1, depth)
+        self.path_of = path_of
+        self._items = iter(items)
+        self._window: Deque[Tuple] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-prefetch")
+        self.logger = logging.getLogger(__name__)
+
+    def _fill(self):
+        while len(self._window) < self.depth:
+            try:
+                item = next(self._items)
+            except StopIteration:
+                return
+            path = self.path_of(item)
+            future = self._executor.submit(read_file, path) if path is not None else None
+            self._window.append((item, future))
+
+    def __iter__(self) -> Iterator[Tuple]:
+        """产出 (任务, 预读的字节或 None)"""
+        try:
+            self._fill()
+            while self._window:
+                item, future = self._window.popleft()
+                # 先补充窗口，后台线程在调用方处理当前文件时继续读取下一个
+                self._fill()
+                data = None
+                if future is not None:
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        self.logger.warning(f"预读失败，改为直接打开: {self.path_of(item)} - {e}")
+                yield item, data
+        finally:
+            self.close()
+
+    def remaining(self) -> List:
+        """不再预读，返回尚未取出的任务（用于取消或中止）"""
+        items = [item for item, _future in self._window]
+        self._window.clear()
+        items.extend(self._items)
+        self.close()
+        return items
+
+    def close(self):
+        for _item, future in self._window:
+            if future is not None:
+                future.cancel()
+        self._executor.shutdown(wait=False)
+
+
+class WriteBehind:
+    """后台写出：处理结果先序列化到内存，由单独的线程原子写入目标文件
+
+    调用方随即开始处理下一个文件。最多 depth 个写出在排队，
+    超过时 put 会等待最早的一个完成。文件的结果在其输出写完之后才返回，
+    因此之后读取输出（例如写入结果缓存）总能看到完整的文件。
+    写出耗时计入统计中的 save 阶段（stage_save_seconds）。
+    """
+
+    def __init__(self, depth: int = DEFAULT_WRITE_DEPTH):
+        self.depth = max(1, depth)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-write")
+        self._pending: Deque[Tuple[Dict, Future]] = deque()
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> float:
+        start = time.perf_counter()
+        atomic_write(path, data)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _finish(result: Dict, future: Future) -> Dict:
+        try:
+            seconds = future.result()
+        except Exception as e:
+            result.update(ok=False, error=f"写出失败: {e}")
+            return result
+        stats = result.get("stats")
+        if isinstance(stats, dict):
+            stats["stage_save_seconds"] = stats.get("stage_save_seconds", 0.0) + seconds
+        result["elapsed"] = result.get("elapsed", 0.0) + seconds
+        return result
+
+    def put(self, result: Dict, path: str, data: bytes) -> List[Dict]:
+        """排队写出 data，返回此时已经写完的文件结果（按提交顺序）"""
+        self._pending.append((result, self._executor.submit(self._write, path, data)))
+        finished = self.ready()
+        while len(self._pending) > self.depth:
+            finished.append(self._finish(*self._pending.popleft()))
+        return finished
+
+    def ready(self) -> List[Dict]:
+        finished = []
+        while self._pending and self._pending[0][1].done():
+            finished.append(self._finish(*self._pending.popleft()))
+        return finished
+
+    def drain(self) -> List[Dict]:
+        """等待所有写出完成"""
+        finished = []
+        while self._pending:
+            finished.append(self._finish(*self._pending.popleft()))
+        return finished
+
+    def close(self):
+        self.drain()
+        self._executor.shutdown(wait=True)
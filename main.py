@@ -1,315 +1,727 @@
+import time
+# 冷启动计时起点：模块开始导入的时刻
+_MODULE_STARTED = time.perf_counter()
+
 import os
-import os
+# 命令行模式下标准输出只用于 JSON 状态，PyMuPDF 自身的提示信息写到标准错误
+os.environ.setdefault("PYMUPDF_MESSAGE", "fd:2")
 import json
 import fitz
 import sys
-from PyQt5.QtWidgets import (
-    QApplication, QWidget, QLabel, QComboBox, QPushButton, QTextEdit, QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox, QLineEdit
+import glob
+import logging
+import argparse
+import multiprocessing
+
+from batch_engine import BatchEngine, default_worker_count
+from content_stream import ContentStreamRewriter, check_engine
+from corpus_index import CorpusIndex
+from font_manager import FontManager
+from instrumentation import Instrumentation, MetricsWriter, format_stage_seconds, write_chrome_trace
+from redaction import apply_page_redactions, check_redact_mode
+from result_cache import DEFAULT_MAX_BYTES, ResultCache
+from save_profiles import get_save_profile, is_file_object, save_document
+from template_cache import LayoutCache
+from text_fit import check_fit_mode, fit_text
+from streaming import (
+    DEFAULT_WINDOW_PAGES, WindowedProcessor, count_source_pages, describe_source, open_pdf, source_size
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QObject
-import threading
+from page_index import PageLayoutIndex
+from progress import checkpoint
+from rule_set import RuleSet
+from text_matcher import TEXTPAGE_FLAGS, PageText
 
 
-class WorkerSignals(QObject):
-    log = pyqtSignal(str)
-    finished = pyqtSignal()
+logger = logging.getLogger(__name__)
 
 def resource_path(relative_path):
     # 始终使用 exe 所在目录，确保读取 exe 同级 configs
     base_path = os.path.dirname(os.path.abspath(sys.argv[0]))
-    abs_path = os.path.join(base_path, relative_path)
-    print(f"[DEBUG] resource_path('{relative_path}') => {abs_path}")
-    return abs_path
+    return os.path.join(base_path, relative_path)
 
 def list_config_files():
     config_dir_path = resource_path('configs')
-    print(f"[启动] 扫描配置目录: {config_dir_path}")
-    parent_dir = os.path.dirname(config_dir_path)
-    if os.path.exists(parent_dir):
-        print(f"[启动] 配置目录父目录内容: {os.listdir(parent_dir)}")
-    else:
-        print(f"[启动] 配置目录父目录不存在: {parent_dir}")
+    logger.info(f"扫描配置目录: {config_dir_path}")
     if not os.path.exists(config_dir_path):
-        print(f"[启动] 配置目录不存在: {config_dir_path}")
+        logger.warning(f"配置目录不存在: {config_dir_path}")
         return []
     files = [f for f in os.listdir(config_dir_path) if f.endswith('.json')]
-    print(f"[启动] 发现配置文件: {files}")
+    logger.info(f"发现配置文件: {files}")
     return files
 
-def select_config():
-    configs = list_config_files()
-    if not configs:
-        print('No config files found.')
-        exit(1)
-    print('Available config files:')
-    for idx, name in enumerate(configs):
-        print(f'{idx + 1}: {name}')
-    choice = int(input('Select config file number: ')) - 1
-    if choice < 0 or choice >= len(configs):
-        print('Invalid choice.')
-        exit(1)
-    return os.path.join('configs', configs[choice])
+# 配置文件中的可选处理参数，原样传给 replace_text_in_pdf
+PROCESSING_OPTION_KEYS = ("subset_fonts", "verify", "save_profile", "redact_mode", "engine", "fit_mode",
+                          "window_pages", "memory_limit_mb", "trace", "profile_dir")
+
+def processing_options(config):
+    # 参数写错时尽早报错，而不是每个文件各失败一次
+    get_save_profile(config.get('save_profile'))
+    check_redact_mode(config.get('redact_mode', 'full'))
+    check_fit_mode(config.get('fit_mode', 'none'))
+    check_engine(config.get('engine', 'redact'))
+    for key, types in (('window_pages', int), ('memory_limit_mb', (int, float))):
+        value = config.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, types) or value <= 0):
+            raise ValueError(f"{key} 应该是正数: {value}")
+    return {key: config[key] for key in PROCESSING_OPTION_KEYS if key in config}
+
+def open_result_cache(config):
+    """按配置中的 cache_dir / cache_max_mb 打开结果缓存，未配置时返回 None"""
+    cache_dir = config.get('cache_dir')
+    if not cache_dir:
+        return None
+    max_mb = config.get('cache_max_mb')
+    return ResultCache(cache_dir, int(max_mb * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES)
+
+def open_corpus_index(config):
+    """按配置中的 index_db 打开语料索引，未配置时返回 None"""
+    index_db = config.get('index_db')
+    return CorpusIndex(index_db) if index_db else None
 
 def load_config(config_path):
     abs_path = resource_path(config_path)
-    print(f"[DEBUG] 尝试加载配置文件: {abs_path}")
+    logger.debug(f"加载配置文件: {abs_path}")
     if not os.path.exists(abs_path):
-        print(f"[ERROR] 配置文件不存在: {abs_path}")
+        logger.error(f"配置文件不存在: {abs_path}")
     with open(abs_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def verify_and_clean_pdf(pdf_path, replacements):
-    """验证PDF并清理残留的原始文本"""
-    try:
-        temp_doc = fitz.open(pdf_path)
-        cleaned = False
-        
-        for page_num in range(len(temp_doc)):
-            page = temp_doc[page_num]
-            
-            # 检查是否还能找到原始文本
-            for replacement in replacements:
-                old_text = replacement['old_text']
-                
-                # 搜索文本实例
-                text_instances = page.search_for(old_text)
-                if text_instances:
-                    print(f"[WARNING] 在页面 {page_num} 仍找到原始文本: '{old_text}'")
-                    cleaned = True
-                    
-                    # 对每个找到的实例进行彻底清理
-                    for inst in text_instances:
-                        # 方法1: 多层白色覆盖
-                        padding = 3
-                        cover_rect = fitz.Rect(
-                            inst.x0 - padding, inst.y0 - padding,
-                            inst.x1 + padding, inst.y1 + padding
-                        )
-                        
-                        # 第一层：纯白覆盖
-                        page.draw_rect(cover_rect, color=(1,1,1), fill=(1,1,1), width=0, overlay=True)
-                        
-                        # 第二层：背景色覆盖（假设白色背景）
-                        page.draw_rect(cover_rect, color=(1,1,1), fill=(1,1,1), width=0, overlay=True)
-                        
-                        # 第三层：使用空白字符填充
-                        blank_text = " " * len(old_text)
-                        page.insert_text(
-                            (inst.x0, inst.y1),
-                            blank_text,
-                            fontname="Helvetica",
-                            fontsize=12,
-                            color=(1,1,1)
-                        )
-                        
-                        # 第四层：再次覆盖
-                        page.draw_rect(cover_rect, color=(1,1,1), fill=(1,1,1), width=0, overlay=True)
-                        
-                        # 第五层：添加标记
-                        page.insert_text(
-                            (inst.x0, inst.y1 + 15),
-                            "[已清除]",
-                            fontname="Helvetica",
-                            fontsize=6,
-                            color=(0.8, 0.8, 0.8)
-                        )
+def clean_residual_text(page, inst, old_text):
+    """多层白色覆盖残留的原始文本"""
+    padding = 3
+    cover_rect = fitz.Rect(
+        inst.x0 - padding, inst.y0 - padding,
+        inst.x1 + padding, inst.y1 + padding
+    )
+    
+    # 第一层：纯白覆盖
+    page.draw_rect(cover_rect, color=(1,1,1), fill=(1,1,1), width=0, overlay=True)
+    
+    # 第二层：背景色覆盖（假设白色背景）
+    page.draw_rect(cover_rect, color=(1,1,1), fill=(1,1,1), width=0, overlay=True)
+    
+    # 第三层：使用空白字符填充
+    blank_text = " " * len(old_text)
+    page.insert_text(
+        (inst.x0, inst.y1),
+        blank_text,
+        fontname="Helvetica",
+        fontsize=12,
+        color=(1,1,1)
+    )
+    
+    # 第四层：再次覆盖
+    page.draw_rect(cover_rect, color=(1,1,1), fill=(1,1,1), width=0, overlay=True)
+    
+    # 第五层：添加标记
+    page.insert_text(
+        (inst.x0, inst.y1 + 15),
+        "[已清除]",
+        fontname="Helvetica",
+        fontsize=6,
+        color=(0.8, 0.8, 0.8)
+    )
+
+def _is_inserted_text(page, hit, matcher, inserted):
+    """命中是否落在本次插入的新文本上（new_text 本身也能被该规则命中的情况）"""
+    for rect, new_text in inserted:
+        if not matcher.rule_matches(hit.rule_index, new_text):
+            continue
+        # 新文本从 rect.x0 开始向右书写，宽度可能超出原矩形
+        inserted_rect = fitz.Rect(rect.x0, rect.y0, page.rect.x1, rect.y1)
+        if any(inserted_rect.intersects(r) for r in hit.rects):
+            return True
+    return False
+
+def verify_doc(doc, replacements, matcher, modified):
+    """在仍处于打开状态的文档上验证替换结果，发现残留的原始文本时就地清理
+
+    modified 为 {页码: [(命中矩形, new_text), ...]}，只检查这些页面。
+    返回结构化的验证报告。
+    """
+    report = {"verified_pages": 0, "residual_hits": 0, "residual": []}
+    
+    for page_num, inserted in modified.items():
+        page = doc[page_num]
+        report["verified_pages"] += 1
         
-        if cleaned:
-            print("[INFO] 清理了残留的原始文本")
-            temp_doc.save(pdf_path, garbage=5, deflate=True, clean=2, incremental=False)
-        else:
-            print("[INFO] 验证通过，未发现残留原始文本")
-            temp_doc.save(pdf_path, garbage=4, deflate=True, clean=1)
+        textpage = page.get_textpage(flags=TEXTPAGE_FLAGS)
+        if not matcher.page_may_match(page, textpage):
+            continue
         
-        temp_doc.close()
-        return cleaned
-    except Exception as e:
-        print(f"[ERROR] 验证和清理失败: {e}")
-        return False
+        for hit in matcher.search_page(PageText.from_page(page, textpage)):
+            old_text = replacements[hit.rule_index]['old_text']
+            if _is_inserted_text(page, hit, matcher, inserted):
+                continue
+            
+            report["residual_hits"] += 1
+            report["residual"].append({
+                "page": page_num,
+                "old_text": old_text,
+                "rects": [tuple(r) for r in hit.rects],
+            })
+            for inst in hit.rects:
+                clean_residual_text(page, inst, hit.text)
+    
+    return report
 
-def replace_text_in_pdf(input_pdf, output_pdf, replacements):
-    """使用redaction彻底删除原始文本，确保不可恢复"""
-    doc = fitz.open(input_pdf)
-    fonts_dir = resource_path('fonts')
+def verify_and_clean_pdf(pdf_path, replacements, matcher=None):
+    """验证已保存的PDF并清理残留的原始文本，返回验证报告
+
+    只有发现残留时才写回文件（完整保存，清理后的原文不会留在旧版本中）。处理流程中应优先使用
+    replace_text_in_pdf(..., verify=True)，在保存前完成验证。
+    """
+    if matcher is None:
+        matcher = RuleSet.from_replacements(replacements)
     
-    for page_num in range(len(doc)):
+    doc = fitz.open(pdf_path)
+    try:
+        report = verify_doc(doc, replacements, matcher, {p: [] for p in range(len(doc))})
+        if report["residual_hits"]:
+            save_document(doc, pdf_path)
+    finally:
+        if not doc.is_closed:
+            doc.close()
+    return report
+
+def span_style(span):
+    """替换文字沿用的样式：原文所在 span 的字体、字号和颜色，找不到 span 时为 None"""
+    if not span:
+        return None
+    return {"font": span.get("font", "helv"), "size": span.get("size", 12), "color": span.get("color", 0)}
+
+def replace_text_in_doc(doc, replacements, matcher=None, fonts_dir=None, pages=None,
+                        font_manager=None, subset_fonts=False, verify=False, redact_mode="full",
+                        engine="redact", candidate_pages=None, instrumentation=None, layout_cache=None,
+                        fit_mode="none"):
+    """在已打开的文档上执行替换（不保存），返回统计信息；verify 为真时合并 verify_doc 的验证报告
+
+    pages 为要处理的页码（默认全部页面），其余参数的含义同 replace_text_in_pdf。
+    """
+    instr = instrumentation or Instrumentation()
+    if font_manager is None:
+        font_manager = FontManager(fonts_dir or resource_path('fonts'))
+    doc_fonts = font_manager.for_document(doc)
+    if matcher is None:
+        matcher = RuleSet.from_replacements(replacements)
+    if layout_cache is None:
+        layout_cache = LayoutCache()
+    if pages is None:
+        pages = range(len(doc))
+    check_redact_mode(redact_mode)
+    check_fit_mode(fit_mode)
+    rewriter = ContentStreamRewriter(doc, matcher) if check_engine(engine) == "stream" else None
+    stats = {"pages": 0, "skipped_pages": 0, "hits": 0, "replacements": 0,
+             "redact_seconds": 0.0, "redact_pages": []}
+    if rewriter is not None:
+        stats.update({"stream_pages": 0, "stream_fallback_pages": 0})
+    if fit_mode != "none":
+        stats.update({"fitted_insertions": 0, "fit_overflows": 0})
+    candidates = set(candidate_pages) if candidate_pages is not None else None
+    modified = {}
+    
+    for page_num in pages:
+        checkpoint()
+        stats["pages"] += 1
+        if candidates is not None and page_num not in candidates:
+            stats["skipped_pages"] += 1
+            continue
         page = doc[page_num]
         page_replacements = []
         
-        for replacement in replacements:
-            old_text = replacement['old_text']
-            new_text = replacement['new_text']
-            text_instances = page.search_for(old_text)
-            text_dict = page.get_text("dict")
-            
-            for inst in text_instances:
-                matched_span = None
-                if "blocks" in text_dict:
-                    for block in text_dict["blocks"]:
-                        if "lines" not in block:
-                            continue
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                span_bbox = fitz.Rect(span["bbox"])
-                                if span_bbox.intersects(inst) and old_text in span.get("text", ""):
-                                    matched_span = span
-                                    break
-                            if matched_span:
-                                break
-                        if matched_span:
-                            break
+        # 预筛选：纯文本中不含任何规则文本的页面直接跳过，不做布局提取
+        with instr.stage("extract", page=page_num):
+            textpage = page.get_textpage(flags=TEXTPAGE_FLAGS)
+            plain_text = matcher.page_texts(page, textpage)
+        with instr.stage("search", page=page_num):
+            may_match = matcher.contains_any(*plain_text)
+        if not may_match:
+            stats["skipped_pages"] += 1
+            continue
+        
+        if rewriter is not None:
+            with instr.stage("rewrite", page=page_num):
+                expected = matcher.count(*plain_text)
+                count = rewriter.rewrite_page(page, expected, plain_text)
+            if count is not None:
+                stats["stream_pages"] += 1
+                stats["hits"] += sum(expected.values())
+                stats["replacements"] += count
+                # 内容流改写后新文本与原文位置一致，验证时按整页排除新文本中的命中
+                modified[page_num] = [(page.rect, replacements[idx]['new_text']) for idx in expected]
+                continue
+            stats["stream_fallback_pages"] += 1
+        
+        # 模板化页面：指纹相同且命中位置一致时直接复用缓存的命中矩形和样式
+        with instr.stage("search", page=page_num):
+            cache_key = layout_cache.key(page, matcher)
+            counts = matcher.count(*plain_text)
+            cached = layout_cache.lookup(cache_key, textpage, plain_text, counts, matcher)
+        
+        if cached is not None:
+            instr.count("layout_cache_hits")
+            hits = [(item["rect"], item["new_text"], item["style"]) for item in cached]
+            stats["hits"] += len(cached)
+        else:
+            instr.count("layout_cache_misses")
+            # 每页只提取一次字符流，所有规则在一次扫描中完成匹配
+            with instr.stage("extract", page=page_num):
+                page_text = PageText.from_page(page, textpage)
+            with instr.stage("search", page=page_num):
+                found = matcher.search_page(page_text)
+            hits = []
+            with instr.stage("style", page=page_num):
+                layout = PageLayoutIndex(page_text.raw) if found else None
+                styles = []
+                for hit in found:
+                    hit_styles = [span_style(layout.find_span(inst, hit.text)) for inst in hit.rects]
+                    styles.append(hit_styles[0])
+                    hits.extend((inst, hit.new_text, style) for inst, style in zip(hit.rects, hit_styles))
+            layout_cache.store(cache_key, counts, found, styles)
+            stats["hits"] += len(found)
+        
+        for inst, new_text, style in hits:
+            if style:
+                with instr.stage("font", page=page_num):
+                    fontname = doc_fonts.ensure(page, style["font"])
                 
-                if matched_span:
-                    fontname = matched_span.get("font", "helv")
-                    fontsize = matched_span.get("size", 12)
-                    color = matched_span.get("color", 0)
-                    
-                    font_file = os.path.join(fonts_dir, f"{fontname}.ttf")
-                    if os.path.exists(font_file):
-                        try:
-                            page.insert_font(fontname, fontfile=font_file)
-                        except:
-                            fontname = "helv"
-                    else:
-                        fontname = "helv"
-                    
-                    page_replacements.append({
-                        "rect": inst,
-                        "new_text": new_text,
-                        "fontname": fontname,
-                        "fontsize": fontsize,
-                        "color": color
-                    })
+                page_replacements.append({
+                    "rect": fitz.Rect(inst),
+                    "new_text": new_text,
+                    "fontname": fontname,
+                    "fontsize": style["size"],
+                    "color": style["color"]
+                })
         
-        for item in page_replacements:
-            page.add_redact_annot(item["rect"], fill=(1, 1, 1))
+        if not page_replacements:
+            continue
         
-        page.apply_redactions()
+        redact_seconds = apply_page_redactions(
+            page, [item["rect"] for item in page_replacements], redact_mode)
+        instr.add("redact", redact_seconds, page=page_num)
+        stats["redact_seconds"] += redact_seconds
+        stats["redact_pages"].append([page_num, redact_seconds])
         
-        for item in page_replacements:
-            rect = item["rect"]
-            color = item["color"]
-            if isinstance(color, int):
-                r = ((color >> 16) & 0xFF) / 255.0
-                g = ((color >> 8) & 0xFF) / 255.0
-                b = (color & 0xFF) / 255.0
-                color = (r, g, b)
-            
-            page.insert_text(
-                (rect.x0, rect.y1),
-                item["new_text"],
-                fontname=item["fontname"],
-                fontsize=item["fontsize"],
-                color=color
-            )
-    
-    doc.save(output_pdf, garbage=4, deflate=True)
-    doc.close()
-    print(f"[INFO] 替换完成: {input_pdf} -> {output_pdf}")
-
-def process_pdfs(pdf_dir, replacements):
-    for fname in os.listdir(pdf_dir):
-        if fname.lower().endswith('.pdf'):
-            input_pdf = os.path.join(pdf_dir, fname)
-            output_pdf = os.path.join(pdf_dir, f"replaced_{fname}")
-            replace_text_in_pdf(input_pdf, output_pdf, replacements)
-
-def main():
-    config_path = select_config()
-    config = load_config(config_path)
-    print(f"Loaded config: {config}")
-    pdf_dir = os.path.dirname(__file__)
-    replacements = config.get('replacements')
-    process_pdfs(pdf_dir, replacements)
-
-def run_qt_gui():
-    app = QApplication(sys.argv)
-    window = QWidget()
-    window.setWindowTitle('PDF批量文字替换工具 (Qt)')
-    window.setGeometry(200, 200, 600, 350)
-
-    # 配置文件下拉
-    configs = list_config_files()
-    config_label = QLabel('选择配置文件:')
-    config_combo = QComboBox()
-    config_combo.addItems(configs)
-
-    # PDF目录选择
-    pdf_dir_label = QLabel('选择PDF目录:')
-    pdf_dir_edit = QLineEdit()
-    pdf_dir_edit.setReadOnly(True)
-    pdf_dir_btn = QPushButton('浏览')
-    def choose_pdf_dir():
-        d = QFileDialog.getExistingDirectory(window, '选择PDF目录')
-        if d:
-            pdf_dir_edit.setText(d)
-    pdf_dir_btn.clicked.connect(choose_pdf_dir)
-    pdf_dir_layout = QHBoxLayout()
-    pdf_dir_layout.addWidget(pdf_dir_edit)
-    pdf_dir_layout.addWidget(pdf_dir_btn)
-
-    # 日志区
-    log_edit = QTextEdit()
-    log_edit.setReadOnly(True)
-    
-    signals = WorkerSignals()
-    def log(msg):
-        signals.log.emit(msg)
-    def on_log(msg):
-        log_edit.append(msg)
-        sb = log_edit.verticalScrollBar()
-        if sb:
-            sb.setValue(sb.maximum())
-    signals.log.connect(on_log)
-    
-    # 处理按钮
-    start_btn = QPushButton('开始处理')
-    def on_finished():
-        start_btn.setEnabled(True)
-        log('全部处理完成!')
-    signals.finished.connect(on_finished)
+        with instr.stage("insert", page=page_num):
+            for item in page_replacements:
+                rect = item["rect"]
+                color = item["color"]
+                if isinstance(color, int):
+                    r = ((color >> 16) & 0xFF) / 255.0
+                    g = ((color >> 8) & 0xFF) / 255.0
+                    b = (color & 0xFF) / 255.0
+                    color = (r, g, b)
+                
+                point = fitz.Point(rect.x0, rect.y1)
+                fontsize, condense, morph = item["fontsize"], 1.0, None
+                if fit_mode != "none":
+                    width = doc_fonts.text_width(item["fontname"], item["new_text"], fontsize)
+                    fontsize, condense, overflow = fit_text(width, rect.width, fontsize, fit_mode)
+                    if fontsize != item["fontsize"] or condense != 1.0:
+                        stats["fitted_insertions"] += 1
+                    stats["fit_overflows"] += overflow
+                if condense != 1.0:
+                    morph = (point, fitz.Matrix(condense, 1))
+                
+                page.insert_text(
+                    point,
+                    item["new_text"],
+                    fontname=item["fontname"],
+                    fontsize=fontsize,
+                    color=color,
+                    morph=morph
+                )
+        stats["replacements"] += len(page_replacements)
+        modified[page_num] = [(item["rect"], item["new_text"]) for item in page_replacements]
     
-    def start_process():
-        config_file = config_combo.currentText()
-        pdf_dir = pdf_dir_edit.text()
-        if not config_file or not pdf_dir:
-            QMessageBox.critical(window, '错误', '请先选择配置文件和PDF目录')
-            return
-        config_path = os.path.join('configs', config_file)
-        output_dir = os.path.join(pdf_dir, 'output')
-        os.makedirs(output_dir, exist_ok=True)
+    if verify:
+        with instr.stage("verify"):
+            stats.update(verify_doc(doc, replacements, matcher, modified))
+    if subset_fonts:
+        with instr.stage("font"):
+            doc_fonts.subset()
+    stats.update(doc_fonts.report())
+    if instrumentation is None:
+        stats.update(instr.stats())
+    return stats
+
+def replace_text_in_pdf(input_pdf, output_pdf, replacements, matcher=None, fonts_dir=None, pages=None,
+                        font_manager=None, subset_fonts=False, verify=False, save_profile=None,
+                        redact_mode="full", engine="redact", candidate_pages=None,
+                        window_pages=None, memory_limit_mb=None, trace=False, layout_cache=None,
+                        fit_mode="none", label=None):
+    """使用redaction彻底删除原始文本，确保不可恢复
+
+    input_pdf 可以是文件路径、字节串或可读的文件对象，output_pdf 可以是文件路径或可写的文件对象。
+    matcher 为预先编译好的 RuleSet，批量处理时可在多个文件间复用。
+    pages 不为空时只处理这些页，且输出文件只包含这些页（用于分片并行处理）。
+    save_profile 为保存方案名称（fast/balanced/compact），见 save_profiles.py。
+    engine 为替换引擎（redact/stream），candidate_pages 为语料索引给出的候选页，
+    fit_mode 为新文本的宽度适配方式（none/shrink/condense/auto），见 text_fit.py。
+    window_pages 或 memory_limit_mb（常驻内存软上限）不为空、且输入为文件对象或页数超过窗口大小时
+    按页窗口流式处理，见 replace_text_streaming。
+    统计信息包含各阶段耗时（stage_<阶段>_seconds），trace 为真时还包含
+    Chrome trace 事件（trace_events），见 instrumentation.py。
+    layout_cache 为跨文件共用的模板布局缓存，见 template_cache.py。
+    label 为日志和 trace 中显示的输入名称，默认由 input_pdf 得出（预读成字节串的输入可传入原路径）。
+    """
+    label = label or describe_source(input_pdf)
+    if window_pages or memory_limit_mb:
+        window_pages = window_pages or DEFAULT_WINDOW_PAGES
+    if window_pages and (is_file_object(input_pdf) or count_source_pages(input_pdf) > window_pages):
+        return replace_text_streaming(input_pdf, output_pdf, replacements, matcher, fonts_dir, pages,
+                                      font_manager=font_manager, subset_fonts=subset_fonts,
+                                      verify=verify, save_profile=save_profile, redact_mode=redact_mode,
+                                      engine=engine, candidate_pages=candidate_pages, fit_mode=fit_mode,
+                                      window_pages=window_pages, memory_limit_mb=memory_limit_mb,
+                                      trace=trace, layout_cache=layout_cache, label=label)
+
+    instr = Instrumentation(label, trace=trace)
+    with instr.stage("open"):
+        # 原地处理时输入文件会被覆盖，先记录原始大小
+        source_bytes = source_size(input_pdf)
+        doc = open_pdf(input_pdf)
+    stats = replace_text_in_doc(doc, replacements, matcher, fonts_dir, pages,
+                                font_manager=font_manager, subset_fonts=subset_fonts,
+                                verify=verify, redact_mode=redact_mode, engine=engine,
+                                candidate_pages=candidate_pages, instrumentation=instr,
+                                layout_cache=layout_cache, fit_mode=fit_mode)
+    # 保存之前最后检查一次取消，被取消的文件不会留下输出
+    checkpoint(0)
+    with instr.stage("save"):
+        if pages is not None:
+            # 分片只保留部分页面，保存时的垃圾回收会去掉其他页面的对象
+            doc.select(list(pages))
+        
+        stats.update(save_document(doc, output_pdf, save_profile, source_bytes=source_bytes))
+        if not doc.is_closed:
+            doc.close()
+    stats.update(instr.stats())
+    logger.info(f"替换完成: {label} -> {describe_source(output_pdf)}，"
+                f"替换 {stats['replacements']} 处，跳过 {stats['skipped_pages']}/{stats['pages']} 页")
+    return stats
+
+def replace_text_streaming(input_pdf, output_pdf, replacements, matcher=None, fonts_dir=None, pages=None,
+                           font_manager=None, subset_fonts=False, save_profile=None,
+                           window_pages=None, memory_limit_mb=None, trace=False, layout_cache=None,
+                           label=None, **doc_options):
+    """有界内存的流式替换：每次只打开处理 window_pages 页，处理完立即增量保存并释放
+
+    用于页数很多的文档或内存受限的环境，见 streaming.WindowedProcessor。
+    输入输出与 replace_text_in_pdf 相同，doc_options 原样传给 replace_text_in_doc。
+    字体子集化在所有窗口处理完后对整个文档做一次，模板布局缓存在各窗口间共用。
+    """
+    if font_manager is None:
+        font_manager = FontManager(fonts_dir or resource_path('fonts'))
+    if matcher is None:
+        matcher = RuleSet.from_replacements(replacements)
+    if layout_cache is None:
+        layout_cache = LayoutCache()
+    label = label or describe_source(input_pdf)
+    processor = WindowedProcessor(window_pages or DEFAULT_WINDOW_PAGES, memory_limit_mb)
+    instr = Instrumentation(label, trace=trace)
+    embedded = []
+
+    def process_window(doc, window):
+        window_stats = replace_text_in_doc(doc, replacements, matcher, pages=window,
+                                           font_manager=font_manager, instrumentation=instr,
+                                           layout_cache=layout_cache, **doc_options)
+        embedded.append(window_stats.get('font_embeds', 0))
+        return window_stats
+
+    def finish(doc):
+        if subset_fonts and any(embedded):
+            try:
+                with instr.stage("font"):
+                    doc.subset_fonts()
+            except Exception as e:
+                logger.warning(f"字体子集化失败: {e}")
+        return {}
+
+    stats = processor.run(input_pdf, output_pdf, process_window, pages=pages,
+                          save_profile=save_profile, finish=finish, instrumentation=instr)
+    stats.update(instr.stats())
+    logger.info(f"流式替换完成: {label} -> {describe_source(output_pdf)}，"
+                f"替换 {stats['replacements']} 处，跳过 {stats['skipped_pages']}/{stats['pages']} 页，"
+                f"{stats['windows']} 个窗口")
+    return stats
+
+def glyph_hit_rate(stats):
+    """字符宽度缓存命中率，没有测量过文本时返回 None"""
+    hits, misses = stats.get('glyph_cache_hits', 0), stats.get('glyph_cache_misses', 0)
+    return hits / (hits + misses) if hits + misses else None
+
+def format_stats(stats):
+    """把单个文件的统计信息格式化为一行日志"""
+    if not stats:
+        return ''
+    return (f"替换 {stats['replacements']} 处，跳过 {stats['skipped_pages']}/{stats['pages']} 页，"
+            f"字体嵌入 {stats.get('font_embeds', 0)} 次/复用 {stats.get('font_reuses', 0)} 次"
+            + (f"，验证 {stats['verified_pages']} 页，清理残留 {stats['residual_hits']} 处"
+               if 'verified_pages' in stats else '')
+            + (f"，内容流改写 {stats['stream_pages']} 页/回退 {stats['stream_fallback_pages']} 页"
+               if 'stream_pages' in stats else '')
+            + (f"，宽度适配 {stats['fitted_insertions']} 处（仍超出 {stats['fit_overflows']} 处）"
+               if 'fitted_insertions' in stats else '')
+            + (f"，字宽缓存命中率 {glyph_hit_rate(stats):.1%}" if glyph_hit_rate(stats) is not None else '')
+            + (f"，模板布局复用 {stats['layout_cache_hits']} 页" if stats.get('layout_cache_hits') else '')
+            + (f"，redaction {stats['redact_seconds']:.2f}s" if 'redact_seconds' in stats else '')
+            + (f"，流式窗口 {stats['windows']} 个，内存峰值 {stats['peak_rss_bytes'] // (1024 * 1024)} MB"
+               if 'windows' in stats else '')
+            + (f"，保存 {stats['save_seconds']:.2f}s，大小变化 {stats['size_delta']:+d} 字节"
+               if 'save_seconds' in stats else '')
+            + (f"，主要耗时 {format_stage_seconds(stats)}" if format_stage_seconds(stats) else ''))
+
+def process_pdfs(pdf_dir, replacements, workers=None, shard_pages=None, options=None, cache=None,
+                 prefetch=None, write_behind=None):
+    jobs = [
+        (os.path.join(pdf_dir, fname), os.path.join(pdf_dir, f"replaced_{fname}"))
+        for fname in os.listdir(pdf_dir)
+        if fname.lower().endswith('.pdf')
+    ]
+    engine = BatchEngine(replace_text_in_pdf, replacements,
+                         fonts_dir=resource_path('fonts'), workers=workers,
+                         shard_pages=shard_pages, options=options, cache=cache,
+                         prefetch=prefetch, write_behind=write_behind)
+    for result in engine.run(jobs):
+        if result.get("cached"):
+            logger.info(f"使用缓存: {result['input']} -> {result['output']}")
+        elif result["ok"]:
+            logger.info(f"完成: {result['input']} ({result['elapsed']:.2f}s) {format_stats(result.get('stats'))}")
+        else:
+            logger.error(f"失败: {result['input']} 错误: {result['error']}")
+
+def collect_inputs(inputs, recursive=False, errors=None):
+    """展开输入参数（文件、目录、通配符），返回 [(输入文件, 所在输入根目录), ...]
+
+    目录只收集其中的 PDF 文件，recursive 为真时包含子目录；
+    根目录用于在输出目录中保留相对路径。
+    不存在的输入和没有匹配到 PDF 文件的通配符逐个记入 errors；
+    errors 为 None 时遇到第一个就抛出 ValueError。
+    """
+    found = {}
+    problems = []
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, _dirs, files in os.walk(item):
+                    for fname in files:
+                        if fname.lower().endswith('.pdf'):
+                            found.setdefault(os.path.join(root, fname), item)
+            else:
+                for fname in os.listdir(item):
+                    path = os.path.join(item, fname)
+                    if fname.lower().endswith('.pdf') and os.path.isfile(path):
+                        found.setdefault(path, item)
+        elif glob.has_magic(item):
+            matched = [path for path in glob.glob(item, recursive=recursive)
+                       if path.lower().endswith('.pdf') and os.path.isfile(path)]
+            if not matched:
+                problems.append(f'通配符没有匹配到 PDF 文件: {item}')
+            for path in matched:
+                found.setdefault(path, None)
+        elif os.path.isfile(item):
+            found.setdefault(item, None)
+        else:
+            problems.append(f'输入不存在: {item}')
+    if problems:
+        if errors is None:
+            raise ValueError(problems[0])
+        errors.extend(problems)
+    return sorted(found.items())
+
+def plan_jobs(inputs, output_dir=None):
+    """为每个输入文件确定输出路径
+
+    指定 output_dir 时按输入根目录的相对路径写入输出目录，
+    否则与原有行为一致，写到输入文件旁边并加 replaced_ 前缀。
+    之前运行生成的输出文件不会被当作输入再处理一次。
+    多个输入对应同一个输出路径时（例如 a/x.pdf 和 b/x.pdf）抛出 ValueError，
+    不会互相覆盖。
+    """
+    out_root = os.path.abspath(output_dir) if output_dir else None
+    jobs = []
+    claimed = {}
+    for path, root in inputs:
+        if out_root and os.path.abspath(path).startswith(out_root + os.sep):
+            continue
+        if not output_dir and os.path.basename(path).startswith('replaced_'):
+            continue
+        if output_dir:
+            rel = os.path.relpath(path, root) if root else os.path.basename(path)
+            output = os.path.join(output_dir, rel)
+        else:
+            output = os.path.join(os.path.dirname(path), f"replaced_{os.path.basename(path)}")
+        key = os.path.normcase(os.path.abspath(output))
+        if key in claimed:
+            raise ValueError(f'输出路径冲突: {claimed[key]} 和 {path} 都会写到 {output}')
+        claimed[key] = path
+        jobs.append((path, output))
+    if output_dir:
+        for _path, output in jobs:
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+    return jobs
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='PDF批量文字替换工具。不带参数运行时启动图形界面。',
+        epilog='标准输出为逐行 JSON 状态（start/file/summary），其他日志写到标准错误。'
+               '退出码：0 全部成功，1 有文件处理失败，2 参数或配置错误。')
+    parser.add_argument('inputs', nargs='*', help='PDF 文件、目录或通配符（如 "docs/**/*.pdf"）')
+    parser.add_argument('-c', '--config', help='配置文件路径（JSON）')
+    parser.add_argument('-o', '--output-dir', help='输出目录；不指定时在原文件旁生成 replaced_ 前缀的文件')
+    parser.add_argument('-r', '--recursive', action='store_true', help='递归处理子目录，通配符支持 **')
+    parser.add_argument('-w', '--workers', type=int, help='并行进程数（默认 CPU 核数）')
+    parser.add_argument('--shard-pages', type=int, help='大文件按页分片的每片页数（覆盖配置文件）')
+    parser.add_argument('--save-profile', help='保存方案：fast/balanced/compact（覆盖配置文件）')
+    parser.add_argument('--redact-mode', help='redaction 模式：full/text（覆盖配置文件）')
+    parser.add_argument('--engine', help='替换引擎：redact/stream（覆盖配置文件）')
+    parser.add_argument('--fit-mode', help='新文本比原文宽时的适配方式：none/shrink/condense/auto（覆盖配置文件）')
+    parser.add_argument('--window-pages', type=int,
+                        help='超过该页数的文档按页窗口流式处理，限制内存占用（覆盖配置文件）')
+    parser.add_argument('--memory-limit-mb', type=float,
+                        help='流式处理的常驻内存软上限（MB）：超过时缩小之后的窗口，不保证峰值低于该值')
+    parser.add_argument('--prefetch', type=int,
+                        help='预读队列深度：后台提前读入内存的输入文件数，0 为不预读（覆盖配置文件）')
+    parser.add_argument('--write-behind', type=int,
+                        help='后台写出队列深度：输出先序列化到内存再由后台线程写出，0 为直接写出（覆盖配置文件）')
+    parser.add_argument('--cache-dir', help='结果缓存目录，输入和配置未变化的文件直接使用缓存（覆盖配置文件）')
+    parser.add_argument('--cache-max-mb', type=float, help='结果缓存大小上限（MB）')
+    parser.add_argument('--index', dest='index_db',
+                        help='语料索引数据库；只处理有命中的文件和页面，其余文件直接复制（覆盖配置文件）')
+    parser.add_argument('--metrics', help='把每个文件的分阶段耗时和计数器按 JSON lines 写入该文件')
+    parser.add_argument('--trace', help='把各阶段的时间线写成 Chrome trace 文件（chrome://tracing 或 Perfetto 打开）')
+    parser.add_argument('--profile-dir', help='用 cProfile 剖析每个文件的处理过程，.prof 文件写到该目录')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='只建立/更新索引并按规则、文件和页面统计命中次数，不修改任何文件')
+    parser.add_argument('--gui', action='store_true', help='启动图形界面')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出详细日志')
+    return parser
+
+def _emit(stream, event, **fields):
+    stream.write(json.dumps(dict(event=event, **fields), ensure_ascii=False, default=str) + "\n")
+    stream.flush()
+
+def _status_stream():
+    """返回只用于输出 JSON 状态的流，并把进程的标准输出（含子进程和 MuPDF 的输出）改到标准错误"""
+    sys.stdout.flush()
+    status = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return status
+
+def run_cli(args):
+    """命令行批处理，返回退出码"""
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    status = _status_stream()
+
+    try:
+        if not args.config:
+            raise ValueError('缺少 --config 参数')
+        config_path = os.path.abspath(args.config) if os.path.exists(args.config) else args.config
         config = load_config(config_path)
+        for key in ('save_profile', 'redact_mode', 'engine', 'fit_mode', 'shard_pages', 'window_pages',
+                    'memory_limit_mb', 'prefetch', 'write_behind', 'cache_dir', 'cache_max_mb', 'index_db', 'profile_dir'):
+            value = getattr(args, key)
+            if value is not None:
+                config[key] = value
+        if args.trace:
+            config['trace'] = True
+        options = processing_options(config)
         replacements = config.get('replacements')
-        pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
-        if not pdf_files:
-            QMessageBox.information(window, '提示', '所选目录下没有PDF文件')
-            return
-        start_btn.setEnabled(False)
-        def worker():
-            for fname in pdf_files:
-                input_pdf = os.path.join(pdf_dir, fname)
-                output_pdf = os.path.join(output_dir, fname)
-                log(f'处理: {fname} ...')
-                try:
-                    replace_text_in_pdf(input_pdf, output_pdf, replacements)
-                    log(f'完成: {fname}')
-                except Exception as e:
-                    log(f'失败: {fname} 错误: {e}')
-            signals.finished.emit()
-        threading.Thread(target=worker, daemon=True).start()
-    start_btn.clicked.connect(start_process)
-
-    # 布局
-    layout = QVBoxLayout()
-    layout.addWidget(config_label)
-    layout.addWidget(config_combo)
-    layout.addWidget(pdf_dir_label)
-    layout.addLayout(pdf_dir_layout)
-    layout.addWidget(log_edit)
-    layout.addWidget(start_btn)
-    window.setLayout(layout)
-    window.show()
-    sys.exit(app.exec_())
+        if not isinstance(replacements, list):
+            raise ValueError('配置文件缺少 replacements 列表')
+        # 规则有误（如正则表达式无效）时在处理任何文件之前报错
+        RuleSet.from_replacements(replacements)
+        errors = []
+        inputs = collect_inputs(args.inputs, args.recursive, errors)
+        if errors:
+            for message in errors:
+                _emit(status, 'error', error=message)
+            return 2
+        if args.dry_run and inputs:
+            return run_dry_run(status, config, [path for path, _root in inputs], args.workers)
+        jobs = plan_jobs(inputs, args.output_dir)
+        if not jobs:
+            raise ValueError('没有找到要处理的 PDF 文件')
+        engine = BatchEngine(replace_text_in_pdf, replacements,
+                             fonts_dir=resource_path('fonts'), workers=args.workers,
+                             shard_pages=config.get('shard_pages'), options=options,
+                             cache=open_result_cache(config), index=open_corpus_index(config),
+                             prefetch=config.get('prefetch'), write_behind=config.get('write_behind'))
+    except Exception as e:
+        _emit(status, 'error', error=str(e))
+        return 2
+
+    startup_seconds = time.perf_counter() - _MODULE_STARTED
+    _emit(status, 'start', files=len(jobs), workers=engine.workers, startup_seconds=startup_seconds)
+
+    started = time.perf_counter()
+    ok = failed = cached = unchanged = 0
+    glyphs = {'glyph_cache_hits': 0, 'glyph_cache_misses': 0}
+    metrics = MetricsWriter(args.metrics)
+    for result in engine.run(jobs):
+        metrics.add(result)
+        for key in glyphs:
+            glyphs[key] += (result.get('stats') or {}).get(key, 0)
+        if result['ok']:
+            ok += 1
+        else:
+            failed += 1
+        cached += bool(result.get('cached'))
+        unchanged += bool(result.get('unchanged'))
+        _emit(status, 'file', input=result['input'], output=result['output'], ok=result['ok'],
+              error=result['error'], elapsed=result.get('elapsed'), cached=bool(result.get('cached')),
+              unchanged=bool(result.get('unchanged')), stats=result.get('stats') or {})
+
+    metrics.close()
+    if args.trace:
+        write_chrome_trace(metrics.events, args.trace)
+    summary = {'stage_seconds': metrics.totals}
+    if glyph_hit_rate(glyphs) is not None:
+        summary.update(glyphs, glyph_cache_hit_rate=glyph_hit_rate(glyphs))
+    if engine.cache is not None:
+        summary.update(engine.cache.report())
+        engine.cache.close()
+    if engine.index is not None:
+        engine.index.close()
+    _emit(status, 'summary', files=len(jobs), ok=ok, failed=failed, cached=cached, unchanged=unchanged,
+          elapsed=time.perf_counter() - started, startup_seconds=startup_seconds, **summary)
+    return 1 if failed else 0
+
+def run_dry_run(status, config, inputs, workers=None):
+    """预演：更新语料索引后输出每个文件的命中统计，不修改任何文件
+
+    未配置索引数据库时使用临时的内存索引。
+    """
+    started = time.perf_counter()
+    index = open_corpus_index(config) or CorpusIndex(':memory:')
+    try:
+        update = index.update(inputs, workers=workers or default_worker_count())
+        report = index.scan(inputs, config['replacements'])
+    finally:
+        index.close()
+    for item in update['failed']:
+        _emit(status, 'file', input=item['input'], ok=False, error=item['error'])
+    for item in report['files']:
+        if item.get('matches'):
+            _emit(status, 'dry_run_file', **item)
+    _emit(status, 'summary', files=len(inputs), matching_files=report['matching_files'],
+          indexed=update['indexed'], unchanged=update['unchanged'], failed=len(update['failed']),
+          rules=report['rules'], elapsed=time.perf_counter() - started)
+    return 1 if update['failed'] else 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_arg_parser().parse_args(argv)
+    if args.gui or not argv:
+        # 只有需要图形界面时才导入 PyQt5
+        from gui import run_qt_gui
+        run_qt_gui()
+        return 0
+    return run_cli(args)
 
 if __name__ == '__main__':
-    run_qt_gui()
+    # 打包为 exe 后进程池子进程需要此调用
+    multiprocessing.freeze_support()
+    sys.exit(main())
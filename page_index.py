@@ -0,0 +1,74 @@
+import fitz
+from typing import Dict, List, Optional
+
+
+class PageLayoutIndex:
+    """单页文本布局索引
+
+    每页只提取一次 get_text("dict")/("rawdict")，所有替换规则共用。
+    span 按纵向条带分桶（排序区间网格），按矩形查找 span 时只检查
+    与该矩形纵向重叠的条带，不再线性扫描整页。
+    """
+
+    def __init__(self, text_dict: Dict, band_height: float = 24.0):
+        self.band_height = band_height
+        self.spans: List[Dict] = []
+        self.rects: List[fitz.Rect] = []
+        self.texts: List[str] = []
+        self._bands: Dict[int, List[int]] = {}
+
+        for block in text_dict.get("blocks", []):
+            if "lines" not in block:
+                continue
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    self._add_span(span)
+
+    @classmethod
+    def from_page(cls, page, flags: Optional[int] = None) -> "PageLayoutIndex":
+        """从页面提取布局并建立索引"""
+        if flags is None:
+            return cls(page.get_text("dict"))
+        return cls(page.get_text("dict", flags=flags))
+
+    def _add_span(self, span: Dict):
+        rect = fitz.Rect(span["bbox"])
+        text = span.get("text")
+        if text is None:
+            # rawdict 的 span 只有 chars，没有 text
+            text = "".join(ch.get("c", "") for ch in span.get("chars", []))
+
+        idx = len(self.spans)
+        self.spans.append(span)
+        self.rects.append(rect)
+        self.texts.append(text)
+
+        if rect.is_empty:
+            return
+        for band in self._band_range(rect.y0, rect.y1):
+            self._bands.setdefault(band, []).append(idx)
+
+    def _band_range(self, y0: float, y1: float) -> range:
+        return range(int(y0 // self.band_height), int(y1 // self.band_height) + 1)
+
+    def query(self, rect) -> List[int]:
+        """返回与矩形相交的 span 下标，保持页面中的原始顺序"""
+        rect = fitz.Rect(rect)
+        if rect.is_empty:
+            return []
+
+        candidates = set()
+        for band in self._band_range(rect.y0, rect.y1):
+            candidates.update(self._bands.get(band, ()))
+
+        return [i for i in sorted(candidates) if self.rects[i].intersects(rect)]
+
+    def find_span(self, rect, text: Optional[str] = None) -> Optional[Dict]:
+        """查找与矩形相交且包含指定文本的第一个 span"""
+        for i in self.query(rect):
+            if text is None or text in self.texts[i]:
+                return self.spans[i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.spans)
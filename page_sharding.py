@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import time
+import logging
+import fitz
+from typing import Dict, List, Optional
+
+from save_profiles import save_document
+
+
+logger = logging.getLogger(__name__)
+
+
+# 取最大值而不是相加的统计字段
+_MAX_STATS = ("peak_rss_bytes", "final_window_pages")
+
+
+def merge_stats(total: Dict, stats: Dict) -> Dict:
+    """把一部分页面的统计累加到 total：数值相加（峰值类字段取最大）、列表合并，布尔值等其他字段忽略"""
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            continue
+        if key in _MAX_STATS:
+            total[key] = max(total.get(key, 0), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+        elif isinstance(value, list):
+            total.setdefault(key, []).extend(value)
+    return total
+
+
+def count_pages(pdf_path: str) -> int:
+    """只读取页树获取页数，不解析页面内容"""
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def plan_shards(page_count: int, pages_per_shard: int) -> List[range]:
+    """把文档按连续页码区间拆分为若干分片"""
+    if pages_per_shard <= 0 or page_count <= pages_per_shard:
+        return [range(page_count)]
+    return [range(start, min(start + pages_per_shard, page_count))
+            for start in range(0, page_count, pages_per_shard)]
+
+
+def _restore_links(source, merged):
+    """按原文档重建链接；分片合并时跨分片的页内跳转会丢失"""
+    for page_num in range(len(source)):
+        src_page = source[page_num]
+        dst_page = merged[page_num]
+        for link in dst_page.get_links():
+            dst_page.delete_link(link)
+        for link in src_page.get_links():
+            link = dict(link)
+            link.pop("xref", None)
+            link.pop("id", None)
+            try:
+                dst_page.insert_link(link)
+            except Exception as e:
+                logger.warning(f"页面 {page_num} 链接恢复失败: {e}")
+
+
+def merge_shards(source_pdf: str, shard_paths: List[str], output_pdf: str,
+                 save_profile: Optional[str] = None) -> Dict:
+    """按顺序合并分片输出，并恢复原文档的书签、链接和元数据，返回保存信息"""
+    merged = fitz.open()
+    try:
+        for path in shard_paths:
+            with fitz.open(path) as shard:
+                merged.insert_pdf(shard)
+
+        with fitz.open(source_pdf) as source:
+            if len(source) != len(merged):
+                raise RuntimeError(f"分片合并后页数不一致: {len(merged)} != {len(source)}")
+            merged.set_metadata(source.metadata or {})
+            toc = source.get_toc(simple=False)
+            if toc:
+                merged.set_toc(toc)
+            _restore_links(source, merged)
+
+        return save_document(merged, output_pdf, save_profile, source_path=source_pdf)
+    finally:
+        merged.close()
+
+
+class ShardGroup:
+    """一个被拆分处理的文档：收集各分片结果，全部完成后合并输出"""
+
+    def __init__(self, input_pdf: str, output_pdf: str, shards: List[range],
+                 save_profile: Optional[str] = None):
+        self.input_pdf = input_pdf
+        self.output_pdf = output_pdf
+        self.save_profile = save_profile
+        self.shards = shards
+        self.tmpdir = tempfile.mkdtemp(prefix="pdf_shards_")
+        self.paths = [os.path.join(self.tmpdir, f"shard_{i:05d}.pdf") for i in range(len(shards))]
+        self.errors: List[str] = []
+        self.cancelled = False
+        self.stats: Dict = {}
+        self.remaining = len(shards)
+        self.started = time.perf_counter()
+
+    def add_result(self, result: Dict) -> bool:
+        """记录一个分片的结果，返回是否所有分片都已完成"""
+        if not result["ok"]:
+            self.errors.append(result["error"])
+            self.cancelled = self.cancelled or bool(result.get("cancelled"))
+        merge_stats(self.stats, result.get("stats", {}))
+        self.remaining -= 1
+        return self.remaining == 0
+
+    def finish(self) -> Dict:
+        """合并分片并清理临时文件，返回整个文档的处理结果"""
+        result = {"input": self.input_pdf, "output": self.output_pdf, "ok": True,
+                  "error": None, "shards": len(self.shards), "stats": self.stats}
+        if self.cancelled:
+            result["cancelled"] = True
+        try:
+            if self.errors:
+                raise RuntimeError("; ".join(self.errors))
+            # 分片各自的保存信息没有意义，以合并后的最终文件为准
+            self.stats.update(merge_shards(self.input_pdf, self.paths, self.output_pdf,
+                                           self.save_profile))
+        except Exception as e:
+            result["ok"] = False
+            result["error"] = str(e)
+        finally:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+        result["elapsed"] = time.perf_counter() - self.started
+        return result
+
+    def discard(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
@@ -3,98 +3,142 @@ import os
 from typing import List, Dict, Tuple, Optional
 import logging
 
+from instrumentation import Instrumentation
+from page_index import PageLayoutIndex
+from progress import checkpoint
+from redaction import apply_page_redactions
+from save_profiles import save_document
+from rule_set import RuleSet
+from text_matcher import TEXTPAGE_FLAGS, PageText
+
 
 class PDFProcessor:
-    def __init__(self, fonts_dir: str = "fonts"):
+    def __init__(self, fonts_dir: str = "fonts", trace: bool = False):
         self.fonts_dir = fonts_dir
         self.logger = logging.getLogger(__name__)
+        # 各阶段耗时和计数器（见 instrumentation.py），instrumentation.stats() 获取
+        self.instrumentation = Instrumentation(trace=trace)
 
     def load_pdf(self, pdf_path: str):
         try:
-            return fitz.open(pdf_path)
+            with self.instrumentation.stage("open"):
+                return fitz.open(pdf_path)
         except Exception as e:
             self.logger.error(f"无法加载PDF文件 {pdf_path}: {e}")
             raise
 
-    def find_text_with_style(self, page, text: str) -> List[Dict]:
-        """查找文本并获取样式信息"""
-        results = []
+    def find_text_with_style(self, page, text: str,
+                             layout: Optional[PageLayoutIndex] = None) -> List[Dict]:
+        """查找文本并获取样式信息
+
+        layout 为同一页面已建立的布局索引，多条规则共用时只需提取一次。
+        """
         text_instances = page.search_for(text)
-        text_dict = page.get_text("dict")
+        if not text_instances:
+            return []
+        
+        if layout is None:
+            layout = PageLayoutIndex.from_page(page)
         
+        return self._attach_styles(text_instances, text, layout)
+
+    def _attach_styles(self, text_instances, text: str,
+                       layout: PageLayoutIndex) -> List[Dict]:
+        """通过布局索引为每个命中矩形查找样式"""
+        results = []
         for inst in text_instances:
-            style_info = None
-            if "blocks" in text_dict:
-                for block in text_dict["blocks"]:
-                    if "lines" not in block:
-                        continue
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            span_bbox = fitz.Rect(span["bbox"])
-                            if span_bbox.intersects(inst) and text in span.get("text", ""):
-                                style_info = {
-                                    "fontname": span.get("font", "helv"),
-                                    "fontsize": span.get("size", 12),
-                                    "color": span.get("color", 0),
-                                }
-                                break
-                        if style_info:
-                            break
-                    if style_info:
-                        break
+            span = layout.find_span(inst, text)
+            if span is None:
+                continue
             
-            if style_info:
-                results.append({
-                    "rect": inst,
-                    "style": style_info
-                })
+            results.append({
+                "rect": inst,
+                "style": {
+                    "fontname": span.get("font", "helv"),
+                    "fontsize": span.get("size", 12),
+                    "color": span.get("color", 0),
+                }
+            })
         
         return results
 
-    def process_replacements(self, doc, replacements: List[Dict]) -> int:
-        """处理所有替换项"""
+    def process_replacements(self, doc, replacements: List[Dict],
+                             matcher: Optional[RuleSet] = None,
+                             redact_mode: str = "full") -> int:
+        """处理所有替换项
+
+        redact_mode 为 "text" 时只删除文字，不处理图片和矢量图形。
+        各阶段耗时以及 pages / skipped_pages / hits / replacements 计数记录在 self.instrumentation 中。
+        """
+        instr = self.instrumentation
         total_replacements = 0
+        skipped_pages = 0
+        if matcher is None:
+            matcher = RuleSet.from_replacements(replacements)
         
         for page_num in range(len(doc)):
+            checkpoint()
             page = doc[page_num]
+            instr.count("pages")
             
-            all_replacements = []
-            for replacement in replacements:
-                old_text = replacement["old_text"]
-                new_text = replacement["new_text"]
-                items = self.find_text_with_style(page, old_text)
-                
-                for item in items:
-                    all_replacements.append({
-                        "rect": item["rect"],
-                        "new_text": new_text,
-                        "style": item["style"]
-                    })
+            with instr.stage("extract", page=page_num):
+                textpage = page.get_textpage(flags=TEXTPAGE_FLAGS)
+                plain_text = matcher.page_texts(page, textpage)
+            with instr.stage("search", page=page_num):
+                may_match = matcher.contains_any(*plain_text)
+            if not may_match:
+                skipped_pages += 1
+                instr.count("skipped_pages")
+                continue
             
-            if not all_replacements:
+            with instr.stage("extract", page=page_num):
+                page_text = PageText.from_page(page, textpage)
+            with instr.stage("search", page=page_num):
+                hits = matcher.search_page(page_text)
+            if not hits:
                 continue
+            instr.count("hits", len(hits))
             
-            for item in all_replacements:
-                page.add_redact_annot(item["rect"], fill=(1, 1, 1))
+            with instr.stage("style", page=page_num):
+                layout = PageLayoutIndex(page_text.raw)
+                all_replacements = []
+                for hit in hits:
+                    items = self._attach_styles(hit.rects, hit.text, layout)
+                    
+                    for item in items:
+                        all_replacements.append({
+                            "rect": item["rect"],
+                            "new_text": hit.new_text,
+                            "style": item["style"]
+                        })
+            
+            if not all_replacements:
+                continue
             
-            page.apply_redactions()
+            redact_seconds = apply_page_redactions(
+                page, [item["rect"] for item in all_replacements], redact_mode)
+            instr.add("redact", redact_seconds, page=page_num)
             
-            for item in all_replacements:
-                rect = item["rect"]
-                style = item["style"]
-                color_tuple = self._int_to_rgb(style["color"])
-                
-                page.insert_text(
-                    (rect.x0, rect.y1),
-                    item["new_text"],
-                    fontname=style["fontname"],
-                    fontsize=style["fontsize"],
-                    color=color_tuple
-                )
+            with instr.stage("insert", page=page_num):
+                for item in all_replacements:
+                    rect = item["rect"]
+                    style = item["style"]
+                    color_tuple = self._int_to_rgb(style["color"])
+                    
+                    page.insert_text(
+                        (rect.x0, rect.y1),
+                        item["new_text"],
+                        fontname=style["fontname"],
+                        fontsize=style["fontsize"],
+                        color=color_tuple
+                    )
             
             total_replacements += len(all_replacements)
-            self.logger.info(f"页面 {page_num}: 完成 {len(all_replacements)} 处替换")
+            instr.count("replacements", len(all_replacements))
+            self.logger.debug(f"页面 {page_num}: 完成 {len(all_replacements)} 处替换，"
+                              f"redaction 耗时 {redact_seconds:.3f}s")
         
+        self.logger.info(f"预筛选跳过 {skipped_pages}/{len(doc)} 页")
         return total_replacements
 
     def _int_to_rgb(self, color_int: int) -> Tuple[float, float, float]:
@@ -106,10 +150,17 @@ class PDFProcessor:
         b = (color_int & 0xFF) / 255.0
         return (r, g, b)
 
-    def save_pdf(self, doc, output_path: str):
+    def save_pdf(self, doc, output_path: str, profile: Optional[str] = None) -> Dict:
+        """按保存方案保存并关闭文档，返回保存耗时和大小变化"""
         try:
-            doc.save(output_path, garbage=4, deflate=True)
-            doc.close()
+            source_path = doc.name or None
+            with self.instrumentation.stage("save"):
+                result = save_document(doc, output_path, profile, source_path=source_path)
+            if not doc.is_closed:
+                doc.close()
+            self.logger.info(f"保存完成: {output_path} ({result['save_profile']}, "
+                             f"{result['save_seconds']:.2f}s, 大小变化 {result['size_delta']:+d} 字节)")
+            return result
         except Exception as e:
             self.logger.error(f"保存PDF失败: {e}")
             raise
\ No newline at end of file
@@ -0,0 +1,162 @@
+import time
+import threading
+import multiprocessing
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class BatchCancelled(Exception):
+    """批处理被取消；在页面之间抛出，此时尚未写出输出文件"""
+
+
+class RunControl:
+    """批处理的取消、暂停控制和已处理页数计数
+
+    内部使用 multiprocessing 的 Event 和 Value，创建后通过进程池的 initargs
+    传给工作进程（见 batch_engine._init_worker），工作进程在页面之间调用
+    checkpoint() 检查状态。暂停时工作进程阻塞在下一个页面之前；取消时在下一个
+    页面之前抛出 BatchCancelled，当前文件不会保存。
+    """
+
+    def __init__(self):
+        self._cancel = multiprocessing.Event()
+        self._running = multiprocessing.Event()
+        self._running.set()
+        self._pages = multiprocessing.Value("q", 0)
+
+    def cancel(self):
+        self._cancel.set()
+        # 暂停中的工作进程需要被唤醒才能退出
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    @property
+    def pages_done(self) -> int:
+        return self._pages.value
+
+    def checkpoint(self, pages: int = 1):
+        """记录已处理的页数，暂停时等待，已取消时抛出 BatchCancelled"""
+        if pages:
+            with self._pages.get_lock():
+                self._pages.value += pages
+        if not self._running.is_set():
+            self._running.wait()
+        if self._cancel.is_set():
+            raise BatchCancelled("已取消")
+
+
+# 当前进程使用的控制对象，由 install() 设置；未设置时 checkpoint() 不做任何事
+_control: Optional[RunControl] = None
+
+
+def install(control: Optional[RunControl]):
+    global _control
+    _control = control
+
+
+def checkpoint(pages: int = 1):
+    """处理循环在每个页面之前调用（pages=0 只检查取消和暂停，例如保存之前）"""
+    if _control is not None:
+        _control.checkpoint(pages)
+
+
+class LogBuffer:
+    """线程安全的日志缓冲：后台线程随时写入，界面线程定时一次性取出
+
+    超过 max_lines 时丢弃最早的行，只记录丢弃的数量，界面不会被大量日志拖慢。
+    """
+
+    def __init__(self, max_lines: int = 5000):
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def append(self, line: str):
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self.dropped += 1
+            self._lines.append(line)
+
+    def drain(self) -> List[str]:
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            if self.dropped:
+                lines.insert(0, f"…省略 {self.dropped} 行日志")
+                self.dropped = 0
+        return lines
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+class ProgressTracker:
+    """按文件结果统计进度：完成数、文件/秒、页/秒和预计剩余时间
+
+    页/秒按 RunControl 中工作进程实时累计的页数计算（不含缓存命中和原样复制的文件），
+    剩余时间按文件完成速度估算。
+    """
+
+    def __init__(self, total_files: int, control: Optional[RunControl] = None):
+        self.total_files = total_files
+        self.control = control
+        self.started = time.perf_counter()
+        self.files_done = 0
+        self.failed = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def add_result(self, result: Dict):
+        with self._lock:
+            self.files_done += 1
+            if result.get("cancelled"):
+                self.cancelled += 1
+            elif not result.get("ok"):
+                self.failed += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            done, failed, cancelled = self.files_done, self.failed, self.cancelled
+        elapsed = time.perf_counter() - self.started
+        pages = self.control.pages_done if self.control is not None else 0
+        files_per_s = done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_files - done
+        return {
+            "files_done": done,
+            "total_files": self.total_files,
+            "failed": failed,
+            "cancelled": cancelled,
+            "pages_done": pages,
+            "elapsed": elapsed,
+            "files_per_s": files_per_s,
+            "pages_per_s": pages / elapsed if elapsed > 0 else 0.0,
+            "eta": remaining / files_per_s if files_per_s > 0 else None,
+        }
+
+    def summary_line(self) -> str:
+        snap = self.snapshot()
+        line = (f"{snap['files_done']}/{snap['total_files']} 个文件，{snap['files_per_s']:.2f} 文件/s，"
+                f"{snap['pages_per_s']:.1f} 页/s，已用 {format_duration(snap['elapsed'])}")
+        if snap["files_done"] < snap["total_files"]:
+            line += f"，预计剩余 {format_duration(snap['eta'])}"
+        if snap["failed"]:
+            line += f"，失败 {snap['failed']}"
+        return line
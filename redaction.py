@@ -0,0 +1,37 @@
+import time
+import fitz
+from typing import Iterable
+
+
+# full - 默认方式：白色覆盖命中区域，图片和矢量图形按 MuPDF 默认规则处理
+# text - 只删除文字：不填充背景，不触碰图片和矢量图形（适合扫描件和图文混排页面）
+REDACT_MODES = ("full", "text")
+
+# 旧版 PyMuPDF 没有这个常量，apply_redactions 也没有 graphics 参数
+_LINE_ART_NONE = getattr(fitz, "PDF_REDACT_LINE_ART_NONE", None)
+
+
+def check_redact_mode(mode: str) -> str:
+    if mode not in REDACT_MODES:
+        raise ValueError(f"未知的 redaction 模式: {mode}，可选: {', '.join(REDACT_MODES)}")
+    return mode
+
+
+def apply_page_redactions(page, rects: Iterable, mode: str = "full") -> float:
+    """把一页上的所有命中一次性加入 redaction 并统一应用，返回耗时（秒）"""
+    check_redact_mode(mode)
+    start = time.perf_counter()
+
+    if mode == "text":
+        for rect in rects:
+            page.add_redact_annot(rect, fill=False)
+        if _LINE_ART_NONE is None:
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE)
+        else:
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=_LINE_ART_NONE)
+    else:
+        for rect in rects:
+            page.add_redact_annot(rect, fill=(1, 1, 1))
+        page.apply_redactions()
+
+    return time.perf_counter() - start
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from config_manager import ConfigManager
+
+
+# 处理结果的版本号：替换逻辑或输出格式发生变化时递增，使旧缓存全部失效
+ENGINE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# files 表（文件摘要记录）保留的最多行数
+DEFAULT_MAX_FILES = 100000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    blob TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stats TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _digest_json(value) -> str:
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def font_set_signature(fonts_dir: Optional[str]) -> List:
+    """字体目录的签名：文件名、大小和修改时间，字体变化时缓存失效"""
+    if not fonts_dir or not os.path.isdir(fonts_dir):
+        return []
+    signature = []
+    for fname in sorted(os.listdir(fonts_dir)):
+        if os.path.splitext(fname)[1].lower() != ".ttf":
+            continue
+        st = os.stat(os.path.join(fonts_dir, fname))
+        signature.append([fname, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+class ResultCache:
+    """按内容寻址的处理结果缓存
+
+    缓存键由输入文件的 sha256、规范化后的替换规则、字体集合、ENGINE_VERSION
+    以及处理参数共同决定；输出文件按其 sha256 存放在 objects/ 下，
+    相同内容的输出只存一份。索引保存在 SQLite 数据库中。
+
+    文件摘要带有 size/mtime 快速检查：文件未变化时直接使用记录的摘要，不重新计算。
+    缓存总大小超过 max_bytes 时按最近使用时间淘汰。摘要记录在启动和淘汰时清理：
+    文件已不存在或已变化的记录删除，超过 max_files 条时删除最早记录的。
+    只在主进程中使用。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_files: int = DEFAULT_MAX_FILES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.logger = logging.getLogger(__name__)
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        # 图形界面在主线程创建、在后台线程使用，同一时间只有一个线程访问
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30,
+                                  check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        # 上限可能比上次运行时调小了
+        self.evict()
+        self.prune_files()
+
+    def close(self):
+        self.db.close()
+
+    def file_digest(self, path: str) -> str:
+        """获取文件 sha256，大小和修改时间未变化时使用记录的结果"""
+        abs_path = os.path.abspath(path)
+        st = os.stat(abs_path)
+        row = self.db.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?",
+                              (abs_path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+
+        sha = sha256_file(abs_path)
+        self._remember_file(abs_path, st, sha)
+        return sha
+
+    def _remember_file(self, abs_path: str, st: os.stat_result, sha: str):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                            (abs_path, st.st_size, st.st_mtime_ns, sha))
+
+    def context_digest(self, replacements: List[Dict], fonts_dir: Optional[str] = None,
+                       options: Optional[Dict] = None) -> str:
+        """一次运行中所有文件共用的那部分缓存键"""
+        return _digest_json({
+            "engine_version": ENGINE_VERSION,
+            "replacements": ConfigManager.normalize_replacements(replacements),
+            "fonts": font_set_signature(fonts_dir),
+            "options": options or {},
+        })
+
+    def make_key(self, input_path: str, context: str) -> str:
+        return hashlib.sha256(f"{self.file_digest(input_path)}:{context}".encode("ascii")).hexdigest()
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.objects_dir, sha[:2], sha)
+
+    def restore(self, key: str, output_path: str) -> Optional[Dict]:
+        """缓存命中时写出输出文件（已是正确内容则不写），返回记录的统计信息；未命中返回 None"""
+        row = self.db.execute("SELECT blob, stats FROM results WHERE key = ?", (key,)).fetchone()
+        blob_path = self._blob_path(row[0]) if row else None
+        if row is None or not os.path.exists(blob_path):
+            self.misses += 1
+            return None
+
+        if not (os.path.exists(output_path) and self.file_digest(output_path) == row[0]):
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            tmp_path = f"{output_path}.cache-tmp"
+            shutil.copyfile(blob_path, tmp_path)
+            os.replace(tmp_path, output_path)
+            self._remember_file(os.path.abspath(output_path), os.stat(output_path), row[0])
+
+        with self.db:
+            self.db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return json.loads(row[1])
+
+    def store(self, key: str, output_path: str, stats: Optional[Dict] = None):
+        """保存一个文件的处理结果"""
+        sha = self.file_digest(output_path)
+        blob_path = self._blob_path(sha)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.tmp"
+            shutil.copyfile(output_path, tmp_path)
+            os.replace(tmp_path, blob_path)
+
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results (key, blob, size, stats, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, sha, os.path.getsize(blob_path), json.dumps(stats or {}, default=str), now, now))
+        self.evict()
+
+    def total_bytes(self) -> int:
+        row = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM "
+                              "(SELECT DISTINCT blob, size FROM results)").fetchone()
+        return row[0]
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """按最近使用时间淘汰结果，直到缓存总大小不超过上限"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        total = self.total_bytes()
+        if total <= limit:
+            return
+
+        rows = self.db.execute("SELECT key, blob FROM results ORDER BY last_used").fetchall()
+        for key, blob in rows:
+            if total <= limit:
+                break
+            with self.db:
+                self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+            still_used = self.db.execute("SELECT 1 FROM results WHERE blob = ? LIMIT 1", (blob,)).fetchone()
+            if still_used:
+                continue
+            blob_path = self._blob_path(blob)
+            if os.path.exists(blob_path):
+                total -= os.path.getsize(blob_path)
+                os.remove(blob_path)
+        self.prune_files()
+        self.logger.info(f"缓存淘汰完成，当前大小 {total} 字节")
+
+    def prune_files(self):
+        """清理文件摘要记录：删除文件已不存在或大小、修改时间已变化的记录，再按上限删除最早的记录"""
+        stale = []
+        for path, size, mtime_ns in self.db.execute("SELECT path, size, mtime_ns FROM files").fetchall():
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append((path,))
+                continue
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                stale.append((path,))
+        with self.db:
+            self.db.executemany("DELETE FROM files WHERE path = ?", stale)
+            # INSERT OR REPLACE 会分配新的 rowid，rowid 越小记录越早
+            self.db.execute("DELETE FROM files WHERE rowid NOT IN "
+                            "(SELECT rowid FROM files ORDER BY rowid DESC LIMIT ?)", (self.max_files,))
+
+    def report(self) -> Dict:
+        return {"cache_hits": self.hits, "cache_misses": self.misses, "cache_bytes": self.total_bytes()}
@@ -0,0 +1,301 @@
+import re
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from text_matcher import (
+    TEXTPAGE_FLAGS, PageText, TextHit, TextMatcher, collapse_whitespace, normalize_text
+)
+
+
+# 替换规则的可选开关（默认均为 False）：
+#   regex       - old_text 为正则表达式，new_text 可用 \1、\g<name> 引用捕获组
+#   whole_word  - 只匹配完整单词（前后不能紧挨字母、数字或下划线）
+#   ignore_case - 忽略大小写；默认区分大小写，与原有只替换大小写完全一致文本的行为相同
+RULE_OPTIONS = ("regex", "whole_word", "ignore_case")
+
+_BACKREF_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class Rule:
+    """一条编译后的替换规则，index 为其在配置 replacements 中的下标"""
+
+    __slots__ = ("index", "old_text", "new_text", "regex", "whole_word", "ignore_case", "compiled")
+
+    def __init__(self, index: int, replacement: Dict):
+        self.index = index
+        self.old_text = replacement["old_text"]
+        self.new_text = replacement["new_text"]
+        for option in RULE_OPTIONS:
+            value = replacement.get(option, False)
+            if not isinstance(value, bool):
+                raise ValueError(f"第 {index} 个替换项的 {option} 应该是 true 或 false")
+            setattr(self, option, value)
+
+        self.compiled = None
+        if not self.uses_automaton and self.old_text:
+            try:
+                self.compiled = re.compile(self.pattern(), re.IGNORECASE if self.ignore_case else 0)
+                if self.regex:
+                    # 提前检查 new_text 中的捕获组引用
+                    self.compiled.sub(self.new_text, "")
+            except re.error as e:
+                raise ValueError(f"第 {index} 个替换项的正则表达式无效: {e}") from e
+
+    @property
+    def uses_automaton(self) -> bool:
+        """普通文本规则由 Aho-Corasick 自动机匹配，其余规则编译为正则表达式"""
+        return not self.regex and not self.whole_word
+
+    def pattern(self) -> str:
+        """规则对应的正则表达式（作用于 collapse_whitespace 处理后的原文）"""
+        body = self.old_text if self.regex else re.escape(collapse_whitespace(self.old_text))
+        if self.whole_word:
+            body = rf"(?<!\w)(?:{body})(?!\w)"
+        return body
+
+    def key(self) -> Tuple:
+        """去重用的键：匹配行为完全相同的规则键相同"""
+        if self.regex:
+            text = self.old_text
+        elif self.ignore_case:
+            text = normalize_text(self.old_text)
+        else:
+            text = collapse_whitespace(self.old_text)
+        return (text, self.regex, self.whole_word, self.ignore_case)
+
+    def expand(self, match) -> str:
+        return match.expand(self.new_text) if self.regex else self.new_text
+
+
+class RuleSet:
+    """由配置 replacements 一次编译得到的规则集合
+
+    编译时去掉重复规则，记录冲突（匹配相同、替换不同，保留靠前的一条）
+    和包含关系（一条规则的文本是另一条的一部分）。匹配计划：
+    忽略大小写的普通文本规则和区分大小写的普通文本规则各编译为一个
+    Aho-Corasick 自动机，正则/整词规则合并为一个正则表达式，
+    一页文本只需扫描一遍。重叠命中按以下优先级取舍：起始位置靠前者优先；
+    起始相同时较长者优先；仍相同时配置中靠前的规则优先。
+
+    需要同时提供规范化文本（normalize_text）和保留大小写的原文
+    （collapse_whitespace，与前者逐字符对应）；只有前者时按忽略大小写近似匹配。
+    """
+
+    def __init__(self, replacements: List[Dict]):
+        self.replacements = replacements
+        self.logger = logging.getLogger(__name__)
+        self.rules: List[Rule] = []
+        # (被去掉的规则下标, 保留的规则下标)
+        self.duplicates: List[Tuple[int, int]] = []
+        self.conflicts: List[Tuple[int, int]] = []
+        # (被包含的规则下标, 包含它的规则下标)
+        self.overlaps: List[Tuple[int, int]] = []
+
+        kept: Dict[Tuple, Rule] = {}
+        for idx, replacement in enumerate(replacements):
+            rule = Rule(idx, replacement)
+            if not rule.old_text:
+                continue
+            first = kept.get(rule.key())
+            if first is None:
+                kept[rule.key()] = rule
+                self.rules.append(rule)
+            elif first.new_text == rule.new_text:
+                self.duplicates.append((idx, first.index))
+            else:
+                self.conflicts.append((idx, first.index))
+        self._by_index = {rule.index: rule for rule in self.rules}
+
+        count = len(replacements)
+        self._folded = self._automaton([r for r in self.rules if r.uses_automaton and r.ignore_case],
+                                       count, case_sensitive=False)
+        self._exact = self._automaton([r for r in self.rules if r.uses_automaton and not r.ignore_case],
+                                      count, case_sensitive=True)
+        self._regex_rules = [r for r in self.rules if not r.uses_automaton]
+        self._combined, self._separate = self._combine(self._regex_rules)
+        self._find_overlaps()
+        self._log_findings()
+
+    @classmethod
+    def from_replacements(cls, replacements: List[Dict]) -> "RuleSet":
+        return cls(replacements)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "RuleSet":
+        return cls(config.get("replacements") or [])
+
+    @staticmethod
+    def _automaton(rules: List[Rule], count: int, case_sensitive: bool) -> Optional[TextMatcher]:
+        if not rules:
+            return None
+        # 自动机中的模式下标与配置下标一致，不参与的规则留空
+        patterns = [""] * count
+        for rule in rules:
+            patterns[rule.index] = rule.old_text
+        return TextMatcher(patterns, case_sensitive=case_sensitive)
+
+    @staticmethod
+    def _combine(rules: List[Rule]) -> Tuple[Optional["re.Pattern"], List[Rule]]:
+        """把正则规则合并为一个表达式；含反向引用等无法合并的规则单独匹配"""
+        mergeable = [r for r in rules if not (r.regex and _BACKREF_RE.search(r.old_text))]
+        separate = [r for r in rules if r not in mergeable]
+        if not mergeable:
+            return None, separate
+        parts = [f"(?P<_r{r.index}>(?{'i' if r.ignore_case else ''}:{r.pattern()}))" for r in mergeable]
+        try:
+            return re.compile("|".join(parts)), separate
+        except re.error:
+            return None, rules
+
+    def _find_overlaps(self):
+        for automaton in (self._folded, self._exact):
+            if automaton is None:
+                continue
+            for idx, pattern in enumerate(automaton.patterns):
+                if not pattern:
+                    continue
+                for _start, _end, inner in automaton.scan(pattern):
+                    if inner != idx:
+                        self.overlaps.append((inner, idx))
+
+    def _log_findings(self):
+        for idx, first in self.duplicates:
+            self.logger.info(f"第 {idx} 个替换项与第 {first} 个重复，已忽略")
+        for idx, first in self.conflicts:
+            self.logger.warning(f"第 {idx} 个替换项与第 {first} 个匹配相同但替换文本不同，只使用第 {first} 个")
+        for inner, outer in self.overlaps:
+            self.logger.info(f"第 {inner} 个替换项的文本包含在第 {outer} 个替换项中，重叠时较长者优先")
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def rule(self, index: int) -> Rule:
+        return self._by_index[index]
+
+    def scan(self, folded: str, original: Optional[str] = None) -> List[Tuple[int, int, int]]:
+        """返回所有规则的原始命中 (start, end, rule_index)，允许重叠"""
+        if original is None:
+            original = folded
+        found = []
+        if self._folded is not None:
+            found.extend(self._folded.scan(folded))
+        if self._exact is not None:
+            found.extend(self._exact.scan(original))
+        if self._combined is not None:
+            for m in self._combined.finditer(original):
+                if m.end() > m.start():
+                    found.append((m.start(), m.end(), int(m.lastgroup[2:])))
+        for rule in self._separate:
+            for m in rule.compiled.finditer(original):
+                if m.end() > m.start():
+                    found.append((m.start(), m.end(), rule.index))
+        return found
+
+    def find_all(self, folded: str, original: Optional[str] = None) -> List[Tuple[int, int, int]]:
+        """返回按优先级消解重叠后的命中 (start, end, rule_index)"""
+        found = self.scan(folded, original)
+        found.sort(key=lambda m: (m[0], m[0] - m[1], m[2]))
+
+        resolved = []
+        last_end = 0
+        for start, end, idx in found:
+            if start >= last_end:
+                resolved.append((start, end, idx))
+                last_end = end
+        return resolved
+
+    def count(self, folded: str, original: Optional[str] = None) -> Dict[int, int]:
+        """按规则统计命中次数"""
+        counts: Dict[int, int] = {}
+        for _start, _end, idx in self.find_all(folded, original):
+            counts[idx] = counts.get(idx, 0) + 1
+        return counts
+
+    def contains_any(self, folded: str, original: Optional[str] = None) -> bool:
+        """快速判断文本中是否可能存在任一规则的命中"""
+        if original is None:
+            original = folded
+        if self._folded is not None and self._folded.contains_any(folded):
+            return True
+        if self._exact is not None and self._exact.contains_any(original):
+            return True
+        if self._combined is not None and self._combined.search(original):
+            return True
+        return any(rule.compiled.search(original) for rule in self._separate)
+
+    @staticmethod
+    def page_texts(page, textpage=None) -> Tuple[str, str]:
+        """提取页面纯文本，返回 (规范化文本, 保留大小写的原文)"""
+        if textpage is None:
+            text = page.get_text("text", flags=TEXTPAGE_FLAGS)
+        else:
+            text = page.get_text("text", textpage=textpage)
+        original = collapse_whitespace(text)
+        return normalize_text(original), original
+
+    def page_may_match(self, page, textpage=None) -> bool:
+        """页面预筛选：只做纯文本提取，不提取字符坐标和布局"""
+        return self.contains_any(*self.page_texts(page, textpage))
+
+    def new_text_for(self, index: int, original: str, start: int) -> str:
+        """命中对应的替换文本；正则规则按捕获组展开"""
+        rule = self._by_index[index]
+        if not rule.regex:
+            return rule.new_text
+        m = rule.compiled.match(original, start)
+        return rule.expand(m) if m else rule.new_text
+
+    def search_page(self, page_text: PageText) -> List[TextHit]:
+        """在页面字符流中一次扫描找出所有规则的命中"""
+        hits = []
+        for start, end, idx in self.find_all(page_text.text, page_text.original):
+            rects = page_text.rects_for(start, end)
+            if rects:
+                hits.append(TextHit(idx, start, end, page_text.original_text(start, end), rects,
+                                    self.new_text_for(idx, page_text.original, start)))
+        return hits
+
+    def rule_matches(self, index: int, text: str) -> bool:
+        """该规则能否在给定文本中命中（用于判断新文本本身是否包含原文）"""
+        rule = self._by_index.get(index)
+        if rule is None:
+            return False
+        original = collapse_whitespace(text)
+        if rule.uses_automaton:
+            if rule.ignore_case:
+                return normalize_text(rule.old_text) in normalize_text(original)
+            return collapse_whitespace(rule.old_text) in original
+        return rule.compiled.search(original) is not None
+
+    def literal_terms(self) -> List[str]:
+        """所有可用于子串检索的规范化文本（普通文本规则和整词规则）"""
+        return sorted({normalize_text(r.old_text) for r in self.rules if not r.regex})
+
+    def regex_rules(self) -> List[Rule]:
+        return [r for r in self.rules if r.regex]
+
+    def stream_pattern(self, indices: Optional[Iterable[int]] = None) -> Optional["re.Pattern"]:
+        """内容流改写用的合并表达式（作用于未合并空白的原文），无法合并时返回 None
+
+        indices 不为空时只合并这些规则（例如某一页实际命中的规则），
+        规则很多时逐字符尝试所有分支的代价与规则数成正比。
+        普通文本规则按长度从长到短排列，与自动机“起始相同取较长者”的取舍一致。
+        """
+        if self._separate:
+            return None
+        wanted = set(indices) if indices is not None else None
+        rules = [r for r in self.rules if wanted is None or r.index in wanted]
+        literals = sorted((r for r in rules if r.uses_automaton),
+                          key=lambda r: (-len(r.old_text), r.index))
+        ordered = literals + [r for r in rules if not r.uses_automaton]
+        if not ordered:
+            return None
+        parts = [f"(?P<_r{r.index}>(?{'i' if r.ignore_case else ''}:{r.pattern()}))" for r in ordered]
+        try:
+            return re.compile("|".join(parts))
+        except re.error:
+            return None
+
+    def report(self) -> Dict:
+        return {"rules": len(self.rules), "duplicates": self.duplicates,
+                "conflicts": self.conflicts, "overlaps": self.overlaps}
@@ -0,0 +1,84 @@
+import os
+import time
+from typing import Dict, Optional
+
+
+# 保存方案：
+#   fast     - 只清理未引用对象，不重新压缩，已压缩的流原样保留
+#   balanced - 只清理未引用对象，仅压缩尚未压缩的流
+#   compact  - 压缩对象、合并重复对象并压缩所有流（原有默认行为）
+SAVE_PROFILES: Dict[str, Dict] = {
+    "fast": {"garbage": 1, "deflate": False},
+    "balanced": {"garbage": 1, "deflate": True},
+    "compact": {"garbage": 4, "deflate": True},
+}
+
+DEFAULT_SAVE_PROFILE = "compact"
+
+# 替换或 redaction 之后，原文所在的旧内容流不再被页面引用但仍在文件中，
+# 必须至少做一级垃圾回收才能删除；任何方案都不低于该级别，也从不增量保存
+MIN_GARBAGE = 1
+
+
+def get_save_profile(name: Optional[str]) -> Dict:
+    """按名称获取保存方案，未指定时使用默认方案；垃圾回收级别不低于 MIN_GARBAGE"""
+    name = name or DEFAULT_SAVE_PROFILE
+    if name not in SAVE_PROFILES:
+        raise ValueError(f"未知的保存方案: {name}，可选: {', '.join(SAVE_PROFILES)}")
+    options = dict(SAVE_PROFILES[name])
+    options["garbage"] = max(options.get("garbage", 0), MIN_GARBAGE)
+    return options
+
+
+def is_file_object(obj) -> bool:
+    """输入输出除文件路径外也可以是文件对象（有 read / write 方法）"""
+    return hasattr(obj, "read") or hasattr(obj, "write")
+
+
+def _is_same_file(doc, output_path) -> bool:
+    if is_file_object(output_path):
+        return False
+    return bool(doc.name) and os.path.abspath(doc.name) == os.path.abspath(output_path)
+
+
+def save_document(doc, output_path, profile: Optional[str] = None,
+                  source_path: Optional[str] = None, source_bytes: Optional[int] = None) -> Dict:
+    """按保存方案写出文档，返回保存耗时、输出大小以及相对输入文件的大小变化
+
+    output_path 也可以是可写的文件对象，此时把序列化结果写入其中。
+    输入不是文件（字节串或文件对象）时通过 source_bytes 给出原始大小。
+
+    总是完整保存并回收未引用对象（见 MIN_GARBAGE），被替换的原文不会留在输出文件中。
+    原地保存（输出即输入文件）时先在内存中序列化，再关闭文档并覆盖原文件，
+    因此调用方需检查 doc.is_closed。
+    """
+    options = get_save_profile(profile)
+    in_place = _is_same_file(doc, output_path)
+
+    # 原地保存时输入文件会被覆盖，先记录原始大小
+    if source_bytes is None and source_path and not is_file_object(source_path) \
+            and os.path.exists(source_path):
+        source_bytes = os.path.getsize(source_path)
+
+    start = time.perf_counter()
+    if is_file_object(output_path):
+        data = doc.tobytes(**options)
+        output_path.write(data)
+        output_bytes = len(data)
+    elif in_place:
+        data = doc.tobytes(**options)
+        doc.close()
+        with open(output_path, "wb") as f:
+            f.write(data)
+    else:
+        doc.save(output_path, **options)
+    elapsed = time.perf_counter() - start
+
+    if not is_file_object(output_path):
+        output_bytes = os.path.getsize(output_path)
+    return {
+        "save_profile": profile or DEFAULT_SAVE_PROFILE,
+        "save_seconds": elapsed,
+        "output_bytes": output_bytes,
+        "size_delta": output_bytes - source_bytes if source_bytes is not None else 0,
+    }
@@ -0,0 +1,227 @@
+import gc
+import os
+import shutil
+import tempfile
+import logging
+import fitz
+from typing import Callable, Dict, Iterable, List, Optional
+
+from instrumentation import Instrumentation
+from page_sharding import count_pages, merge_stats
+from progress import checkpoint
+from save_profiles import DEFAULT_SAVE_PROFILE, is_file_object, save_document
+
+
+# 流式处理时每个窗口的默认页数
+DEFAULT_WINDOW_PAGES = 32
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def is_byte_source(obj) -> bool:
+    return isinstance(obj, (bytes, bytearray, memoryview))
+
+
+def describe_source(obj) -> str:
+    """日志中显示的输入/输出名称"""
+    if is_byte_source(obj):
+        return f"<{len(obj)} 字节>"
+    if is_file_object(obj):
+        name = getattr(obj, "name", None)
+        return name if isinstance(name, str) else "<文件对象>"
+    return str(obj)
+
+
+def open_pdf(source) -> fitz.Document:
+    """打开文件路径、字节串或文件对象形式的 PDF（后两者读入内存后打开）"""
+    if is_byte_source(source):
+        return fitz.open(stream=bytes(source), filetype="pdf")
+    if is_file_object(source):
+        return fitz.open(stream=source.read(), filetype="pdf")
+    return fitz.open(source)
+
+
+def count_source_pages(source) -> int:
+    """文件路径或字节串形式的输入的页数，只读取页树"""
+    if is_byte_source(source):
+        with fitz.open(stream=bytes(source), filetype="pdf") as doc:
+            return len(doc)
+    return count_pages(source)
+
+
+def source_size(source) -> Optional[int]:
+    """输入的原始大小；文件对象无法预先得知时返回 None"""
+    if is_byte_source(source):
+        return len(source)
+    if is_file_object(source):
+        return None
+    return os.path.getsize(source) if os.path.exists(source) else None
+
+
+def copy_source(source, path: str):
+    """把输入分块写到 path，不把整个文件读入内存"""
+    if is_byte_source(source):
+        with open(path, "wb") as f:
+            f.write(source)
+    elif is_file_object(source):
+        with open(path, "wb") as f:
+            shutil.copyfileobj(source, f, _COPY_CHUNK)
+    else:
+        shutil.copyfile(source, path)
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节）；既没有 /proc 也没有安装 psutil 时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def release_memory():
+    """清空 MuPDF 的对象和字形缓存，并回收已释放的 Python 包装对象"""
+    gc.collect()
+    fitz.TOOLS.store_shrink(100)
+
+
+class WindowedProcessor:
+    """按页窗口分批处理大文档，内存占用取决于窗口大小而不是文档页数
+
+    输入先分块复制为工作文件。每个窗口重新打开工作文件，处理窗口内的页面，
+    增量保存后关闭文档并清空 MuPDF 缓存，页面对象、文本页和显示列表随之释放。
+    memory_limit_mb 是软上限：窗口处理完后常驻内存超过上限时把之后的窗口减半（最少一页），
+    不会中断处理，也不保证峰值不超过上限；超过上限的窗口数记录在 memory_limit_exceeded 中。
+
+    最后的保存由 save_document 完整重写并回收未引用对象，被替换的原文不会留在输出中。
+    MuPDF 只在同一次打开中按内容去重字体，多个窗口都嵌入了字体时改用 compact 方案
+    合并重复的字体对象，原方案记录在 requested_save_profile 中。
+    """
+
+    def __init__(self, window_pages: int = DEFAULT_WINDOW_PAGES,
+                 memory_limit_mb: Optional[float] = None):
+        if window_pages <= 0:
+            raise ValueError(f"窗口页数必须大于 0: {window_pages}")
+        self.window_pages = window_pages
+        self.memory_limit = int(memory_limit_mb * 1024 * 1024) if memory_limit_mb else None
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _work_dir(destination) -> Optional[str]:
+        """工作文件放在输出文件所在目录，最后用 os.replace 原子替换"""
+        if is_file_object(destination):
+            return None
+        parent = os.path.dirname(os.path.abspath(destination))
+        os.makedirs(parent, exist_ok=True)
+        return parent
+
+    def _save_window(self, doc, path: str):
+        if not doc.is_dirty:
+            return
+        try:
+            doc.save(path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        except Exception as e:
+            # 打开时修复过的文件等无法增量保存，整体重写工作文件
+            self.logger.info(f"无法增量保存，重写工作文件: {e}")
+            tmp_path = f"{path}.tmp"
+            doc.save(tmp_path, garbage=1)
+            doc.close()
+            os.replace(tmp_path, path)
+
+    def run(self, source, destination, process_window: Callable[[fitz.Document, List[int]], Dict],
+            pages: Optional[Iterable[int]] = None, save_profile: Optional[str] = None,
+            finish: Optional[Callable[[fitz.Document], Dict]] = None,
+            instrumentation: Optional[Instrumentation] = None) -> Dict:
+        """处理 source 并写到 destination（文件路径或可写的文件对象），返回合并后的统计
+
+        process_window(doc, page_numbers) 处理一个窗口并返回统计信息；
+        pages 不为空时只处理这些页且输出只包含这些页；
+        finish(doc) 在最终保存前对整个文档调用一次（例如字体子集化）。
+        复制、打开和保存的耗时记录在 instrumentation 的 open / save 阶段。
+        """
+        instr = instrumentation or Instrumentation()
+        workdir = tempfile.mkdtemp(prefix="pdf_stream_", dir=self._work_dir(destination))
+        working = os.path.join(workdir, "working.pdf")
+        try:
+            with instr.stage("open"):
+                copy_source(source, working)
+                source_bytes = os.path.getsize(working)
+                with fitz.open(working) as doc:
+                    page_count = len(doc)
+            selected = list(pages) if pages is not None else list(range(page_count))
+
+            stats: Dict = {}
+            window = self.window_pages
+            windows = font_windows = exceeded = 0
+            peak_rss = 0
+            pos = 0
+            while pos < len(selected):
+                chunk = selected[pos:pos + window]
+                with instr.stage("open"):
+                    doc = fitz.open(working)
+                try:
+                    window_stats = process_window(doc, chunk)
+                    with instr.stage("save"):
+                        self._save_window(doc, working)
+                finally:
+                    if not doc.is_closed:
+                        doc.close()
+                del doc
+                release_memory()
+
+                merge_stats(stats, window_stats)
+                font_windows += bool(window_stats.get("font_embeds"))
+                windows += 1
+                pos += len(chunk)
+
+                rss = current_rss()
+                if rss is not None:
+                    peak_rss = max(peak_rss, rss)
+                    if self.memory_limit and rss > self.memory_limit:
+                        exceeded += 1
+                        if window > 1:
+                            window = max(1, window // 2)
+                            self.logger.info(f"常驻内存 {rss} 字节超过上限，窗口缩小为 {window} 页")
+                        else:
+                            self.logger.warning(f"常驻内存 {rss} 字节超过上限，窗口已是 1 页，无法再缩小")
+
+            if font_windows > 1 and save_profile != "compact":
+                self.logger.info(f"{font_windows} 个窗口分别嵌入了字体，"
+                                 f"保存方案由 {save_profile or DEFAULT_SAVE_PROFILE} 改为 compact 以合并重复字体")
+                stats["requested_save_profile"] = save_profile or DEFAULT_SAVE_PROFILE
+                save_profile = "compact"
+
+            # 取消时工作目录整体删除，目标文件保持不变
+            checkpoint(0)
+            output_path = os.path.join(workdir, "output.pdf")
+            with instr.stage("open"):
+                doc = fitz.open(working)
+            try:
+                if pages is not None:
+                    doc.select(selected)
+                if finish is not None:
+                    stats.update(finish(doc))
+                with instr.stage("save"):
+                    stats.update(save_document(doc, output_path, save_profile, source_bytes=source_bytes))
+            finally:
+                if not doc.is_closed:
+                    doc.close()
+
+            with instr.stage("save"):
+                if is_file_object(destination):
+                    with open(output_path, "rb") as f:
+                        shutil.copyfileobj(f, destination, _COPY_CHUNK)
+                else:
+                    os.replace(output_path, destination)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        stats.update({"windows": windows, "final_window_pages": window, "peak_rss_bytes": peak_rss})
+        if self.memory_limit:
+            stats["memory_limit_exceeded"] = exceeded
+        return stats
@@ -0,0 +1,166 @@
+import re
+import json
+import bisect
+import hashlib
+import fitz
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from text_matcher import TextHit, collapse_whitespace
+
+
+# 缓存的页面指纹数量上限，以及同一指纹下保留的布局变体数
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_VARIANTS = 4
+
+# 确认命中时缓存矩形与实际命中矩形允许的坐标误差（pt）
+_RECT_TOLERANCE = 0.5
+
+
+def ruleset_digest(replacements: List[Dict]) -> str:
+    """替换规则的摘要；规则不同的布局互不复用"""
+    data = json.dumps(replacements, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+# 内容流中的颜色设置（操作数和操作符），用于区分颜色不同的模板
+_COLOR_RE = re.compile(rb"(?:[-+]?[\d.]+\s+){1,4}(?:rg|RG|k|K|g|G|sc|SC|scn|SCN)(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])")
+
+
+def page_fingerprint(page) -> Tuple:
+    """页面模板指纹：页面尺寸、旋转、使用的字体，以及静态内容（图片、表单对象和颜色）
+
+    由同一模板生成的页面（发票、对账单等）指纹相同，正文中的可变数据不影响指纹；
+    指纹只用于找到候选布局，是否可以复用由 LayoutCache.lookup 确认。
+    """
+    rect = page.rect
+    fonts = tuple(sorted({(font[3], font[2]) for font in page.get_fonts()}))
+    images = sorted((img[2], img[3], img[4], img[5], img[8]) for img in page.get_images())
+    forms = sorted(tuple(round(v, 1) for v in xobject[3]) for xobject in page.get_xobjects())
+    colors = sorted({b" ".join(m.split()) for m in _COLOR_RE.findall(page.read_contents())})
+    static = hashlib.sha1(repr((images, forms, colors)).encode("latin-1")).hexdigest()
+    return (round(rect.width, 1), round(rect.height, 1), page.rotation, fonts, static)
+
+
+def _same_rect(a: fitz.Rect, b: fitz.Rect) -> bool:
+    return (abs(a.x0 - b.x0) <= _RECT_TOLERANCE and abs(a.y0 - b.y0) <= _RECT_TOLERANCE
+            and abs(a.x1 - b.x1) <= _RECT_TOLERANCE and abs(a.y1 - b.y1) <= _RECT_TOLERANCE)
+
+
+def _occurrences(text: str, needle: str) -> List[int]:
+    """needle 在 text 中互不重叠的出现位置"""
+    starts = []
+    pos = text.find(needle)
+    while pos >= 0:
+        starts.append(pos)
+        pos = text.find(needle, pos + len(needle))
+    return starts
+
+
+def locate_hits(textpage, texts: Tuple[str, str], matcher) -> Optional[List[Tuple[int, str, str, fitz.Rect]]]:
+    """不做字符级提取，定位本页纯文本中的命中，返回 [(规则下标, 原文, 替换文本, 矩形), ...]
+
+    命中由 RuleSet 在纯文本上判定（大小写、整词边界等与完整流程一致）；
+    位置取 TextPage.search（忽略大小写）按顺序返回的第 k 个矩形，k 为该命中在
+    同一文本所有不区分大小写的出现中的序号。出现次数与矩形数不一致（例如命中跨行）时返回 None。
+    """
+    folded, original = texts
+    found: Dict[str, Tuple[List[int], List[fitz.Rect]]] = {}
+    located = []
+    for start, end, idx in matcher.find_all(folded, original):
+        needle = folded[start:end]
+        if needle not in found:
+            starts = _occurrences(folded, needle)
+            rects = textpage.search(original[start:end], quads=False)
+            if len(rects) != len(starts):
+                return None
+            found[needle] = (starts, rects)
+        starts, rects = found[needle]
+        k = bisect.bisect_left(starts, start)
+        if k == len(starts) or starts[k] != start:
+            return None
+        located.append((idx, original[start:end], matcher.new_text_for(idx, original, start), rects[k]))
+    return located
+
+
+class LayoutCache:
+    """模板化文档的页面布局缓存
+
+    以页面指纹和规则摘要为键，保存该页每个命中的原文、矩形以及该处文字的
+    字体、字号和颜色。指纹相同的页面先比较纯文本中各规则的命中次数，
+    再用 locate_hits 定位本页的命中，与缓存逐个一致时直接复用缓存的样式，
+    跳过字符级提取、匹配和样式查找；否则由调用方按完整流程处理并存入新的变体。
+    只缓存每个命中都在同一行内（只有一个矩形）的页面。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_variants: int = DEFAULT_MAX_VARIANTS):
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self._entries: "OrderedDict[Tuple, List[Dict]]" = OrderedDict()
+        self._digests: Dict[int, Tuple[List[Dict], str]] = {}
+
+    def _digest(self, matcher) -> str:
+        # 同一个 RuleSet 只计算一次摘要；保留 replacements 的引用，id 不会被复用
+        cached = self._digests.get(id(matcher))
+        if cached is None or cached[0] is not matcher.replacements:
+            cached = (matcher.replacements, ruleset_digest(matcher.replacements))
+            self._digests[id(matcher)] = cached
+        return cached[1]
+
+    def key(self, page, matcher) -> Tuple:
+        return (self._digest(matcher), page_fingerprint(page))
+
+    @staticmethod
+    def _reuse(layout: Dict, located) -> Optional[List[Dict]]:
+        if len(located) != len(layout["hits"]):
+            return None
+        hits = []
+        for (idx, text, new_text, rect), item in zip(located, layout["hits"]):
+            if idx != item["rule"] or text != item["text"] or not _same_rect(rect, item["rect"]):
+                return None
+            hits.append({"text": text, "rect": rect, "new_text": new_text, "style": item["style"]})
+        return hits
+
+    def lookup(self, key: Tuple, textpage, texts: Tuple[str, str], counts: Dict[int, int],
+               matcher) -> Optional[List[Dict]]:
+        """返回确认可复用的命中列表（每项含 text、rect、new_text、style），没有时返回 None
+
+        texts 为该页的纯文本（RuleSet.page_texts），counts 为其中各规则的命中次数（RuleSet.count）。
+        style 为 {"font", "size", "color"}，原位置找不到文字样式时为 None。
+        """
+        variants = self._entries.get(key)
+        if variants is None:
+            return None
+        self._entries.move_to_end(key)
+        candidates = [layout for layout in variants if layout["counts"] == counts]
+        if not candidates:
+            return None
+        located = locate_hits(textpage, texts, matcher)
+        if located is None:
+            return None
+        for layout in candidates:
+            hits = self._reuse(layout, located)
+            if hits is not None:
+                return hits
+        return None
+
+    def store(self, key: Tuple, counts: Dict[int, int], hits: List[TextHit],
+              styles: List[Optional[Dict]]):
+        """保存一页的解析结果：RuleSet.search_page 的命中及每个命中处的样式"""
+        if not hits or any(len(hit.rects) != 1 for hit in hits):
+            return
+        layout = {
+            "counts": dict(counts),
+            "hits": [{"rule": hit.rule_index, "text": collapse_whitespace(hit.text),
+                      "rect": fitz.Rect(hit.rects[0]), "style": style}
+                     for hit, style in zip(hits, styles)],
+        }
+        variants = self._entries.setdefault(key, [])
+        self._entries.move_to_end(key)
+        variants.insert(0, layout)
+        del variants[self.max_variants:]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
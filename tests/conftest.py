@@ -0,0 +1,34 @@
+import os
+import sys
+
+import fitz
+import pytest
+
+# 各模块位于仓库根目录，没有打包成包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts")
+
+
+def make_pdf(path, pages):
+    """生成测试用 PDF：pages 中每项是一页的 [(x, y, 文本), ...]"""
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        for x, y, text in lines:
+            page.insert_text((x, y), text, fontsize=11)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def page_texts(path):
+    with fitz.open(str(path)) as doc:
+        return [page.get_text() for page in doc]
+
+
+@pytest.fixture
+def pdf_factory(tmp_path):
+    def factory(pages, name="input.pdf"):
+        return make_pdf(tmp_path / name, pages)
+    return factory
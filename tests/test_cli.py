@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from main import collect_inputs, plan_jobs
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+    return path
+
+
+def test_same_name_in_two_inputs_is_a_conflict(tmp_path):
+    a = _touch(str(tmp_path / "a" / "x.pdf"))
+    b = _touch(str(tmp_path / "b" / "x.pdf"))
+    out = str(tmp_path / "out")
+    with pytest.raises(ValueError, match="输出路径冲突"):
+        plan_jobs(collect_inputs([a, b]), out)
+    with pytest.raises(ValueError, match="输出路径冲突"):
+        plan_jobs(collect_inputs([str(tmp_path / "a"), str(tmp_path / "b")]), out)
+    assert not os.path.exists(out)
+
+
+def test_relative_paths_under_one_root_do_not_conflict(tmp_path):
+    _touch(str(tmp_path / "in" / "a" / "x.pdf"))
+    _touch(str(tmp_path / "in" / "b" / "x.pdf"))
+    jobs = plan_jobs(collect_inputs([str(tmp_path / "in")], recursive=True), str(tmp_path / "out"))
+    assert sorted(os.path.relpath(output, str(tmp_path / "out")) for _path, output in jobs) == [
+        os.path.join("a", "x.pdf"), os.path.join("b", "x.pdf")]
+
+
+def test_missing_inputs_are_reported(tmp_path):
+    existing = _touch(str(tmp_path / "x.pdf"))
+    errors = []
+    found = collect_inputs([existing, str(tmp_path / "missing.pdf"), str(tmp_path / "*.nothing")],
+                           errors=errors)
+    assert [path for path, _root in found] == [existing]
+    assert len(errors) == 2
+    with pytest.raises(ValueError, match="missing.pdf"):
+        collect_inputs([str(tmp_path / "missing.pdf")])
+
+
+def test_cli_exits_with_error_for_missing_input(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"replacements": [{"old_text": "a", "new_text": "b"}]}), encoding="utf-8")
+    existing = _touch(str(tmp_path / "x.pdf"))
+    # 命令行会重定向进程的标准输出，在子进程中运行
+    proc = subprocess.run([sys.executable, MAIN, "-c", str(config), existing,
+                           str(tmp_path / "missing.pdf"), str(tmp_path / "*.nothing")],
+                          capture_output=True, text=True, encoding="utf-8")
+    assert proc.returncode == 2
+    events = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [event["event"] for event in events] == ["error", "error"]
@@ -0,0 +1,146 @@
+import fitz
+import pytest
+
+from content_stream import ContentStreamRewriter, check_engine, encode_literal, tokenize
+from rule_set import RuleSet
+
+
+def _page_with_stream(stream: bytes):
+    """页面资源中有 Helvetica（/helv）和 Symbol（/symb），内容流替换为给定内容"""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "x", fontname="helv")
+    page.insert_text((50, 70), "x", fontname="symb")
+    page.clean_contents()
+    doc.update_stream(page.get_contents()[0], stream)
+    return doc, page
+
+
+def _rewrite(stream: bytes, replacements):
+    doc, page = _page_with_stream(stream)
+    rules = RuleSet(replacements)
+    expected = rules.count(*rules.page_texts(page))
+    count = ContentStreamRewriter(doc, rules).rewrite_page(page, expected)
+    data = doc.xref_stream(page.get_contents()[0])
+    text = " ".join(page.get_text().split())
+    doc.close()
+    return count, data, text
+
+
+def test_tj_is_rewritten():
+    count, data, text = _rewrite(b"BT /helv 11 Tf 50 100 Td (Hello World) Tj ET",
+                                 [{"old_text": "World", "new_text": "Earth"}])
+    assert count == 1
+    assert b"(Hello Earth) Tj" in data
+    assert text == "Hello Earth"
+
+
+def test_tj_array_drops_kerning_inside_the_match_only():
+    count, data, text = _rewrite(b"BT /helv 11 Tf 50 100 Td [(Hel) -20 (lo W) 30 (orld) 15 (!)] TJ ET",
+                                 [{"old_text": "World", "new_text": "Earth"}])
+    assert count == 1
+    assert b"[(Hel) -20 (lo Earth) 15 (!)] TJ" in data
+    assert text == "Hello Earth!"
+
+
+def test_escaped_literal_strings():
+    count, data, text = _rewrite(b"BT /helv 11 Tf 50 100 Td (call \\(555\\) now\\\\\\101) Tj ET",
+                                 [{"old_text": "(555)", "new_text": "(999)"}])
+    assert count == 1
+    assert b"(call \\(999\\) now\\\\A) Tj" in data
+    assert text == "call (999) now\\A"
+
+
+def test_hex_strings():
+    count, data, text = _rewrite(b"BT /helv 11 Tf 50 100 Td <48656C6C6F20576F726C64> Tj ET",
+                                 [{"old_text": "World", "new_text": "Earth"}])
+    assert count == 1
+    assert text == "Hello Earth"
+
+
+def test_q_Q_restores_the_font():
+    # Q 之后的文字仍使用 q 之前选定的 /helv；若沿用 /symb 则无法解码，整页回退
+    stream = (b"BT /helv 11 Tf ET q BT /symb 11 Tf 50 120 Td (abc) Tj ET Q "
+              b"BT 50 100 Td (Hello World) Tj ET")
+    count, data, _text = _rewrite(stream, [{"old_text": "World", "new_text": "Earth"}])
+    assert count == 1
+    assert b"(Hello Earth) Tj" in data
+
+
+def test_regex_rule_expands_groups():
+    count, data, _text = _rewrite(b"BT /helv 11 Tf 50 100 Td (INV-42) Tj ET",
+                                  [{"old_text": r"INV-(\d+)", "new_text": r"No.\1", "regex": True}])
+    assert count == 1
+    assert b"(No.42) Tj" in data
+
+
+def test_mismatch_leaves_the_page_untouched():
+    # 规则文本跨两个 Tj：内容流中找不到，页面文本中却有命中，整页交给 redaction
+    stream = b"BT /helv 11 Tf 50 100 Td (Hello Wor) Tj (ld) Tj ET"
+    count, data, _text = _rewrite(stream, [{"old_text": "World", "new_text": "Earth"}])
+    assert count is None
+    assert data == stream
+
+
+def test_unencodable_text_falls_back():
+    stream = b"BT /helv 11 Tf 50 100 Td (Hello World) Tj ET"
+    count, data, _text = _rewrite(stream, [{"old_text": "World", "new_text": "世界"}])
+    assert count is None
+    assert data == stream
+
+
+def test_tokenize_skips_inline_images():
+    tokens = list(tokenize(b"BI /W 1 /H 1 ID \x00(\xff) EI (text) Tj"))
+    assert [t.kind for t in tokens][-2:] == ["string", "op"]
+    assert tokens[-2].value == b"text"
+
+
+def test_encode_literal_escapes():
+    assert encode_literal(b"a(b)\\c\n\xe9") == b"(a\\(b\\)\\\\c\\012\\351)"
+
+
+def test_check_engine():
+    assert check_engine("stream") == "stream"
+    with pytest.raises(ValueError):
+        check_engine("fast")
+
+
+def test_pattern_is_compiled_from_the_rules_that_hit_the_page():
+    replacements = [{"old_text": f"term{i:04d}", "new_text": f"TERM{i:04d}"} for i in range(1000)]
+    replacements.append({"old_text": "World", "new_text": "Earth"})
+    doc, page = _page_with_stream(b"BT /helv 11 Tf 50 100 Td (Hello World term0007) Tj ET")
+    rules = RuleSet(replacements)
+    rewriter = ContentStreamRewriter(doc, rules)
+    expected = rules.count(*rules.page_texts(page))
+    assert rewriter.rewrite_page(page, expected) == 2
+    assert list(rewriter._patterns) == [frozenset({7, 1000})]
+    assert b"(Hello Earth TERM0007) Tj" in doc.xref_stream(page.get_contents()[0])
+    doc.close()
+
+
+def test_whole_word_split_across_shows_falls_back():
+    # 真正的整词命中被拆成两个 Tj；另一行的 "Total" 单独成 Tj 但实际是 "Totals" 的一部分。
+    # 次数一致，但改写第二行是错误的位置，必须整页回退
+    stream = b"BT /helv 11 Tf 50 100 Td (To) Tj (tal) Tj ET BT /helv 11 Tf 50 80 Td (Total) Tj (s) Tj ET"
+    count, data, text = _rewrite(stream, [{"old_text": "Total", "new_text": "Sum", "whole_word": True}])
+    assert count is None
+    assert data == stream
+    assert text == "Total Totals"
+
+
+def test_whole_word_split_across_shows_is_replaced_by_redaction(tmp_path):
+    from conftest import FONTS_DIR
+    from main import replace_text_in_pdf
+    doc, _page = _page_with_stream(b"BT /helv 11 Tf 50 100 Td (To) Tj (tal) Tj ET "
+                                   b"BT /helv 11 Tf 50 80 Td (Total) Tj (s) Tj ET")
+    source = str(tmp_path / "split.pdf")
+    doc.save(source)
+    doc.close()
+    out = str(tmp_path / "out.pdf")
+    stats = replace_text_in_pdf(source, out, [{"old_text": "Total", "new_text": "Sum", "whole_word": True}],
+                                fonts_dir=FONTS_DIR, engine="stream", verify=True)
+    assert stats["stream_fallback_pages"] == 1
+    assert stats["residual_hits"] == 0
+    with fitz.open(out) as result:
+        words = result[0].get_text().split()
+    assert "Sum" in words and "Totals" in words and "Total" not in words
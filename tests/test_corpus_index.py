@@ -0,0 +1,93 @@
+import fitz
+import pytest
+
+from batch_engine import BatchEngine
+from conftest import FONTS_DIR, page_texts
+from corpus_index import CorpusIndex
+from main import replace_text_in_pdf
+from result_cache import ResultCache
+from rule_set import RuleSet
+
+ACME = {"old_text": "ACME", "new_text": "Globex"}
+INITECH = {"old_text": "Initech", "new_text": "Hooli"}
+
+
+@pytest.fixture
+def corpus(pdf_factory):
+    return {
+        "acme": pdf_factory([[(50, 60, "nothing here")], [(50, 60, "ACME Corp")],
+                             [(50, 60, "plain page")], [(50, 60, "ACME again")]], "acme.pdf"),
+        "initech": pdf_factory([[(50, 60, "Initech report")], [(50, 60, "other")]], "initech.pdf"),
+        "plain": pdf_factory([[(50, 60, "no matches at all")]], "plain.pdf"),
+    }
+
+
+def _recording(calls):
+    def process(input_pdf, output_pdf, replacements, **kwargs):
+        calls[input_pdf] = kwargs.get("candidate_pages")
+        return replace_text_in_pdf(input_pdf, output_pdf, replacements, **kwargs)
+    return process
+
+
+def _run(corpus, tmp_path, replacements, cache=None, process=replace_text_in_pdf):
+    index = CorpusIndex(str(tmp_path / "index.sqlite"))
+    try:
+        engine = BatchEngine(process, replacements, fonts_dir=FONTS_DIR, workers=1,
+                             index=index, cache=cache)
+        jobs = [(path, str(tmp_path / f"out_{name}.pdf")) for name, path in corpus.items()]
+        return {result["input"]: result for result in engine.run(jobs)}
+    finally:
+        index.close()
+
+
+def test_match_reports_candidate_pages(corpus, tmp_path):
+    index = CorpusIndex(str(tmp_path / "index.sqlite"))
+    try:
+        index.update(list(corpus.values()))
+        matches = index.match(RuleSet([ACME, INITECH]))
+        by_path = {path: matches.get(index.digest_of(path)) for path in corpus.values()}
+    finally:
+        index.close()
+    assert by_path[corpus["acme"]] == {1: {0: 1}, 3: {0: 1}}
+    assert by_path[corpus["initech"]] == {0: {1: 1}}
+    assert not by_path[corpus["plain"]]
+
+
+def test_only_candidate_pages_are_processed(corpus, tmp_path):
+    calls = {}
+    results = _run(corpus, tmp_path, [ACME], process=_recording(calls))
+    # 只有有命中的文件交给处理函数，且只处理命中页
+    assert calls == {corpus["acme"]: [1, 3]}
+    stats = results[corpus["acme"]]["stats"]
+    assert stats["pages"] == 4
+    assert stats["skipped_pages"] == 2
+    assert stats["replacements"] == 2
+    texts = page_texts(tmp_path / "out_acme.pdf")
+    assert "Globex" in texts[1] and "Globex" in texts[3]
+
+
+def test_unmatched_files_are_copied_unchanged(corpus, tmp_path):
+    results = _run(corpus, tmp_path, [ACME])
+    for name in ("initech", "plain"):
+        result = results[corpus[name]]
+        assert result["ok"] and result["unchanged"]
+        with open(corpus[name], "rb") as a, open(tmp_path / f"out_{name}.pdf", "rb") as b:
+            assert a.read() == b.read()
+    assert not results[corpus["acme"]].get("unchanged")
+
+
+def test_adding_a_rule_reprocesses_only_affected_files(corpus, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    try:
+        first = _run(corpus, tmp_path, [ACME], cache)
+        second = _run(corpus, tmp_path, [ACME, INITECH], cache)
+    finally:
+        cache.close()
+    assert not first[corpus["acme"]]["cached"]
+    # acme.pdf 中没有新规则的命中，缓存键不变
+    assert second[corpus["acme"]]["cached"]
+    assert not second[corpus["initech"]].get("cached") and not second[corpus["initech"]].get("unchanged")
+    assert second[corpus["initech"]]["stats"]["replacements"] == 1
+    assert second[corpus["plain"]]["unchanged"]
+    with fitz.open(tmp_path / "out_initech.pdf") as doc:
+        assert "Hooli" in doc[0].get_text()
@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+import io_pipeline
+from batch_engine import BatchEngine
+from conftest import FONTS_DIR, page_texts
+from io_pipeline import WriteBehind, atomic_write
+from main import replace_text_in_pdf
+
+
+class _FailingFile:
+    """写出一半后报错的文件，模拟磁盘写满"""
+
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        self._f.write(data[:len(data) // 2])
+        raise OSError("No space left on device")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+@pytest.fixture
+def failing_writes(monkeypatch):
+    real_fdopen = os.fdopen
+    monkeypatch.setattr(io_pipeline.os, "fdopen", lambda fd, mode: _FailingFile(real_fdopen(fd, mode)))
+
+
+def test_atomic_write_failure_keeps_previous_output(tmp_path, failing_writes):
+    target = tmp_path / "out.pdf"
+    target.write_bytes(b"previous")
+    with pytest.raises(OSError):
+        atomic_write(str(target), b"new content")
+    assert target.read_bytes() == b"previous"
+    assert os.listdir(tmp_path) == ["out.pdf"]
+
+
+def test_write_behind_failure_leaves_no_partial_file(tmp_path, failing_writes):
+    writer = WriteBehind(2)
+    try:
+        results = writer.put({"output": "a", "ok": True}, str(tmp_path / "a.pdf"), b"x" * 1000)
+        results += writer.drain()
+    finally:
+        writer.close()
+    assert [(r["ok"], r["error"].startswith("写出失败")) for r in results] == [(False, True)]
+    assert os.listdir(tmp_path) == []
+
+
+def test_write_behind_returns_results_in_submission_order(tmp_path, monkeypatch):
+    real_write = WriteBehind._write
+
+    def slow_first(path, data):
+        # 先提交的写得更慢，结果仍按提交顺序返回
+        time.sleep(0.05 if path.endswith("0.pdf") else 0)
+        return real_write(path, data)
+
+    monkeypatch.setattr(WriteBehind, "_write", staticmethod(slow_first))
+    writer = WriteBehind(2)
+    returned = []
+    try:
+        for i in range(5):
+            path = str(tmp_path / f"{i}.pdf")
+            for result in writer.put({"output": path, "ok": True, "stats": {}}, path, b"%d" % i):
+                # 结果返回时输出已经完整写出
+                assert open(result["output"], "rb").read() == os.path.basename(result["output"])[0].encode()
+                returned.append(result["output"])
+        returned.extend(result["output"] for result in writer.drain())
+    finally:
+        writer.close()
+    assert returned == [str(tmp_path / f"{i}.pdf") for i in range(5)]
+
+
+def test_batch_pipeline_keeps_order_and_labels_with_paths(pdf_factory, tmp_path, caplog):
+    jobs = []
+    for i in range(4):
+        source = pdf_factory([[(50, 60, f"Alpha {i}")]], name=f"in{i}.pdf")
+        jobs.append((source, str(tmp_path / f"out{i}.pdf")))
+    engine = BatchEngine(replace_text_in_pdf, [{"old_text": "Alpha", "new_text": "Omega"}],
+                         fonts_dir=FONTS_DIR, workers=1, prefetch=2, write_behind=2,
+                         options={"trace": True})
+    with caplog.at_level("INFO", logger="main"):
+        results = list(engine.run(jobs))
+
+    assert [(r["input"], r["output"]) for r in results] == jobs
+    assert all(r["ok"] for r in results)
+    for i, (source, output) in enumerate(jobs):
+        assert sorted(page_texts(output)[0].split()) == [str(i), "Omega"]
+    # 预读后以字节串处理，日志和 trace 中仍显示原路径
+    files = {event["args"].get("file") for r in results for event in r["stats"]["trace_events"]}
+    assert files == {source for source, _output in jobs}
+    messages = [record.getMessage() for record in caplog.records]
+    assert not any("字节>" in message for message in messages)
+    assert all(f"替换完成: {source} -> {output}，" in message for message, (source, output) in zip(messages, jobs))
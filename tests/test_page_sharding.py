@@ -0,0 +1,61 @@
+import os
+
+import fitz
+
+from batch_engine import BatchEngine
+from conftest import FONTS_DIR, page_texts
+from main import replace_text_in_pdf
+from page_sharding import merge_stats, plan_shards
+
+
+def _with_navigation(path):
+    """给测试文档加上书签、跨分片的页内链接和元数据"""
+    doc = fitz.open(path)
+    doc.set_toc([[1, "Start", 1], [2, "Middle", 3], [1, "End", 6]])
+    doc.set_metadata({"title": "Sharded", "author": "Tests", "subject": "links"})
+    for page_num, target in ((0, 5), (4, 1), (5, 0)):
+        doc[page_num].insert_link({"kind": fitz.LINK_GOTO, "from": fitz.Rect(50, 700, 150, 720),
+                                   "page": target, "to": fitz.Point(0, 0)})
+    doc.saveIncr()
+    doc.close()
+
+
+def _links(doc):
+    return [[(link["kind"], link.get("page"), tuple(round(v) for v in link["from"]))
+             for link in page.get_links()] for page in doc]
+
+
+def test_plan_shards():
+    assert plan_shards(5, 10) == [range(5)]
+    assert plan_shards(5, 2) == [range(0, 2), range(2, 4), range(4, 5)]
+
+
+def test_merge_stats_adds_numbers_and_keeps_peaks():
+    total = merge_stats({}, {"pages": 2, "peak_rss_bytes": 10, "redact_pages": [[0, 0.1]], "ok": True})
+    merge_stats(total, {"pages": 3, "peak_rss_bytes": 5, "redact_pages": [[2, 0.2]]})
+    assert total == {"pages": 5, "peak_rss_bytes": 10, "redact_pages": [[0, 0.1], [2, 0.2]]}
+
+
+def test_sharded_run_keeps_toc_links_and_metadata(pdf_factory, tmp_path):
+    source = pdf_factory([[(50, 60, f"ACME page {i}")] for i in range(6)])
+    _with_navigation(source)
+    output = str(tmp_path / "out.pdf")
+
+    engine = BatchEngine(replace_text_in_pdf, [{"old_text": "ACME", "new_text": "Globex"}],
+                         fonts_dir=FONTS_DIR, workers=2, shard_pages=2)
+    results = list(engine.run([(source, output)]))
+
+    assert len(results) == 1
+    result = results[0]
+    assert result["ok"], result["error"]
+    assert result["shards"] == 3
+    # 合并在工作进程中完成
+    assert result["pid"] != os.getpid()
+    assert result["stats"]["replacements"] == 6
+    assert [sorted(text.split()) for text in page_texts(output)] == [sorted(["Globex", "page", str(i)])
+                                                                     for i in range(6)]
+    with fitz.open(source) as src, fitz.open(output) as out:
+        assert out.get_toc() == src.get_toc()
+        assert _links(out) == _links(src)
+        for key in ("title", "author", "subject"):
+            assert out.metadata[key] == src.metadata[key]
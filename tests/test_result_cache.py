@@ -0,0 +1,111 @@
+import os
+import shutil
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+RULES = [{"old_text": "ACME", "new_text": "Globex"}]
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    yield cache
+    cache.close()
+
+
+def test_miss_then_hit_restores_output(cache, tmp_path):
+    source = _write(tmp_path / "in.pdf", b"input")
+    output = _write(tmp_path / "out.pdf", b"processed output")
+    key = cache.make_key(source, cache.context_digest(RULES))
+    assert cache.restore(key, output) is None
+
+    cache.store(key, output, {"replacements": 3})
+    os.remove(output)
+    assert cache.restore(key, output) == {"replacements": 3}
+    with open(output, "rb") as f:
+        assert f.read() == b"processed output"
+    assert cache.report()["cache_hits"] == 1
+    assert cache.report()["cache_misses"] == 1
+
+
+def test_changed_input_misses(cache, tmp_path):
+    source = _write(tmp_path / "in.pdf", b"input")
+    output = _write(tmp_path / "out.pdf", b"output")
+    context = cache.context_digest(RULES)
+    key = cache.make_key(source, context)
+    cache.store(key, output)
+    _write(source, b"changed input")
+    assert cache.make_key(source, context) != key
+
+
+def test_context_changes_invalidate(cache, tmp_path, monkeypatch):
+    fonts = tmp_path / "fonts"
+    fonts.mkdir()
+    _write(fonts / "A.ttf", b"font")
+    base = cache.context_digest(RULES, str(fonts), {"engine": "redact"})
+    assert cache.context_digest(RULES, str(fonts), {"engine": "redact"}) == base
+
+    assert cache.context_digest([{"old_text": "ACME", "new_text": "Initech"}], str(fonts),
+                                {"engine": "redact"}) != base
+    assert cache.context_digest(RULES, str(fonts), {"engine": "stream"}) != base
+    _write(fonts / "B.ttf", b"another font")
+    with_font = cache.context_digest(RULES, str(fonts), {"engine": "redact"})
+    assert with_font != base
+    monkeypatch.setattr(result_cache, "ENGINE_VERSION", result_cache.ENGINE_VERSION + 1)
+    assert cache.context_digest(RULES, str(fonts), {"engine": "redact"}) != with_font
+
+
+def test_eviction_keeps_size_bounded_and_drops_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    try:
+        keys = []
+        for i in range(3):
+            source = _write(tmp_path / f"in{i}.pdf", b"input %d" % i)
+            output = _write(tmp_path / f"out{i}.pdf", bytes([i]) * 100)
+            keys.append(cache.make_key(source, cache.context_digest(RULES)))
+            cache.store(keys[-1], output)
+            if i == 1:
+                # 第一个结果最近被使用过，应保留
+                assert cache.restore(keys[0], str(tmp_path / "restored.pdf")) is not None
+        assert cache.total_bytes() <= 250
+        assert cache.restore(keys[1], str(tmp_path / "r1.pdf")) is None
+        assert cache.restore(keys[0], str(tmp_path / "r0.pdf")) is not None
+        assert cache.restore(keys[2], str(tmp_path / "r2.pdf")) is not None
+        assert sum(len(files) for _root, _dirs, files in os.walk(cache.objects_dir)) == 2
+    finally:
+        cache.close()
+
+
+def test_identical_outputs_are_stored_once(cache, tmp_path):
+    for i in range(2):
+        source = _write(tmp_path / f"in{i}.pdf", b"input %d" % i)
+        output = _write(tmp_path / f"out{i}.pdf", b"same output")
+        cache.store(cache.make_key(source, cache.context_digest(RULES)), output)
+    assert cache.total_bytes() == len(b"same output")
+
+
+def test_file_records_are_pruned(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = ResultCache(cache_dir, max_files=3)
+    paths = [_write(tmp_path / f"f{i}.pdf", b"data %d" % i) for i in range(5)]
+    for path in paths:
+        cache.file_digest(path)
+    os.remove(paths[4])
+    cache.close()
+
+    cache = ResultCache(cache_dir, max_files=3)
+    try:
+        rows = [row[0] for row in cache.db.execute("SELECT path FROM files ORDER BY rowid")]
+        assert rows == [os.path.abspath(p) for p in paths[1:4]]
+    finally:
+        cache.close()
+    shutil.rmtree(cache_dir)
@@ -0,0 +1,93 @@
+import pytest
+
+from rule_set import RuleSet
+from text_matcher import collapse_whitespace, normalize_text
+
+
+def _find(rules, text):
+    """返回 [(命中原文, 规则下标, 替换文本), ...]"""
+    original = collapse_whitespace(text)
+    return [(original[start:end], idx, rules.new_text_for(idx, original, start))
+            for start, end, idx in rules.find_all(normalize_text(original), original)]
+
+
+def test_plain_rules_are_case_sensitive_by_default():
+    rules = RuleSet([{"old_text": "Total", "new_text": "Sum"}])
+    assert _find(rules, "TOTAL Total total") == [("Total", 0, "Sum")]
+
+
+def test_ignore_case():
+    rules = RuleSet([{"old_text": "Total", "new_text": "Sum", "ignore_case": True}])
+    assert [hit[0] for hit in _find(rules, "TOTAL Total total")] == ["TOTAL", "Total", "total"]
+
+
+def test_whole_word():
+    rules = RuleSet([{"old_text": "Total", "new_text": "Sum", "whole_word": True}])
+    assert _find(rules, "Totals Subtotal Total_x (Total) Total.") == [
+        ("Total", 0, "Sum"), ("Total", 0, "Sum")]
+
+
+def test_whole_word_ignore_case():
+    rules = RuleSet([{"old_text": "total", "new_text": "Sum", "whole_word": True, "ignore_case": True}])
+    assert [hit[0] for hit in _find(rules, "TOTAL Totals total")] == ["TOTAL", "total"]
+
+
+def test_regex_expands_groups():
+    rules = RuleSet([{"old_text": r"INV-(\d+)", "new_text": r"No.\1", "regex": True},
+                     {"old_text": r"(?P<y>\d{4})-(?P<m>\d\d)", "new_text": r"\g<m>/\g<y>", "regex": True}])
+    assert _find(rules, "INV-42 dated 2024-05") == [("INV-42", 0, "No.42"), ("2024-05", 1, "05/2024")]
+
+
+def test_regex_with_backreference_is_matched_separately():
+    rules = RuleSet([{"old_text": r"(\w)\1", "new_text": "__", "regex": True},
+                     {"old_text": "cat", "new_text": "dog"}])
+    assert _find(rules, "a cat sees a goose") == [("cat", 1, "dog"), ("ee", 0, "__"), ("oo", 0, "__")]
+
+
+def test_overlaps_prefer_earlier_then_longer_then_first_rule():
+    rules = RuleSet([{"old_text": "ACME", "new_text": "X"},
+                     {"old_text": "ACME Corp", "new_text": "Globex"},
+                     {"old_text": r"Corp\w*", "new_text": "Inc", "regex": True}])
+    assert _find(rules, "ACME Corp and ACME Inc, Corporation") == [
+        ("ACME Corp", 1, "Globex"), ("ACME", 0, "X"), ("Corporation", 2, "Inc")]
+    assert (0, 1) in rules.overlaps
+    same_span = RuleSet([{"old_text": "acme", "new_text": "Y", "ignore_case": True},
+                         {"old_text": "ACME", "new_text": "X"}])
+    assert _find(same_span, "ACME") == [("ACME", 0, "Y")]
+
+
+def test_duplicates_and_conflicts():
+    rules = RuleSet([{"old_text": "ACME", "new_text": "Globex"},
+                     {"old_text": "ACME", "new_text": "Globex"},
+                     {"old_text": "ACME", "new_text": "Initech"},
+                     {"old_text": "acme", "new_text": "Initech", "ignore_case": True},
+                     {"old_text": "", "new_text": "ignored"}])
+    assert rules.duplicates == [(1, 0)]
+    assert rules.conflicts == [(2, 0)]
+    assert len(rules) == 2
+    assert _find(rules, "ACME acme") == [("ACME", 0, "Globex"), ("acme", 3, "Initech")]
+    assert rules.count(normalize_text("ACME acme"), "ACME acme") == {0: 1, 3: 1}
+
+
+def test_rule_matches_respects_options():
+    rules = RuleSet([{"old_text": "Total", "new_text": "Totals", "whole_word": True},
+                     {"old_text": "acme", "new_text": "ACME Inc", "ignore_case": True}])
+    assert not rules.rule_matches(0, "Totals")
+    assert rules.rule_matches(1, "ACME Inc")
+
+
+@pytest.mark.parametrize("replacement, message", [
+    ({"old_text": "(", "new_text": "x", "regex": True}, "正则表达式无效"),
+    ({"old_text": "(a)", "new_text": r"\2", "regex": True}, "正则表达式无效"),
+    ({"old_text": "a", "new_text": "b", "whole_word": "yes"}, "whole_word"),
+])
+def test_invalid_rules_are_rejected(replacement, message):
+    with pytest.raises(ValueError, match=message):
+        RuleSet([replacement])
+
+
+def test_stream_pattern_prefers_longer_literals():
+    rules = RuleSet([{"old_text": "ACME", "new_text": "X"}, {"old_text": "ACME Corp", "new_text": "Y"}])
+    m = rules.stream_pattern().search("ACME Corp")
+    assert (m.group(), m.lastgroup) == ("ACME Corp", "_r1")
+    assert rules.stream_pattern([0]).search("ACME Corp").group() == "ACME"
@@ -0,0 +1,56 @@
+import fitz
+import pytest
+
+from conftest import FONTS_DIR
+from main import replace_text_in_pdf
+from save_profiles import MIN_GARBAGE, SAVE_PROFILES, get_save_profile
+
+SECRET = "SECRET"
+
+
+def _make_source(path):
+    doc = fitz.open()
+    for i in range(3):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Top {SECRET} line {i}", fontsize=12)
+        page.insert_text((50, 90), "public", fontsize=12)
+    doc.save(path)
+    doc.close()
+
+
+def _leaking_objects(path):
+    """文件中对象定义或解压后的流里仍含原文（字面或十六进制形式）的 xref"""
+    needles = [SECRET.encode(), SECRET.encode().hex().encode(), SECRET.encode().hex().upper().encode()]
+    leaking = []
+    with fitz.open(path) as doc:
+        for xref in range(1, doc.xref_length()):
+            data = doc.xref_object(xref, compressed=False).encode("latin-1", "replace")
+            if doc.xref_is_stream(xref):
+                data += doc.xref_stream(xref) or b""
+            if any(needle in data for needle in needles):
+                leaking.append(xref)
+    with open(path, "rb") as f:
+        raw = f.read()
+    return leaking, SECRET.encode() in raw
+
+
+@pytest.mark.parametrize("profile", sorted(SAVE_PROFILES))
+@pytest.mark.parametrize("engine", ["redact", "stream"])
+@pytest.mark.parametrize("in_place", [False, True])
+def test_replaced_text_is_unrecoverable(tmp_path, profile, engine, in_place):
+    source = str(tmp_path / "input.pdf")
+    _make_source(source)
+    output = source if in_place else str(tmp_path / "output.pdf")
+    stats = replace_text_in_pdf(source, output, [{"old_text": SECRET, "new_text": "XXXXXX"}],
+                                fonts_dir=FONTS_DIR, engine=engine, save_profile=profile)
+    assert stats["replacements"] == 3
+    assert _leaking_objects(output) == ([], False)
+    with fitz.open(output) as doc:
+        assert all(SECRET not in page.get_text() for page in doc)
+
+
+def test_every_profile_collects_garbage():
+    for name in SAVE_PROFILES:
+        assert get_save_profile(name)["garbage"] >= MIN_GARBAGE
+    with pytest.raises(ValueError):
+        get_save_profile("incremental")
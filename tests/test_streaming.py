@@ -0,0 +1,84 @@
+import io
+
+import pytest
+
+from conftest import FONTS_DIR, page_texts
+from main import replace_text_in_pdf
+from streaming import current_rss, open_pdf
+
+RULES = [{"old_text": "Alpha", "new_text": "Omega"}, {"old_text": "beta", "new_text": "gamma"}]
+
+
+def _pages(count):
+    return [[(50, 60, f"Alpha page {i}"), (50, 90, "plain beta line"), (50, 120, "untouched")]
+            for i in range(count)]
+
+
+def _words(source):
+    """每页的 (文本, 四舍五入后的位置)，与文件内的对象编号和顺序无关"""
+    with open_pdf(source) as doc:
+        return [sorted((w[4], round(w[0], 1), round(w[1], 1)) for w in page.get_text("words"))
+                for page in doc]
+
+
+@pytest.mark.parametrize("engine", ["redact", "stream"])
+def test_windowed_output_matches_whole_document(pdf_factory, tmp_path, engine):
+    source = pdf_factory(_pages(5))
+    whole, windowed = str(tmp_path / "whole.pdf"), str(tmp_path / "windowed.pdf")
+    expected = replace_text_in_pdf(source, whole, RULES, fonts_dir=FONTS_DIR, engine=engine)
+    stats = replace_text_in_pdf(source, windowed, RULES, fonts_dir=FONTS_DIR, engine=engine,
+                                window_pages=2)
+    assert stats["windows"] == 3
+    assert stats["replacements"] == expected["replacements"] == 10
+    assert page_texts(windowed) == page_texts(whole)
+    assert _words(windowed) == _words(whole)
+
+
+def test_bytes_input_to_file_object_output(pdf_factory, tmp_path):
+    source = pdf_factory(_pages(3))
+    with open(source, "rb") as f:
+        data = f.read()
+    reference = str(tmp_path / "reference.pdf")
+    replace_text_in_pdf(source, reference, RULES, fonts_dir=FONTS_DIR)
+
+    out = io.BytesIO()
+    stats = replace_text_in_pdf(data, out, RULES, fonts_dir=FONTS_DIR, window_pages=1)
+    assert stats["windows"] == 3
+    assert _words(out.getvalue()) == _words(reference)
+
+
+def test_file_object_input_to_path_output(pdf_factory, tmp_path):
+    source = pdf_factory(_pages(3))
+    reference, output = str(tmp_path / "reference.pdf"), str(tmp_path / "output.pdf")
+    replace_text_in_pdf(source, reference, RULES, fonts_dir=FONTS_DIR)
+
+    with open(source, "rb") as f:
+        stats = replace_text_in_pdf(f, output, RULES, fonts_dir=FONTS_DIR, window_pages=2)
+    assert stats["windows"] == 2
+    assert _words(output) == _words(reference)
+    assert all("Alpha" not in text and "beta" not in text for text in page_texts(output))
+
+
+def test_font_windows_switch_to_compact_is_reported(pdf_factory, tmp_path, caplog):
+    source = pdf_factory(_pages(3))
+    with caplog.at_level("INFO"):
+        stats = replace_text_in_pdf(source, str(tmp_path / "output.pdf"), RULES, fonts_dir=FONTS_DIR,
+                                    window_pages=1, save_profile="fast")
+    assert stats["font_embeds"] > 1
+    assert stats["requested_save_profile"] == "fast"
+    assert stats["save_profile"] == "compact"
+    assert any("compact" in record.getMessage() for record in caplog.records)
+
+
+def test_memory_limit_is_a_soft_limit(pdf_factory, tmp_path):
+    if current_rss() is None:
+        pytest.skip("无法读取常驻内存")
+    source = pdf_factory(_pages(4))
+    output = str(tmp_path / "output.pdf")
+    stats = replace_text_in_pdf(source, output, RULES, fonts_dir=FONTS_DIR,
+                                window_pages=2, memory_limit_mb=0.001)
+    # 超过上限只会缩小之后的窗口，不会中断处理
+    assert stats["final_window_pages"] == 1
+    assert stats["memory_limit_exceeded"] == stats["windows"] == 3
+    assert stats["replacements"] == 8
+    assert all("Alpha" not in text for text in page_texts(output))
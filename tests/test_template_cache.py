@@ -0,0 +1,113 @@
+import fitz
+
+from conftest import FONTS_DIR, page_texts
+from main import PageLayoutIndex, replace_text_in_pdf, span_style
+from rule_set import RuleSet
+from template_cache import LayoutCache, locate_hits, page_fingerprint
+from text_matcher import TEXTPAGE_FLAGS, PageText
+
+
+def _template(body):
+    return [(50, 40, "ACME Invoice"), (50, 80, body), (50, 800, "Page footer")]
+
+
+def _lookup_second_page(path, replacements):
+    """用第一页建立缓存，返回第二页的缓存查找结果"""
+    matcher = RuleSet.from_replacements(replacements)
+    cache = LayoutCache()
+    with fitz.open(path) as doc:
+        for page_num, page in enumerate(doc):
+            textpage = page.get_textpage(flags=TEXTPAGE_FLAGS)
+            texts = matcher.page_texts(page, textpage)
+            counts = matcher.count(*texts)
+            key = cache.key(page, matcher)
+            if page_num == 0:
+                page_text = PageText.from_page(page, textpage)
+                found = matcher.search_page(page_text)
+                layout = PageLayoutIndex(page_text.raw)
+                styles = [span_style(layout.find_span(hit.rects[0], hit.text)) for hit in found]
+                cache.store(key, counts, found, styles)
+            else:
+                return cache.lookup(key, textpage, texts, counts, matcher)
+
+
+def test_near_identical_pages_reuse_layout_and_style(pdf_factory):
+    path = pdf_factory([_template("Total: 100.00"), _template("Total: 250.00")])
+    hits = _lookup_second_page(path, [{"old_text": "ACME", "new_text": "Globex"}])
+    assert hits is not None
+    assert [item["text"] for item in hits] == ["ACME"]
+    assert hits[0]["style"]["size"] == 11
+    assert hits[0]["new_text"] == "Globex"
+
+
+def test_moved_text_is_not_reused(pdf_factory):
+    second = [(50, 60, "ACME Invoice"), (50, 80, "Total"), (50, 800, "Page footer")]
+    path = pdf_factory([_template("Total"), second])
+    assert _lookup_second_page(path, [{"old_text": "ACME", "new_text": "Globex"}]) is None
+
+
+def test_whole_word_rejects_longer_word_at_cached_position(pdf_factory):
+    # 第二页同一位置是 "Totals Total"：计数相同，但缓存矩形处不是整词命中
+    path = pdf_factory([_template("Total Totals"), _template("Totals Total")])
+    rules = [{"old_text": "Total", "new_text": "Sum", "whole_word": True}]
+    assert _lookup_second_page(path, rules) is None
+
+
+def test_case_sensitive_rejects_other_case_at_cached_position(pdf_factory):
+    path = pdf_factory([_template("Total TOTAL"), _template("TOTAL Total")])
+    assert _lookup_second_page(path, [{"old_text": "Total", "new_text": "Sum"}]) is None
+
+
+def test_locate_hits_matches_the_full_search(pdf_factory):
+    path = pdf_factory([_template("total TOTAL Total Totals Total.")])
+    matcher = RuleSet([{"old_text": "Total", "new_text": "Sum", "whole_word": True},
+                       {"old_text": "acme", "new_text": "Globex", "ignore_case": True}])
+    with fitz.open(path) as doc:
+        page = doc[0]
+        textpage = page.get_textpage(flags=TEXTPAGE_FLAGS)
+        located = locate_hits(textpage, matcher.page_texts(page, textpage), matcher)
+        found = matcher.search_page(PageText.from_page(page, textpage))
+    assert [(idx, text) for idx, text, _new, _rect in located] == [(1, "ACME"), (0, "Total"), (0, "Total")]
+    assert [(hit.rule_index, hit.text) for hit in found] == [(idx, text) for idx, text, _new, _rect in located]
+    for (_idx, _text, _new, rect), hit in zip(located, found):
+        assert all(abs(a - b) < 0.01 for a, b in zip(rect, hit.rects[0]))
+
+
+def test_fingerprint_includes_static_content(tmp_path):
+    doc = fitz.open()
+    for color in ((0, 0, 0), (1, 0, 0), (0, 0, 0)):
+        page = doc.new_page()
+        page.insert_text((50, 40), "ACME Invoice", fontsize=11, color=color)
+    first, red, black = (page_fingerprint(page) for page in doc)
+    assert first == black
+    assert first != red
+    doc[2].insert_image(fitz.Rect(0, 0, 10, 10), pixmap=fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 2, 2), 0))
+    assert page_fingerprint(doc[2]) != first
+
+
+def test_cached_pages_replace_only_exact_matches(pdf_factory, tmp_path):
+    pages = [_template("Total TOTAL"), _template("TOTAL Total"),
+             _template("Total Totals"), _template("Totals Total")]
+    path = pdf_factory(pages)
+    out = str(tmp_path / "out.pdf")
+    rules = [{"old_text": "Total", "new_text": "Sum", "whole_word": True}]
+    stats = replace_text_in_pdf(path, out, rules, fonts_dir=FONTS_DIR)
+
+    assert stats["replacements"] == 4
+    for text, kept in zip(page_texts(out), ["TOTAL", "TOTAL", "Totals", "Totals"]):
+        words = text.split()
+        assert words.count("Sum") == 1
+        assert "Total" not in words
+        assert kept in words
+
+
+def test_cached_output_matches_uncached(pdf_factory, tmp_path):
+    path = pdf_factory([_template(f"Total: {i}00.00") for i in range(1, 6)])
+    rules = [{"old_text": "ACME", "new_text": "Globex"}, {"old_text": "footer", "new_text": "end"}]
+    cached_out, plain_out = str(tmp_path / "cached.pdf"), str(tmp_path / "plain.pdf")
+    stats = replace_text_in_pdf(path, cached_out, rules, fonts_dir=FONTS_DIR)
+    replace_text_in_pdf(path, plain_out, rules, fonts_dir=FONTS_DIR, layout_cache=LayoutCache(max_entries=0))
+    assert stats["layout_cache_hits"] == 4
+    with fitz.open(cached_out) as a, fitz.open(plain_out) as b:
+        for page_a, page_b in zip(a, b):
+            assert page_a.get_text("rawdict") == page_b.get_text("rawdict")
@@ -0,0 +1,65 @@
+import fitz
+import pytest
+
+from conftest import FONTS_DIR
+from main import replace_text_in_pdf
+from text_fit import MIN_CONDENSE, MIN_FONT_SCALE, check_fit_mode, fit_text
+
+OLD, NEW = "Sample value", "Sample value abc"
+
+
+def test_fit_text_leaves_fitting_text_alone():
+    assert fit_text(100, 100, 12, "shrink") == (12, 1.0, False)
+    assert fit_text(100.5, 100, 12, "condense") == (12, 1.0, False)
+    assert fit_text(200, 100, 12, "none") == (12, 1.0, False)
+
+
+@pytest.mark.parametrize("mode", ["shrink", "condense", "auto"])
+def test_fit_text_scales_to_available_width(mode):
+    fontsize, condense, overflow = fit_text(120, 100, 12, mode)
+    assert not overflow
+    # 宽度与字号成正比，水平压缩直接缩放宽度
+    assert 120 * fontsize / 12 * condense == pytest.approx(100)
+    if mode == "shrink":
+        assert condense == 1.0
+    else:
+        assert fontsize == 12
+
+
+def test_fit_text_stops_at_lower_limits():
+    assert fit_text(300, 100, 12, "shrink") == (pytest.approx(12 * MIN_FONT_SCALE), 1.0, True)
+    assert fit_text(300, 100, 12, "condense") == (12, MIN_CONDENSE, True)
+    fontsize, condense, overflow = fit_text(150, 100, 12, "auto")
+    assert condense == MIN_CONDENSE and not overflow
+    assert 150 * fontsize / 12 * condense == pytest.approx(100)
+    with pytest.raises(ValueError):
+        check_fit_mode("stretch")
+
+
+def _inserted_width(path, text):
+    """输出中新文本的实际宽度（按字符框计算，水平压缩后同样适用）"""
+    with fitz.open(path) as doc:
+        rects = doc[0].search_for(text)
+    assert len(rects) == 1
+    return rects[0].width
+
+
+@pytest.mark.parametrize("mode", ["shrink", "condense", "auto"])
+def test_inserted_text_fits_original_rect(pdf_factory, tmp_path, mode):
+    source = pdf_factory([[(50, 60, OLD)]])
+    with fitz.open(source) as doc:
+        original = doc[0].search_for(OLD)[0]
+    output = str(tmp_path / "output.pdf")
+    stats = replace_text_in_pdf(source, output, [{"old_text": OLD, "new_text": NEW}],
+                                fonts_dir=FONTS_DIR, fit_mode=mode)
+    assert stats["fitted_insertions"] == 1 and stats["fit_overflows"] == 0
+    assert _inserted_width(output, NEW) <= original.width + 0.5
+
+
+def test_unfitted_text_overflows_original_rect(pdf_factory, tmp_path):
+    source = pdf_factory([[(50, 60, OLD)]])
+    with fitz.open(source) as doc:
+        original = doc[0].search_for(OLD)[0]
+    output = str(tmp_path / "output.pdf")
+    replace_text_in_pdf(source, output, [{"old_text": OLD, "new_text": NEW}], fonts_dir=FONTS_DIR)
+    assert _inserted_width(output, NEW) > original.width + 0.5
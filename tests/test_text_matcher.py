@@ -0,0 +1,76 @@
+import fitz
+import pytest
+
+from rule_set import RuleSet
+from text_matcher import PageText, TextMatcher, collapse_whitespace, normalize_text
+
+
+LINES = [
+    (50, 60, "Invoice number 1024 for ACME Corp"),
+    (50, 80, "acme corp pays the TOTAL amount"),
+    (50, 100, "Total: 99.00   Subtotal: 90.00"),
+    (50, 120, "Contact ACME"),
+    (50, 140, "Corp support for the invoice"),
+]
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open()
+    page = doc.new_page()
+    for x, y, text in LINES:
+        page.insert_text((x, y), text, fontsize=11)
+    yield page
+    doc.close()
+
+
+def _search(page, patterns):
+    rules = RuleSet([{"old_text": p, "new_text": "", "ignore_case": True} for p in patterns])
+    return rules.search_page(PageText.from_page(page))
+
+
+def _same(a, b, tolerance=0.5):
+    return all(abs(p - q) <= tolerance for p, q in zip(a, b))
+
+
+@pytest.mark.parametrize("pattern", ["ACME Corp", "total", "Invoice", "1024", "ACME Corp support", "missing"])
+def test_rects_match_search_for(page, pattern):
+    hits = _search(page, [pattern])
+    rects = [rect for hit in hits for rect in hit.rects]
+    expected = page.search_for(pattern)
+    assert len(rects) == len(expected)
+    for rect, other in zip(rects, expected):
+        assert _same(rect, other)
+
+
+def test_all_patterns_found_in_one_scan(page):
+    patterns = ["ACME Corp", "total", "Invoice", "1024"]
+    hits = _search(page, patterns)
+    for idx, pattern in enumerate(patterns):
+        found = sum(len(hit.rects) for hit in hits if hit.rule_index == idx)
+        assert found == len(page.search_for(pattern))
+
+
+def test_hit_keeps_original_text(page):
+    hits = _search(page, ["acme corp"])
+    assert [collapse_whitespace(hit.text) for hit in hits] == ["ACME Corp", "acme corp", "ACME Corp"]
+
+
+def test_scan_reports_every_overlapping_hit():
+    matcher = TextMatcher(["ACME", "ACME Corp", "Corp pays", "acme"])
+    hits = sorted(matcher.scan(normalize_text("ACME Corp pays")))
+    assert hits == [(0, 4, 0), (0, 4, 3), (0, 9, 1), (5, 14, 2)]
+
+
+def test_case_sensitive_matcher():
+    matcher = TextMatcher(["Total"], case_sensitive=True)
+    text = collapse_whitespace("TOTAL  Total total")
+    assert matcher.scan(text) == [(6, 11, 0)]
+    assert TextMatcher(["Total"]).scan(normalize_text(text)) == [(0, 5, 0), (6, 11, 0), (12, 17, 0)]
+
+
+def test_contains_any_beyond_substring_prefilter():
+    patterns = [f"term{i:04d}" for i in range(TextMatcher.SUBSTRING_PREFILTER_LIMIT + 10)]
+    matcher = TextMatcher(patterns)
+    assert matcher.contains_any("prefix term0261 suffix")
+    assert not matcher.contains_any("prefix term suffix")
@@ -0,0 +1,45 @@
+import pytest
+
+import main
+from conftest import FONTS_DIR, page_texts
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """记录 save_document 的调用（输出路径）"""
+    calls = []
+    real_save = main.save_document
+
+    def recording(doc, output_path, *args, **kwargs):
+        calls.append(output_path)
+        return real_save(doc, output_path, *args, **kwargs)
+
+    monkeypatch.setattr(main, "save_document", recording)
+    return calls
+
+
+def test_residual_hits_are_reported_and_output_saved_once(pdf_factory, tmp_path, monkeypatch, saves):
+    source = pdf_factory([[(50, 60, "Secret one")], [(50, 60, "nothing")], [(50, 60, "Secret two")]])
+    # 模拟 redaction 没能删除原文
+    monkeypatch.setattr(main, "apply_page_redactions", lambda page, rects, mode: 0.0)
+    output = str(tmp_path / "output.pdf")
+    stats = main.replace_text_in_pdf(source, output, [{"old_text": "Secret", "new_text": "Hidden"}],
+                                     fonts_dir=FONTS_DIR, verify=True)
+
+    assert stats["verified_pages"] == 2
+    assert stats["residual_hits"] == 2
+    assert [(item["page"], item["old_text"]) for item in stats["residual"]] == [(0, "Secret"), (2, "Secret")]
+    assert all(len(item["rects"]) == 1 for item in stats["residual"])
+    assert saves == [output]
+
+
+def test_inserted_text_containing_old_text_is_not_residual(pdf_factory, tmp_path, saves):
+    source = pdf_factory([[(50, 60, "ACME Corp")]])
+    output = str(tmp_path / "output.pdf")
+    stats = main.replace_text_in_pdf(source, output, [{"old_text": "Corp", "new_text": "Corp Ltd"}],
+                                     fonts_dir=FONTS_DIR, verify=True)
+
+    assert stats["replacements"] == 1
+    assert (stats["verified_pages"], stats["residual_hits"], stats["residual"]) == (1, 0, [])
+    assert sorted(page_texts(output)[0].split()) == ["ACME", "Corp", "Ltd"]
+    assert saves == [output]
@@ -0,0 +1,39 @@
+from typing import Tuple
+
+
+# none     - 默认方式：按原字号书写，不测量宽度（新文本较长时会超出原文区域）
+# shrink   - 按比例缩小字号，直到放进原文矩形
+# condense - 字号不变，水平压缩字形
+# auto     - 先水平压缩，压缩到下限仍放不下时再缩小字号
+FIT_MODES = ("none", "shrink", "condense", "auto")
+
+# 缩小字号的下限（原字号的比例）和水平压缩的下限，再小就难以阅读，宁可超出
+MIN_FONT_SCALE = 0.6
+MIN_CONDENSE = 0.75
+
+# 宽度测量与原文矩形之间允许的误差，避免因字距差异对几乎等宽的文本做无意义的调整
+_FIT_TOLERANCE = 1.01
+
+
+def check_fit_mode(mode: str) -> str:
+    if mode not in FIT_MODES:
+        raise ValueError(f"未知的文本适配模式: {mode}，可选: {', '.join(FIT_MODES)}")
+    return mode
+
+
+def fit_text(text_width: float, available: float, fontsize: float, mode: str) -> Tuple[float, float, bool]:
+    """让宽度为 text_width 的文本放进 available 宽的区域
+
+    返回 (字号, 水平缩放比例, 是否仍然超出)；不需要调整时原样返回字号和 1.0。
+    text_width 为按 fontsize 测得的宽度。
+    """
+    if mode == "none" or available <= 0 or text_width <= available * _FIT_TOLERANCE:
+        return fontsize, 1.0, False
+    ratio = available / text_width
+    if mode == "shrink":
+        return fontsize * max(ratio, MIN_FONT_SCALE), 1.0, ratio < MIN_FONT_SCALE
+    condense = max(ratio, MIN_CONDENSE)
+    if mode == "condense":
+        return fontsize, condense, ratio < MIN_CONDENSE
+    shrink = max(ratio / condense, MIN_FONT_SCALE)
+    return fontsize * shrink, condense, ratio < MIN_CONDENSE * MIN_FONT_SCALE
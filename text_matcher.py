@@ -0,0 +1,201 @@
+import fitz
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# 文本提取参数：与 rawdict 默认值相同，但不保留图片块（匹配不需要图片数据）
+TEXTPAGE_FLAGS = fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def collapse_whitespace(text: str) -> str:
+    """连续空白视为一个空格（保留大小写，供区分大小写的规则使用）"""
+    return " ".join(text.split())
+
+
+def normalize_text(text: str) -> str:
+    """按 search_for 的规则规范化文本：忽略大小写，连续空白视为一个空格
+
+    结果与 collapse_whitespace(text) 逐字符一一对应。
+    """
+    collapsed = collapse_whitespace(text)
+    if collapsed.isascii():
+        return collapsed.lower()
+    # 非 ASCII 逐字符折叠，与 PageText 的字符流保持一一对应
+    return "".join(map(_fold, collapsed))
+
+
+def _fold(ch: str) -> str:
+    lowered = ch.lower()
+    # 个别字符小写后长度会变化（如 'İ'），保持一一对应
+    return lowered if len(lowered) == 1 else ch
+
+
+class PageText:
+    """页面字符流
+
+    每页只调用一次 get_text("rawdict")，得到规范化后的文本以及每个字符的
+    bbox 和所在行号。行与行之间补一个虚拟空格（与 search_for 跨行匹配一致）。
+    raw 保留原始提取结果，可直接用于建立 PageLayoutIndex。
+    original 为保留大小写的同一字符流（空白统一为空格），与 text 逐字符对应。
+    """
+
+    def __init__(self, raw_dict: Dict):
+        self.raw = raw_dict
+        chars: List[str] = []
+        self.boxes: List[Optional[fitz.Rect]] = []
+        self.lines: List[int] = []
+        self.originals: List[str] = []
+
+        line_no = -1
+        for block in raw_dict.get("blocks", []):
+            if "lines" not in block:
+                continue
+            for line in block["lines"]:
+                line_no += 1
+                if chars and chars[-1] != " ":
+                    chars.append(" ")
+                    self.boxes.append(None)
+                    self.lines.append(line_no)
+                    self.originals.append(" ")
+                for span in line["spans"]:
+                    for ch in span.get("chars", []):
+                        c = ch.get("c", "")
+                        if not c:
+                            continue
+                        if c.isspace():
+                            if chars and chars[-1] == " ":
+                                continue
+                            c_norm = " "
+                        else:
+                            c_norm = _fold(c)
+                        chars.append(c_norm)
+                        self.boxes.append(fitz.Rect(ch["bbox"]))
+                        self.lines.append(line_no)
+                        self.originals.append(c)
+
+        self.text = "".join(chars)
+        self.original = "".join(" " if c.isspace() else c for c in self.originals)
+
+    @classmethod
+    def from_page(cls, page, textpage=None) -> "PageText":
+        if textpage is None:
+            return cls(page.get_text("rawdict", flags=TEXTPAGE_FLAGS))
+        return cls(page.get_text("rawdict", textpage=textpage))
+
+    def rects_for(self, start: int, end: int) -> List[fitz.Rect]:
+        """将字符区间转换为按行合并的矩形，与 search_for 返回值对应"""
+        rects: List[fitz.Rect] = []
+        current_line = None
+        for i in range(start, end):
+            box = self.boxes[i]
+            if box is None or box.is_empty:
+                continue
+            if self.lines[i] != current_line:
+                current_line = self.lines[i]
+                rects.append(fitz.Rect(box))
+            else:
+                rects[-1] |= box
+        return rects
+
+    def original_text(self, start: int, end: int) -> str:
+        return "".join(self.originals[start:end])
+
+
+class TextHit:
+    """一次命中：规则下标、字符区间、原文、命中矩形以及替换后的文本（由 RuleSet 填写）"""
+
+    __slots__ = ("rule_index", "start", "end", "text", "rects", "new_text")
+
+    def __init__(self, rule_index: int, start: int, end: int, text: str,
+                 rects: List[fitz.Rect], new_text: Optional[str] = None):
+        self.rule_index = rule_index
+        self.start = start
+        self.end = end
+        self.text = text
+        self.rects = rects
+        self.new_text = new_text
+
+    def __repr__(self):
+        return f"TextHit(rule={self.rule_index}, text={self.text!r}, rects={self.rects})"
+
+
+class TextMatcher:
+    """多模式匹配器
+
+    把一组普通文本模式编译成一个 Aho-Corasick 自动机，文本只扫描一次即可得到
+    全部模式的原始命中（允许重叠）；重叠的取舍和命中矩形由 RuleSet 完成。
+
+    case_sensitive 为真时模式只合并空白、保留大小写，
+    扫描的文本需用 collapse_whitespace 处理（如 PageText.original）。
+    """
+
+    # 规则数不超过该值时，预筛选直接用 str 的子串查找（C 实现，比逐字符走自动机快）
+    SUBSTRING_PREFILTER_LIMIT = 256
+
+    def __init__(self, patterns: Iterable[str], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        normalize = collapse_whitespace if case_sensitive else normalize_text
+        self.patterns: List[str] = [normalize(p) for p in patterns]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for idx, pattern in enumerate(self.patterns):
+            if pattern:
+                self._add(pattern, idx)
+        self._build()
+        self._distinct = sorted({p for p in self.patterns if p}, key=len)
+
+    def _add(self, pattern: str, idx: int):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(idx)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text: str) -> List[Tuple[int, int, int]]:
+        """返回所有原始命中 (start, end, rule_index)，允许重叠"""
+        found = []
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                found.append((pos + 1 - len(self.patterns[idx]), pos + 1, idx))
+        return found
+
+    def contains_any(self, text: str) -> bool:
+        """快速判断文本中是否可能存在任一规则的命中（text 需已规范化）"""
+        if len(self._distinct) <= self.SUBSTRING_PREFILTER_LIMIT:
+            return any(p in text for p in self._distinct)
+
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                return True
+        return False